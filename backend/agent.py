@@ -1,46 +1,80 @@
 import os
+from typing import Any, Callable, Optional
 from dotenv import load_dotenv
-from ai_sdk import tool, generate_text, openai
+from ai_sdk import tool, openai
+from backend.agent_loop import AgentBudget, run_agent_loop
+from backend.log import get_logger
+from backend.model_router import Router
+from backend.prefetch import prefetch, format_prefetched
+from backend.chat_memory import format_chat_context
 from backend.tools.firecrawl_client import scrape_url
+from backend.tools.output_budget import get_more_results_tool, more_results_tools
 #from tools.email_fetcher import mail_fetch
-from backend.tools.calendar import (
-    list_calendars_tool,
-    get_calendar_events_tool,
-    search_calendar_events_tool,
-    create_calendar_event_tool,
-    update_calendar_event_tool,
-    delete_calendar_event_tool
-)
-from backend.tools.email.tools import (
-    get_unread_emails_tool,
-    get_emails_from_sender_tool,
-    search_emails_tool,
-    send_email_tool,
-    mail_fetch
-)
+from backend.tools.calendar import calendar_tools
+from backend.tools.context import ToolContext
+from backend.tools.deadlines import extract as extract_deadlines
+from backend.tools.knowledge import index_page, knowledge_tools
+from backend.tools.email.tools import email_tools, mail_fetch
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CREDENTIALS_PATH = PROJECT_ROOT 
 TOKEN_PATH = os.path.join(PROJECT_ROOT, "token.json")
 
+# Page content kept alongside extracted deadlines unless full_content is asked for
+SCRAPE_EXCERPT_CHARS = int(os.getenv("SCRAPE_EXCERPT_CHARS", "1500"))
+
+
+def scrape_webpage_execute(
+    url: str,
+    only_main_content: bool = True,
+    full_content: bool = False,
+    index_for: Optional[str] = None
+):
+    """
+    Scrape a webpage and return the deadlines found on it with its content.
+    When deadlines were found the content is cut to an excerpt, unless
+    full_content is set. The page is added to the knowledge index of the
+    user `index_for`, if given.
+    """
+    logger.info("🔧 Scraping: %s", url)
+    content = scrape_url(url, only_main_content)
+    if content.startswith("Error"):
+        return content
 
-def scrape_webpage_execute(url: str, only_main_content: bool = True) -> str:
-    """Scrape a webpage and return its content"""
-    print(f"🔧 Scraping: {url}")
-    return scrape_url(url, only_main_content)
+    deadlines = extract_deadlines(content)
+    if index_for:
+        index_page(index_for, url, content, deadlines)
+    if deadlines and not full_content and len(content) > SCRAPE_EXCERPT_CHARS:
+        return {
+            "url": url,
+            "deadlines": deadlines,
+            "excerpt": content[:SCRAPE_EXCERPT_CHARS] + "…",
+            "note": f"Excerpt of {len(content)} chars; call again with full_content=true for the whole page."
+        }
+    return {"url": url, "deadlines": deadlines, "content": content}
 
 def email_fetch_execute(start_date: str, max_results: int = 10) -> list[dict]:
     """Fetch emails from the user's inbox"""
-    print(f"🔧 Fetching emails from {start_date} (max: {max_results})")
+    logger.info("🔧 Fetching emails from %s (max: %s)", start_date, max_results)
     return mail_fetch(start_date, max_results)
 
+def scrape_for_user_execute(ctx: ToolContext, **kwargs):
+    """scrape_webpage for a run bound to a user: scraped pages go into their knowledge index."""
+    return scrape_webpage_execute(**kwargs, index_for=ctx.user_id)
+
 # Define the scraping tool with JSON schema
-scrape_webpage_tool = tool(
+SCRAPE_WEBPAGE = dict(
     name="scrape_webpage",
-    description="Scrape content from a specific webpage and return it in markdown format. Use this when you need to get the content of a URL.",
+    description=(
+        "Scrape content from a specific webpage. Returns the dates and deadlines found on the page "
+        "and its markdown content (an excerpt when deadlines were found). Use this when you need "
+        "to get the content of a URL."
+    ),
     parameters={
         "type": "object",
         "properties": {
@@ -52,13 +86,36 @@ scrape_webpage_tool = tool(
                 "type": "boolean",
                 "description": "Whether to extract only the main content of the page",
                 "default": True
+            },
+            "full_content": {
+                "type": "boolean",
+                "description": "Return the whole page even when deadlines were extracted",
+                "default": False
             }
         },
         "required": ["url"]
-    },
-    execute=scrape_webpage_execute
+    }
 )
 
+scrape_webpage_tool = tool(**SCRAPE_WEBPAGE, execute=scrape_webpage_execute)
+
+
+def build_tools(tool_context: Optional[ToolContext] = None) -> list:
+    """
+    The agent's tools for one run. Calendar, email and knowledge tools need
+    a ToolContext (the user they act for); without one only scraping and
+    result paging are offered.
+    """
+    if tool_context is None:
+        return [scrape_webpage_tool, get_more_results_tool]
+    return [
+        tool(**SCRAPE_WEBPAGE, execute=tool_context.bind(scrape_for_user_execute)),
+        *calendar_tools(tool_context),
+        *email_tools(tool_context),
+        *knowledge_tools(tool_context),
+        *more_results_tools(tool_context)
+    ]
+
 
 def create_agent():
     """Initialize and return the AI agent with OpenRouter configuration"""
@@ -70,13 +127,27 @@ def create_agent():
     return model
 
 
-def chat_with_agent(user_message: str, context_injection: str = None) -> dict:
+def chat_with_agent(
+    user_message: str,
+    context_injection: str = None,
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    budget: Optional[AgentBudget] = None,
+    tool_context: Optional[ToolContext] = None,
+    route: str = "schedule"
+) -> dict:
     """
     Chat with the agent and let it use available tools.
     
     Args:
         user_message: The user's message/query
         system_prompt: Optional system prompt to guide the agent's behavior
+        on_event: Optional callback receiving (event, data) for tool calls
+                  and, after each model step, that step's assistant text
+                  (whole, not token by token; see run_agent_loop)
+        budget: Step/time budget for the run (defaults to AgentBudget())
+        tool_context: User the calendar/email tools act for (see build_tools)
+        route: Model route (backend.model_router): "summarize" for
+               questions, "schedule" or "reshuffle" for calendar work
     
     Returns:
         dict with 'text' (response) and 'tool_calls' (list of tools used)
@@ -92,14 +163,16 @@ def chat_with_agent(user_message: str, context_injection: str = None) -> dict:
 Schedule tasks realistically considering user's actual behavior (procrastination, energy levels, interruptions).
 
 If you receive a task then is how you should parse them:
-- if it is a WEB task then you should use the scrape_webpage tool to get the content of the url and then use the content to see if you need to schedule the task
-- if it is a EMAIL task then you should use the get_unread_emails_tool to get the emails from the user's inbox and then use the emails to see if you need to schedule the task
+- if it is a WEB task then you should use the scrape_webpage tool to get the content of the url and then use the deadlines it extracted (and the content) to see if you need to schedule the task
+- if it is a EMAIL task then use the unread emails and their extracted deadlines provided in the context (or the get_unread_emails tool if they are missing) to see if you need to schedule the task
 - if it is a TODO task then check if it is already in the calendar for the interval. Only add a new event if it is not already scheduled. DONT ADD DUPLICATES FOR SAME TASK AT SAME TIME.
 - Make sure events do not overlap unless absolutely necessary.
 
+For questions about emails or pages seen before, try search_knowledge before search_emails or scrape_webpage.
+
 
 ## WORKFLOW
-1. Call `get_all_calendar_events` FIRST to see current schedule
+1. Read the current schedule from the context below. Only call `get_all_calendar_events` if it is missing or you need events beyond that window
 2. Analyze conflicts, capacity, and workload
 3. Create/update/delete events using tools
 4. Output brief summary
@@ -125,40 +198,41 @@ NO lengthy explanations. Just actions + warnings.
     if context_injection:
         system_prompt += f"\n\n Here are some added context for you to help you make decisions: {context_injection}"
 
-    print(f"💬 User: {user_message}")
-    print(f"🤖 Agent thinking...")
-    result = generate_text(
-        model=openai(os.getenv("DEFAULT_MODEL")),
-        prompt=user_message,
+    tools = build_tools(tool_context)
+
+    logger.info("💬 User: %s", user_message)
+    logger.debug("🤖 Agent thinking...")
+    router = Router(route)
+    result = run_agent_loop(
+        router=router,
         system=system_prompt,
-        tools=[
-            scrape_webpage_tool, 
-            list_calendars_tool,
-            get_calendar_events_tool,
-            search_calendar_events_tool,
-            create_calendar_event_tool,
-            update_calendar_event_tool,
-            delete_calendar_event_tool,
-            get_unread_emails_tool,
-            get_emails_from_sender_tool,
-            search_emails_tool,
-        ],
-        max_steps=10
+        prompt=user_message,
+        tools=tools,
+        budget=budget,
+        on_event=on_event
     )
     
     # Ensure we always have response text
     response_text = result.text if result.text and result.text.strip() else "✅ Calendar updated successfully."
-    print(f"✅ Agent response: {response_text}")
-    print(f"Full reasoning: {result.raw_response}")
+    logger.info("✅ Agent response: %s (%d steps, stop: %s, model: %s)",
+                response_text, len(result.steps), result.stop_reason, router.model_name)
+    logger.debug("Full reasoning: %s", result.raw_response)
     
     return {
         "text": response_text,
-        "tool_calls": getattr(result, "tool_calls", []),
-        "steps": getattr(result, "steps", [])
+        "tool_calls": result.tool_calls,
+        "steps": result.steps
     }
 
 
-def run_tasks_with_agent(user_id: str, tasks: list, user_context: dict, chat_history: list) -> dict:
+def run_tasks_with_agent(
+    user_id: str,
+    tasks: list,
+    user_context: dict,
+    chat_history: dict,
+    on_event: Optional[Callable[[str, Any], None]] = None,
+    prefetched: Optional[dict] = None
+) -> dict:
     """
     Run scheduled tasks through the agent with full context.
     
@@ -166,7 +240,10 @@ def run_tasks_with_agent(user_id: str, tasks: list, user_context: dict, chat_his
         user_id: User identifier
         tasks: List of tasks to schedule/execute
         user_context: User preferences, patterns, calendar_url
-        chat_history: Recent chat messages
+        chat_history: Chat summary + recent turns (chat_memory.get_chat_context)
+        on_event: Optional progress callback, see chat_with_agent
+        prefetched: Calendar/email data loaded up front (backend.prefetch);
+                    fetched here if not supplied
     
     Returns:
         Agent response with actions taken
@@ -190,16 +267,28 @@ Review calendar, find optimal time slots, and create the events."""
 User Context:
 - Preferences: {user_context.get('preferences', [])}
 
-Recent Chat History:
-{chr(10).join([f"- {msg.get('context', {}).get('message', '')}" for msg in chat_history[-5:]])}
+{format_chat_context(chat_history)}
 """
+
+    if prefetched is None:
+        prefetched = prefetch(user_context, tasks, user_id)
+    context_str += f"\n{format_prefetched(prefetched)}\n"
     
-    return chat_with_agent(user_message, context_injection=context_str)
+    return chat_with_agent(
+        user_message,
+        context_injection=context_str,
+        on_event=on_event,
+        budget=AgentBudget.for_tasks(len(tasks)),
+        tool_context=ToolContext(user_id, token_data=user_context.get("google_token")),
+        route="schedule"
+    )
 
 
 # Example usage
 if __name__ == "__main__":
-    # Test the agent with calendar
+    # Test the agent with calendar: python -m backend.agent <user_id>
+    import sys
+
     print("🚀 Testing Calendar Agent")
     print("="*60)
     
@@ -213,7 +302,8 @@ if __name__ == "__main__":
         5. Warn about burnout risk if overcommitted
 
         Provide a realistic weekly outlook.
-        """
+        """,
+        tool_context=ToolContext(sys.argv[1]) if len(sys.argv) > 1 else None
     )
     print("\n" + "="*60)
     print("Final Response:")
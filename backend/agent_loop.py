@@ -0,0 +1,334 @@
+"""
+Agent Execution Loop
+====================
+Replacement for ai_sdk's generate_text tool loop, used by chat_with_agent.
+
+- Tool calls emitted by the model in one step run concurrently on a bounded
+  thread pool. Read-only tools fan out freely; calendar writes keep their
+  relative order on a single lane so e.g. a delete + create pair can't race.
+- Every tool call has its own timeout; a timed out call becomes an error
+  result for the model instead of stalling the whole step. Writes that
+  time out are reported as "outcome unknown" instead, since they may still
+  complete after the model stops waiting.
+- Results are fed back to the model in the original call order.
+- The run is bounded by an AgentBudget (steps and wall time) sized to the
+  workload, instead of a fixed max_steps.
+- Each step goes through a model_router.Router: a step whose reply is
+  unusable (empty, unknown tool, malformed arguments) is retried on the
+  route's next, stronger model before any of its tool calls run.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from ai_sdk import Tool
+
+from backend import rate_limit
+from backend.circuit_breaker import CircuitOpenError, tool_unavailable
+from backend.model_router import MODEL_CALL_RETRIES, Router
+
+TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_TOOL_WORKERS", "8")),
+    thread_name_prefix="agent-tool"
+)
+
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "30"))
+
+# Per-tool timeouts in seconds, anything missing uses DEFAULT_TOOL_TIMEOUT
+TOOL_TIMEOUTS = {
+    "scrape_webpage": 60,
+    "get_all_calendar_events": 30,
+    "get_unread_emails": 30,
+    "get_emails_from_sender": 30,
+    "search_emails": 30,
+}
+
+# Tools with side effects; these run one after another in emitted order
+SERIAL_TOOLS = {
+    "create_calendar_event",
+    "update_calendar_event",
+    "delete_calendar_event",
+    "send_email",
+}
+
+
+@dataclass
+class AgentBudget:
+    """Upper bounds for a single agent run."""
+    max_steps: int = 8
+    max_seconds: float = 120
+
+    @classmethod
+    def for_tasks(cls, n_tasks: int) -> "AgentBudget":
+        """Scale the budget with the number of tasks being scheduled in one run."""
+        steps_cap = int(os.getenv("AGENT_MAX_STEPS", "20"))
+        seconds_cap = float(os.getenv("AGENT_MAX_SECONDS", "300"))
+        return cls(
+            max_steps=min(4 + 2 * max(n_tasks, 1), steps_cap),
+            max_seconds=min(60 + 30 * max(n_tasks, 1), seconds_cap)
+        )
+
+
+@dataclass
+class AgentRunResult:
+    text: str
+    tool_calls: list[dict] = field(default_factory=list)
+    tool_results: list[dict] = field(default_factory=list)
+    steps: list[dict] = field(default_factory=list)
+    stop_reason: str = "done"
+    raw_response: Any = None
+
+
+def _execute_call(handlers: dict, call: dict) -> dict:
+    """Run one tool call and wrap its outcome as a tool result."""
+    handler = handlers.get(call["tool_name"])
+    if handler is None:
+        return {"result": {"error": "Unknown tool"}, "is_error": True, "duration_ms": 0}
+
+    # Don't wait on a timeout for an upstream we already know is down
+    unavailable = tool_unavailable(call["tool_name"])
+    if unavailable:
+        return {"result": unavailable, "is_error": True, "duration_ms": 0}
+
+    start = time.monotonic()
+    try:
+        result, is_error = handler(**call["args"]), False
+    except CircuitOpenError as e:
+        result, is_error = e.to_result(), True
+    except Exception as e:
+        result, is_error = str(e), True
+    return {
+        "result": result,
+        "is_error": is_error,
+        "duration_ms": round((time.monotonic() - start) * 1000)
+    }
+
+
+def _execute_serial(handlers: dict, calls: list[dict], outcomes: Optional[list] = None) -> list[dict]:
+    """Run calls in order, appending to `outcomes` as each one finishes (so a timed out lane shows its progress)."""
+    outcomes = [] if outcomes is None else outcomes
+    for call in calls:
+        outcomes.append(_execute_call(handlers, call))
+    return outcomes
+
+
+def _outcome_unknown(name: str, timeout: float) -> dict:
+    """Result for a write still running when the model stopped waiting: it may yet be applied."""
+    return {
+        "result": {
+            "outcome": "unknown",
+            "message": f"{name} was still running after {round(timeout)}s and may still be applied. "
+                       "Re-read the calendar before retrying it, so it isn't done twice."
+        },
+        "is_error": False,
+        "duration_ms": round(timeout * 1000)
+    }
+
+
+def run_tool_calls(
+    tools: list[Tool],
+    calls: list[dict],
+    deadline: Optional[float] = None,
+    on_event: Optional[Callable[[str, Any], None]] = None
+) -> list[dict]:
+    """
+    Execute the tool calls from one model step concurrently.
+
+    Args:
+        tools: Tools available to the model
+        calls: Tool calls as returned by the provider
+               ({tool_call_id, tool_name, args})
+        deadline: Optional time.monotonic() value no call may wait past
+        on_event: Optional progress callback
+
+    Returns:
+        One result dict per call, in the same order as ``calls``
+    """
+    handlers = {t.name: t.handler for t in tools}
+    started = time.monotonic()
+
+    for call in calls:
+        if on_event:
+            on_event("tool_call_start", {"tool": call["tool_name"], "args": call["args"]})
+
+    def timeout_for(names: list[str]) -> float:
+        timeout = sum(TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT) for name in names)
+        if deadline is not None:
+            timeout = min(timeout, deadline - started)
+        return max(timeout, 0)
+
+    # Independent calls get their own future; writes share one ordered lane
+    pending = []
+    serial_idx = [i for i, call in enumerate(calls) if call["tool_name"] in SERIAL_TOOLS]
+    lane: list[dict] = []
+    if serial_idx:
+        names = [calls[i]["tool_name"] for i in serial_idx]
+        future = rate_limit.submit(TOOL_EXECUTOR, _execute_serial, handlers, [calls[i] for i in serial_idx], lane)
+        pending.append((serial_idx, future, timeout_for(names)))
+    for i, call in enumerate(calls):
+        if i not in serial_idx:
+            future = rate_limit.submit(TOOL_EXECUTOR, _execute_call, handlers, call)
+            pending.append(([i], future, timeout_for([call["tool_name"]])))
+
+    results: list[Optional[dict]] = [None] * len(calls)
+    for indices, future, timeout in pending:
+        remaining = max(started + timeout - time.monotonic(), 0)
+        try:
+            outcome = future.result(timeout=remaining)
+            outcomes = outcome if isinstance(outcome, list) else [outcome]
+        except FutureTimeoutError:
+            # The worker thread keeps running; the model just stops waiting for it
+            if indices is serial_idx:
+                # Writes that finished are reported as such; the rest may still land
+                done = list(lane)
+                outcomes = done + [_outcome_unknown(calls[i]["tool_name"], timeout) for i in indices[len(done):]]
+            else:
+                outcomes = [
+                    {
+                        "result": {"error": f"Tool timed out after {round(timeout)}s"},
+                        "is_error": True,
+                        "duration_ms": round(timeout * 1000)
+                    } for _ in indices
+                ]
+        for i, result in zip(indices, outcomes):
+            results[i] = result
+
+    finished = []
+    for call, result in zip(calls, results):
+        entry = {
+            "tool_call_id": call["tool_call_id"],
+            "tool_name": call["tool_name"],
+            **result
+        }
+        finished.append(entry)
+        if on_event:
+            on_event("tool_call_finish", {
+                "tool": call["tool_name"],
+                "duration_ms": entry["duration_ms"],
+                "is_error": entry["is_error"]
+            })
+
+    return finished
+
+
+def _step_problem(raw: dict, tools: dict[str, Tool], tools_allowed: bool) -> Optional[str]:
+    """Why a model reply can't be used as a step, or None if it can."""
+    calls = [c for c in (raw.get("tool_calls") or []) if c.get("tool_name")]
+    if not calls and not (raw.get("text") or "").strip():
+        return "empty reply"
+    if not tools_allowed:
+        return None
+    for call in calls:
+        spec = tools.get(call["tool_name"])
+        if spec is None:
+            return f"unknown tool {call['tool_name']}"
+        args = call.get("args")
+        properties = spec.parameters.get("properties", {})
+        # The provider falls back to {"raw": "<arguments>"} when they aren't valid JSON
+        if not isinstance(args, dict) or ("raw" in args and "raw" not in properties):
+            return f"malformed arguments for {call['tool_name']}"
+        missing = [key for key in spec.parameters.get("required", []) if key not in args]
+        if missing:
+            return f"missing arguments for {call['tool_name']}: {', '.join(missing)}"
+    return None
+
+
+def run_agent_loop(
+    router: Router,
+    system: str,
+    prompt: str,
+    tools: list[Tool],
+    budget: Optional[AgentBudget] = None,
+    on_event: Optional[Callable[[str, Any], None]] = None
+) -> AgentRunResult:
+    """
+    Run the model <-> tool loop until the model answers or the budget runs out.
+
+    When the step or time budget is exhausted the model gets one last call
+    with tools disabled, so the run still ends with a summary of what was done.
+    Steps are sent to `router`'s current model (see _step_problem for what
+    makes it escalate).
+    """
+    budget = budget or AgentBudget()
+    deadline = time.monotonic() + budget.max_seconds
+    tools_schema = [t.to_openai_dict() for t in tools]
+    tools_by_name = {t.name: t for t in tools}
+
+    conversation: list[dict] = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt},
+    ]
+    run = AgentRunResult(text="")
+
+    step = 0
+    while True:
+        out_of_budget = step >= budget.max_steps or time.monotonic() >= deadline
+        if out_of_budget:
+            run.stop_reason = "max_steps" if step >= budget.max_steps else "timeout"
+            conversation.append({
+                "role": "user",
+                "content": "Budget exhausted. Do not call any more tools; summarize what you did."
+            })
+
+        raw = router.call(
+            lambda model: rate_limit.call(
+                "openrouter",
+                model.generate_text,
+                messages=conversation,
+                tools=tools_schema,
+                tool_choice="none" if out_of_budget else "auto",
+                retries=MODEL_CALL_RETRIES
+            ),
+            validate=lambda raw: _step_problem(raw, tools_by_name, not out_of_budget)
+        )
+        run.raw_response = raw.get("raw_response")
+        text = raw.get("text") or ""
+        calls = [c for c in (raw.get("tool_calls") or []) if c.get("tool_name")]
+
+        run.steps.append({
+            "step": step,
+            "text": text,
+            "tool_calls": [c["tool_name"] for c in calls],
+            "usage": raw.get("usage"),
+            "model": router.model_name
+        })
+        # Sent once the step is accepted, as a whole: a reply the router
+        # rejects is retried on another model and must never reach the client
+        if on_event and text.strip():
+            on_event("text", {"step": step, "text": text})
+
+        if not calls or out_of_budget:
+            run.text = text
+            return run
+
+        conversation.append({
+            "role": "assistant",
+            "content": text or None,
+            "tool_calls": [
+                {
+                    "id": call["tool_call_id"],
+                    "type": "function",
+                    "function": {
+                        "name": call["tool_name"],
+                        "arguments": json.dumps(call["args"], default=str)
+                    }
+                } for call in calls
+            ]
+        })
+
+        results = run_tool_calls(tools, calls, deadline=deadline, on_event=on_event)
+        run.tool_calls.extend(calls)
+        run.tool_results.extend(results)
+
+        for result in results:
+            conversation.append({
+                "role": "tool",
+                "tool_call_id": result["tool_call_id"],
+                "content": json.dumps(result["result"], default=str)
+            })
+
+        step += 1
@@ -0,0 +1,17 @@
+"""
+Pipeline Benchmarks
+===================
+End-to-end benchmarks for the cron pipeline against in-process fakes of
+Supabase, Google Calendar, Gmail, Firecrawl and an OpenAI-compatible LLM
+(backend/benchmarks/fakes.py), so they need no credentials or network.
+
+    python -m backend.benchmarks.run --scenario cron --users 20 --tasks 5
+    python -m backend.benchmarks.run --scenario cron --users 20 --tasks 5 --compare HEAD~1
+
+See run.py for the scenarios and options. Results are appended to
+backend/benchmarks/results/<scenario>.jsonl keyed by git commit.
+
+replay.py records a real agent run (LLM and tool I/O) into a cassette and
+replays it offline to check steps, tool calls, bytes sent and wall time.
+importtime.py measures how long importing the backend takes.
+"""
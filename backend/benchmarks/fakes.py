@@ -0,0 +1,743 @@
+"""
+Benchmark Fakes
+===============
+In-process stand-ins for every upstream the cron pipeline talks to. Each
+sleeps a configurable latency per request, returns payloads of a configurable
+size and reports its request times to a StageTimer:
+
+- FakeSupabase / FakeAsyncSupabase: in-memory tables behind the subset of the
+  supabase-py query builder that supabase_db and supabase_async use, plus the
+  get_due_tasks and acquire_user_lease RPCs
+- FakeGoogle: googleapiclient-shaped Calendar and Gmail services
+  (resource().method(...).execute() and batch requests), one account per
+  access token
+- FakeFirecrawl: FirecrawlApp.scrape
+- FakeLLM: an OpenAI-compatible /chat/completions endpoint served through an
+  httpx MockTransport, so the openai SDK and ai_sdk run unchanged
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import httplib2
+import httpx
+import openai as openai_sdk
+from ai_sdk import openai
+from googleapiclient.errors import HttpError
+from postgrest.exceptions import APIError
+
+from backend.benchmarks.stats import StageTimer
+from backend.scheduler import parse_interval, parse_timestamp
+
+RNG = random.Random(0)
+
+_WORDS = (
+    "deadline review submit draft meeting lecture coursework sprint report "
+    "interview standup reading revision lab project feedback exam schedule"
+).split()
+
+
+def seed(value: int):
+    """Make latency jitter and generated payloads repeatable."""
+    RNG.seed(value)
+
+
+def filler(n_bytes: int) -> str:
+    """About n_bytes of plain text."""
+    if n_bytes <= 0:
+        return ""
+    words = []
+    size = 0
+    while size < n_bytes:
+        word = _WORDS[RNG.randrange(len(_WORDS))]
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:n_bytes]
+
+
+@dataclass
+class Latency:
+    """Per-request delay of `seconds`, varied uniformly by ±`jitter` (a fraction)."""
+    seconds: float = 0.0
+    jitter: float = 0.2
+
+    def sample(self) -> float:
+        if self.seconds <= 0:
+            return 0.0
+        return max(0.0, self.seconds * (1 + RNG.uniform(-self.jitter, self.jitter)))
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# -- Supabase ---------------------------------------------------------------
+
+# Tables keyed by something other than a generated integer id (for upserts)
+PRIMARY_KEYS = {"users": "id", "chat_summaries": "user_id", "user_leases": "user_id"}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+def _copy(rows):
+    # Round-trip through JSON like a real response, so callers can't share rows with the store
+    return json.loads(json.dumps(rows, default=str))
+
+
+def _stamp(row: dict) -> dict:
+    return {key: _now_iso() if value == "now()" else value for key, value in row.items()}
+
+
+def _project(row: dict, columns: str) -> dict:
+    """Apply a PostgREST select list: "*", "a, b" and "alias:col->>key"."""
+    if columns.strip() == "*":
+        return dict(row)
+    out = {}
+    for part in columns.split(","):
+        alias, _, expr = part.strip().rpartition(":")
+        if "->>" in expr:
+            column, key = expr.split("->>", 1)
+            out[alias or key] = (row.get(column) or {}).get(key)
+        else:
+            out[alias or expr] = row.get(expr)
+    return out
+
+
+class FakeTables:
+    """Storage shared by the sync and async fake clients."""
+
+    def __init__(self):
+        self.rows: dict[str, list[dict]] = defaultdict(list)
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def count(self, table: str) -> int:
+        with self.lock:
+            return len(self.rows[table])
+
+
+class FakeQuery:
+    """One sb.table(name)... chain; executes against FakeTables."""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._payload = None
+        self._columns = "*"
+        self._filters = []
+        self._order = None
+        self._offset = 0
+        self._limit = None
+        self._single = False
+
+    def select(self, columns: str = "*"):
+        self._columns = columns
+        return self
+
+    def insert(self, data):
+        self._op, self._payload = "insert", data
+        return self
+
+    def upsert(self, data):
+        self._op, self._payload = "upsert", data
+        return self
+
+    def update(self, data: dict):
+        self._op, self._payload = "update", data
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def _matches(self, row: dict) -> bool:
+        return all(check(row) for check in self._filters)
+
+    def _run(self):
+        tables = self._client.tables
+        with tables.lock:
+            rows = tables.rows[self._table]
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            key = PRIMARY_KEYS.get(self._table)
+
+            if self._op == "insert":
+                result = []
+                for row in _copy(payload):
+                    row = _stamp(row)
+                    if key is None:
+                        row.setdefault("id", tables.next_id())
+                    rows.append(row)
+                    result.append(row)
+            elif self._op == "upsert":
+                key = key or "id"
+                result = []
+                for row in _copy(payload):
+                    row = _stamp(row)
+                    existing = next((r for r in rows if r.get(key) == row.get(key)), None)
+                    if existing is None:
+                        rows.append(row)
+                    else:
+                        existing.update(row)
+                    result.append(existing or row)
+            elif self._op == "update":
+                changes = _stamp(_copy(self._payload))
+                result = [row for row in rows if self._matches(row)]
+                for row in result:
+                    row.update(changes)
+            elif self._op == "delete":
+                result = [row for row in rows if self._matches(row)]
+                tables.rows[self._table] = [row for row in rows if not self._matches(row)]
+            else:
+                result = [row for row in rows if self._matches(row)]
+                if self._order:
+                    column, desc = self._order
+                    result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                end = None if self._limit is None else self._offset + self._limit
+                result = [_project(row, self._columns) for row in result[self._offset:end]]
+            data = _copy(result)
+
+        if self._single:
+            if len(data) != 1:
+                raise APIError({
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                    "code": "PGRST116"
+                })
+            return data[0]
+        return data
+
+    def execute(self):
+        with self._client.timer.time(self._client.stage):
+            self._client.latency.sleep()
+            return FakeResponse(self._run())
+
+
+class FakeRpc(FakeQuery):
+    def __init__(self, client: "FakeSupabase", name: str, params: dict):
+        super().__init__(client, name)
+        self._name = name
+        self._params = params
+
+    def _run(self):
+        handler = getattr(self._client, f"_rpc_{self._name}", None)
+        if handler is None:
+            raise APIError({"message": f"Unknown function {self._name}", "code": "PGRST202"})
+        return handler(self._params)
+
+
+class _AsyncExecute:
+    async def execute(self):
+        with self._client.timer.time(self._client.stage):
+            await self._client.latency.asleep()
+            return FakeResponse(self._run())
+
+
+class FakeAsyncQuery(_AsyncExecute, FakeQuery):
+    pass
+
+
+class FakeAsyncRpc(_AsyncExecute, FakeRpc):
+    pass
+
+
+class FakeSupabase:
+    """Stands in for supabase_db.sb."""
+    query_class = FakeQuery
+    rpc_class = FakeRpc
+
+    def __init__(
+        self,
+        tables: Optional[FakeTables] = None,
+        latency: Optional[Latency] = None,
+        timer: Optional[StageTimer] = None,
+        stage: str = "supabase"
+    ):
+        self.tables = tables or FakeTables()
+        self.latency = latency or Latency()
+        self.timer = timer or StageTimer()
+        self.stage = stage
+
+    def table(self, name: str) -> FakeQuery:
+        return self.query_class(self, name)
+
+    def rpc(self, name: str, params: dict) -> FakeRpc:
+        return self.rpc_class(self, name, params)
+
+    def _rpc_get_due_tasks(self, params: dict) -> list[dict]:
+        """migrations/002_due_tasks.sql: due tasks ordered by (next_run_ts, id), keyset paged."""
+        now = parse_timestamp(params["p_now"])
+        after = None
+        if params.get("p_after_ts") is not None:
+            after = (parse_timestamp(params["p_after_ts"]), params["p_after_id"])
+        due = []
+        with self.tables.lock:
+            for task in self.tables.rows["tasks"]:
+                next_run = parse_timestamp(task["last_run_ts"]) + parse_interval(task["period"])
+                if next_run <= now and (after is None or (next_run, task["id"]) > after):
+                    due.append((next_run, task))
+            due.sort(key=lambda item: (item[0], item[1]["id"]))
+            page = [
+                {**_project(task, "id, user_id, type, title, context, state, period, last_run_ts"),
+                 "next_run_ts": next_run.isoformat()}
+                for next_run, task in due[:params["p_limit"]]
+            ]
+        return _copy(page)
+
+    def _rpc_acquire_user_lease(self, params: dict) -> bool:
+        return True
+
+    def _rpc_update_chat_summary(self, params: dict) -> bool:
+        """migrations/005_chat_summary_watermark.sql: write unless message_count moved on."""
+        with self.tables.lock:
+            rows = self.tables.rows["chat_summaries"]
+            existing = next((r for r in rows if r["user_id"] == params["p_user_id"]), None)
+            if existing is not None and existing["message_count"] != params["p_previous_count"]:
+                return False
+            row = {
+                "user_id": params["p_user_id"],
+                "summary": params["p_summary"],
+                "message_count": params["p_message_count"],
+                "summarized_until": params["p_summarized_until"],
+            }
+            if existing is None:
+                rows.append(row)
+            else:
+                existing.update(row)
+        return True
+
+
+class FakeAsyncSupabase(FakeSupabase):
+    """Stands in for the AsyncClient behind supabase_async.get_client()."""
+    query_class = FakeAsyncQuery
+    rpc_class = FakeAsyncRpc
+
+    def __init__(self, tables=None, latency=None, timer=None, stage: str = "supabase_async"):
+        super().__init__(tables, latency, timer, stage)
+
+
+# -- Google Calendar / Gmail ------------------------------------------------
+
+class FakeGoogleRequest:
+    """A googleapiclient HttpRequest: nothing happens until execute()."""
+
+    def __init__(self, api: "FakeGoogle", stage: str, fn):
+        self._api = api
+        self._stage = stage
+        self.fn = fn
+
+    def execute(self, **kwargs):
+        with self._api.timer.time(self._stage):
+            self._api.latency.sleep()
+            return self.fn()
+
+
+class FakeBatch:
+    """BatchHttpRequest: one round trip, then the callback per sub-request."""
+
+    def __init__(self, api: "FakeGoogle", stage: str, callback):
+        self._api = api
+        self._stage = stage
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: FakeGoogleRequest, request_id: Optional[str] = None, callback=None):
+        self._requests.append((request_id or str(len(self._requests)), request, callback or self._callback))
+
+    def execute(self, **kwargs):
+        outcomes = []
+        with self._api.timer.time(self._stage):
+            self._api.latency.sleep()
+            for request_id, request, callback in self._requests:
+                try:
+                    outcomes.append((callback, request_id, request.fn(), None))
+                except Exception as e:
+                    outcomes.append((callback, request_id, None, e))
+        for callback, request_id, response, error in outcomes:
+            callback(request_id, response, error)
+
+
+class _Resource:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class _Account:
+    """One user's calendars, events and inbox, generated on first use."""
+
+    def __init__(self, api: "FakeGoogle"):
+        self.lock = threading.Lock()
+        start = datetime.now(timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0)
+        self.calendars = [{"id": "primary", "summary": "Primary", "primary": True}] + [
+            {"id": f"calendar-{i}@group.calendar.google.com", "summary": f"Calendar {i}"}
+            for i in range(1, api.calendars)
+        ]
+        step = timedelta(days=7) / max(api.events_per_calendar, 1)
+        self.events = {
+            calendar["id"]: [
+                {
+                    "id": f"evt-{c}-{i}",
+                    "summary": f"{_WORDS[(c + i) % len(_WORDS)].title()} session",
+                    "description": filler(api.payload_bytes),
+                    "start": {"dateTime": (start + i * step).isoformat()},
+                    "end": {"dateTime": (start + i * step + timedelta(hours=1)).isoformat()},
+                    "htmlLink": f"https://calendar.google.com/event?eid=evt-{c}-{i}",
+                }
+                for i in range(api.events_per_calendar)
+            ]
+            for c, calendar in enumerate(self.calendars)
+        }
+        self.messages = {
+            f"msg-{i}": {
+                "id": f"msg-{i}",
+                "threadId": f"thread-{i}",
+                "snippet": filler(120),
+                "labelIds": ["INBOX", "UNREAD"],
+                "internalDate": str(int((start - timedelta(hours=i)).timestamp() * 1000)),
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": [
+                        {"name": "From", "value": f"sender{i}@example.com"},
+                        {"name": "To", "value": "me@example.com"},
+                        {"name": "Subject", "value": f"{_WORDS[i % len(_WORDS)].title()} due soon"},
+                        {"name": "Date", "value": (start - timedelta(hours=i)).strftime("%a, %d %b %Y %H:%M:%S +0000")},
+                    ],
+                    "body": {"data": base64.urlsafe_b64encode(filler(api.email_bytes).encode()).decode()},
+                },
+            }
+            for i in range(api.emails)
+        }
+
+
+class FakeGoogle:
+    """
+    Replacement for googleapiclient.discovery.build. Accounts are keyed by
+    the credentials' access token, so each seeded user gets their own data.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        timer: Optional[StageTimer] = None,
+        calendars: int = 3,
+        events_per_calendar: int = 20,
+        payload_bytes: int = 200,
+        emails: int = 20,
+        email_bytes: int = 2000
+    ):
+        self.latency = latency or Latency()
+        self.timer = timer or StageTimer()
+        self.calendars = calendars
+        self.events_per_calendar = events_per_calendar
+        self.payload_bytes = payload_bytes
+        self.emails = emails
+        self.email_bytes = email_bytes
+        self._accounts: dict[str, _Account] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        with self._lock:
+            self._accounts.clear()
+
+    def _account(self, credentials) -> _Account:
+        token = getattr(credentials, "token", None) or "anonymous"
+        with self._lock:
+            if token not in self._accounts:
+                self._accounts[token] = _Account(self)
+            return self._accounts[token]
+
+    def build(self, service_name: str, version: str, credentials=None, **kwargs):
+        account = self._account(credentials)
+        if service_name == "calendar":
+            return self._calendar(account)
+        if service_name == "gmail":
+            return self._gmail(account)
+        raise ValueError(f"No fake for Google API {service_name!r}")
+
+    def _calendar(self, account: _Account):
+        request = lambda fn: FakeGoogleRequest(self, "calendar", fn)
+
+        def list_events(calendarId="primary", maxResults=250, q=None, **kwargs):
+            def run():
+                with account.lock:
+                    items = list(account.events.get(calendarId, []))
+                if q:
+                    items = [e for e in items if q.lower() in e["summary"].lower()]
+                return {"items": _copy(items[:maxResults])}
+            return request(run)
+
+        def find(calendarId, eventId) -> dict:
+            for event in account.events.get(calendarId, []):
+                if event["id"] == eventId:
+                    return event
+            raise HttpError(httplib2.Response({"status": 404}), b'{"error": {"message": "Not Found"}}')
+
+        def insert(calendarId="primary", body=None, **kwargs):
+            def run():
+                event = {
+                    **_copy(body or {}),
+                    "id": f"created-{next(self._ids)}",
+                    "htmlLink": "https://calendar.google.com/event",
+                }
+                with account.lock:
+                    account.events.setdefault(calendarId, []).append(event)
+                return _copy(event)
+            return request(run)
+
+        def get(calendarId="primary", eventId=None, **kwargs):
+            def run():
+                with account.lock:
+                    return _copy(find(calendarId, eventId))
+            return request(run)
+
+        def update(calendarId="primary", eventId=None, body=None, **kwargs):
+            def run():
+                with account.lock:
+                    event = find(calendarId, eventId)
+                    event.update(_copy(body or {}))
+                    return _copy(event)
+            return request(run)
+
+        def delete(calendarId="primary", eventId=None, **kwargs):
+            def run():
+                with account.lock:
+                    account.events[calendarId].remove(find(calendarId, eventId))
+                return ""
+            return request(run)
+
+        events = _Resource(list=list_events, insert=insert, get=get, update=update, delete=delete)
+        calendar_list = _Resource(list=lambda **kwargs: request(
+            lambda: {"items": _copy(account.calendars)}
+        ))
+        return _Resource(
+            calendarList=lambda: calendar_list,
+            events=lambda: events,
+            new_batch_http_request=lambda callback=None: FakeBatch(self, "calendar", callback)
+        )
+
+    def _gmail(self, account: _Account):
+        request = lambda fn: FakeGoogleRequest(self, "gmail", fn)
+
+        def list_messages(userId="me", q="", maxResults=100, pageToken=None, **kwargs):
+            after = re.search(r"after:(\d+)\b(?!/)", q or "")
+            matching = [
+                i for i, message in account.messages.items()
+                if not after or int(message["internalDate"]) // 1000 > int(after.group(1))
+            ]
+            offset = int(pageToken or 0)
+            ids = matching[offset:offset + maxResults]
+            page = {
+                "messages": [{"id": i, "threadId": account.messages[i]["threadId"]} for i in ids],
+                "resultSizeEstimate": len(matching)
+            }
+            if offset + maxResults < len(matching):
+                page["nextPageToken"] = str(offset + maxResults)
+            return request(lambda: page)
+
+        def get_message(userId="me", id=None, format="full", **kwargs):
+            return request(lambda: _copy(account.messages[id]))
+
+        def send_message(userId="me", body=None, **kwargs):
+            return request(lambda: {"id": f"sent-{next(self._ids)}", "labelIds": ["SENT"]})
+
+        messages = _Resource(list=list_messages, get=get_message, send=send_message)
+        users = _Resource(messages=lambda: messages)
+        return _Resource(users=lambda: users)
+
+
+# -- Firecrawl --------------------------------------------------------------
+
+class FakeFirecrawl:
+    """FirecrawlApp replacement: `fake.app()` stands in for the registered firecrawl client."""
+
+    def __init__(self, latency: Optional[Latency] = None, timer: Optional[StageTimer] = None, page_bytes: int = 20000):
+        self.latency = latency or Latency()
+        self.timer = timer or StageTimer()
+        self.page_bytes = page_bytes
+
+    def app(self, api_key: Optional[str] = None, **kwargs) -> "FakeFirecrawl":
+        return self
+
+    def scrape(self, url: str, **kwargs) -> dict:
+        with self.timer.time("firecrawl"):
+            self.latency.sleep()
+            return {"markdown": f"# {url}\n\n{filler(self.page_bytes)}", "metadata": {"sourceURL": url}}
+
+
+# -- LLM --------------------------------------------------------------------
+
+class FakeLLM:
+    """
+    OpenAI-compatible chat completions served in-process. The scripted model
+    works through the tasks in the prompt the way the real agent is told to:
+    scrape every WEB task's URL, create one calendar event per task, then
+    answer with a short summary of `completion_bytes`.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None, timer: Optional[StageTimer] = None, completion_bytes: int = 400):
+        self.latency = latency or Latency()
+        self.timer = timer or StageTimer()
+        self.completion_bytes = completion_bytes
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._client = openai_sdk.OpenAI(
+            api_key="benchmark",
+            base_url="http://llm.benchmark.local/v1",
+            http_client=httpx.Client(transport=httpx.MockTransport(self._handle)),
+            max_retries=0
+        )
+
+    def model(self, model_name: Optional[str] = None, **kwargs):
+        """Drop-in for ai_sdk.openai(): a real OpenAIModel talking to this fake."""
+        model = openai(model_name or "benchmark-model", api_key="benchmark", **kwargs)
+        model._client = self._client
+        return model
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received
+            }
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        body = request.content
+        payload = json.loads(body)
+        with self.timer.time("llm"):
+            self.latency.sleep()
+            message = self._reply(payload)
+        completion_tokens = len(json.dumps(message)) // 4
+        content = json.dumps({
+            "id": f"chatcmpl-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(body) // 4,
+                "completion_tokens": completion_tokens,
+                "total_tokens": len(body) // 4 + completion_tokens
+            }
+        }).encode()
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += len(body)
+            self.bytes_received += len(content)
+        return httpx.Response(200, content=content, headers={"content-type": "application/json"})
+
+    def _plan(self, prompt: str) -> list[list[tuple[str, dict]]]:
+        steps = []
+        urls = re.findall(r"'url': '(https?://[^']+)'", prompt)
+        if urls:
+            steps.append([("scrape_webpage", {"url": url}) for url in urls])
+        n_tasks = prompt.count("(Priority:")
+        if n_tasks:
+            day = datetime.now(timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            steps.append([
+                ("create_calendar_event", {
+                    "summary": f"Task {i + 1}",
+                    "start_datetime": (day + timedelta(hours=i)).isoformat(),
+                    "end_datetime": (day + timedelta(hours=i, minutes=45)).isoformat(),
+                    "description": "Scheduled by the benchmark agent"
+                })
+                for i in range(n_tasks)
+            ])
+        return steps
+
+    def _reply(self, payload: dict) -> dict:
+        messages = payload["messages"]
+        prompt = next((m.get("content") or "" for m in messages if m["role"] == "user"), "")
+        available = {t["function"]["name"] for t in payload.get("tools") or []}
+        plan = [
+            [(name, args) for name, args in step if name in available]
+            for step in self._plan(prompt)
+        ]
+        plan = [step for step in plan if step]
+        step = sum(1 for m in messages if m["role"] == "assistant")
+
+        if payload.get("tool_choice") != "none" and step < len(plan):
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{step}_{i}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(args)}
+                    } for i, (name, args) in enumerate(plan[step])
+                ]
+            }
+
+        created = sum(len(s) for s in plan if s[0][0] == "create_calendar_event")
+        return {
+            "role": "assistant",
+            "content": f"✅ Actions: Created {created}\n📊 Status: {created}/{created} scheduled\n"
+                       + filler(self.completion_bytes)
+        }
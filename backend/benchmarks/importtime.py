@@ -0,0 +1,167 @@
+"""
+Import-time Benchmark
+=====================
+    python -m backend.benchmarks.importtime [--module backend.fastAPI] [--runs 5]
+
+Imports the module in fresh interpreters under `python -X importtime` and
+reports the median wall time, the module's cumulative import time, the
+heaviest third-party packages (self time summed per top-level package) and
+the backend's own modules. What a cold start or a worker restart pays
+before the first request. The first run is a discarded warm-up so .pyc
+compilation isn't counted.
+
+Runs are stored in results/importtime.jsonl like the pipeline benchmarks;
+--compare REF diffs against the last run at REF and, with
+--fail-on-regression, exits 1 if wall or import time grew more than
+--threshold %.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from backend.benchmarks.run import DUMMY_ENV
+from backend.benchmarks.stats import find_baseline, save_result
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure how long importing the backend takes.")
+    parser.add_argument("--module", default="backend.fastAPI")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="packages to list")
+    parser.add_argument("--no-save", action="store_true", help="don't append this run to results/")
+    parser.add_argument("--compare", metavar="REF", help="compare with the last stored run at this git ref")
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% slower that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def measure(module: str) -> dict:
+    """
+    Import `module` once in a fresh interpreter.
+
+    Returns:
+        {"wall_ms", "total_ms", "modules": {name: (self_ms, cumulative_ms)}}
+    """
+    env = {**DUMMY_ENV, **os.environ, "LOG_LEVEL": "WARNING"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PROJECT_ROOT), env.get("PYTHONPATH")]))
+
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if out.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {out.stderr.strip().splitlines()[-1]}")
+
+    modules = {}
+    for line in out.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return {"wall_ms": wall_ms, "total_ms": modules.get(module, (0, 0))[1], "modules": modules}
+
+
+def run(args: argparse.Namespace) -> dict:
+    measure(args.module)  # warm-up: byte-compiles anything stale
+    runs = [measure(args.module) for _ in range(args.runs)]
+
+    packages = defaultdict(list)
+    backend = defaultdict(list)
+    for result in runs:
+        per_root = defaultdict(float)
+        for name, (self_ms, cumulative_ms) in result["modules"].items():
+            root = name.split(".")[0]
+            if root == "backend":
+                backend[name].append(cumulative_ms)
+            else:
+                per_root[root] += self_ms
+        for root, ms in per_root.items():
+            packages[root].append(ms)
+
+    median = lambda values: round(statistics.median(values), 1)
+    return {
+        "scenario": "importtime",
+        "config": {"module": args.module, "python": sys.version.split()[0]},
+        "import": {
+            "runs": len(runs),
+            "wall_ms": median([result["wall_ms"] for result in runs]),
+            "total_ms": median([result["total_ms"] for result in runs]),
+        },
+        "packages": dict(sorted(
+            ((root, median(values)) for root, values in packages.items()),
+            key=lambda item: -item[1]
+        )),
+        "backend": dict(sorted(
+            ((name, median(values)) for name, values in backend.items()),
+            key=lambda item: -item[1]
+        )),
+    }
+
+
+def report(record: dict, top: int) -> str:
+    stats = record["import"]
+    lines = [
+        f"import {record['config']['module']}: {stats['total_ms']:.1f} ms import, "
+        f"{stats['wall_ms']:.1f} ms interpreter wall (median of {stats['runs']})",
+        f"{'package (self time)':<40}{'ms':>10}",
+    ]
+    lines += [f"{root:<40}{ms:>10.1f}" for root, ms in list(record["packages"].items())[:top]]
+    lines.append(f"{'backend module (cumulative)':<40}{'ms':>10}")
+    lines += [f"{name:<40}{ms:>10.1f}" for name, ms in list(record["backend"].items())[:top]]
+    return "\n".join(lines)
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> tuple[list[str], bool]:
+    def change(new: float, old: float) -> float:
+        return 100 * (new - old) / old if old else 0.0
+
+    lines = [f"Compared with {baseline['commit'][:10]} ({baseline['recorded_at']}):"]
+    regressed = False
+    for key in ("total_ms", "wall_ms"):
+        old, new = baseline["import"][key], current["import"][key]
+        delta = change(new, old)
+        worse = delta > threshold
+        regressed |= worse
+        lines.append(f"  {key:<10} {old:>10.1f} → {new:>10.1f} ms  ({delta:+.1f}%){' ⚠️' if worse else ''}")
+    for root, ms in current["packages"].items():
+        if root not in baseline["packages"] and ms >= 1:
+            lines.append(f"  {root:<10} new import, {ms:.1f} ms")
+    return lines, regressed
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    record = run(args)
+    print(report(record, args.top))
+
+    regressed = False
+    if args.compare:
+        baseline = find_baseline("importtime", args.compare, record["config"])
+        if baseline is None:
+            print(f"No stored importtime run at {args.compare} for {args.module}.")
+        else:
+            lines, regressed = compare(record, baseline, args.threshold)
+            print("\n".join(lines))
+
+    if not args.no_save:
+        print(f"Saved to {save_result('importtime', record)}")
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
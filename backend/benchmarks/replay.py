@@ -0,0 +1,421 @@
+"""
+Agent Record / Replay
+=====================
+Captures an agent run (every LLM request/response and every tool call's
+input and output) into a cassette file, then replays it offline: recorded
+responses are fed back through generate_text and the tool layer, so the same
+run can be repeated without OpenRouter, Google or Firecrawl and checked for
+step count, tool calls, bytes sent to the model and wall time.
+
+Record (talks to the live services):
+
+    python -m backend.benchmarks.replay record cassettes/week.json --message "Prepare the week ahead"
+    python -m backend.benchmarks.replay record cassettes/tasks.json --user-id <id>
+
+Replay and compare with what was recorded:
+
+    python -m backend.benchmarks.replay check cassettes/*.json --tolerance 10
+
+From Python:
+
+    result = replay("cassettes/week.json", speed=0)
+    assert not result.check(max_steps=4, max_bytes_sent=60_000)
+
+Replay sleeps for each call's recorded duration (scaled by `speed`, 0 for no
+sleeping), so wall time reflects how the loop schedules calls. The user's
+Google token is never written to a cassette.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack, redirect_stdout
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+from unittest import mock
+
+from backend import log
+
+CASSETTE_VERSION = 1
+ENTRYPOINTS = ("chat_with_agent", "run_tasks_with_agent")
+
+
+class CassetteMismatch(ValueError):
+    """Raised when a replayed run makes an LLM call the cassette has no response for."""
+
+
+def _json(value):
+    return json.loads(json.dumps(value, default=str))
+
+
+def _request_bytes(messages, tools) -> int:
+    """Size of the chat completions request body for these messages and tools."""
+    return len(json.dumps({"messages": messages, "tools": tools}, default=str).encode())
+
+
+def _call_key(tool_name: str, args: dict) -> str:
+    return tool_name + json.dumps(args, sort_keys=True, default=str)
+
+
+@dataclass
+class RunStats:
+    steps: int
+    tool_calls: int
+    llm_calls: int
+    bytes_sent: int
+    wall_ms: float
+
+
+def _stats(response: dict, llm_calls: int, bytes_sent: int, wall: float) -> RunStats:
+    return RunStats(
+        steps=len(response.get("steps", [])),
+        tool_calls=len(response.get("tool_calls", [])),
+        llm_calls=llm_calls,
+        bytes_sent=bytes_sent,
+        wall_ms=round(wall * 1000, 1)
+    )
+
+
+def _patched(stack: ExitStack, model_factory, execute_call):
+    import backend.agent_loop as agent_loop
+    import backend.model_router as model_router
+
+    stack.enter_context(mock.patch.object(model_router, "openai", model_factory))
+    stack.enter_context(mock.patch.object(agent_loop, "_execute_call", execute_call))
+
+
+def _entrypoint(name: str):
+    import backend.agent as agent
+
+    if name not in ENTRYPOINTS:
+        raise ValueError(f"Unknown entrypoint {name!r}, expected one of {ENTRYPOINTS}")
+    run = getattr(agent, name)
+    if name != "chat_with_agent":
+        return run
+
+    def chat(user_id: Optional[str] = None, **inputs):
+        # The stored user_id stands in for the (unserializable) ToolContext
+        from backend.tools.context import ToolContext
+
+        return run(**inputs, tool_context=ToolContext(user_id) if user_id else None)
+    return chat
+
+
+# -- record -----------------------------------------------------------------
+
+class _RecordingModel:
+    """Wraps an ai_sdk model and logs every generate_text call."""
+
+    def __init__(self, model, log: list, lock: threading.Lock):
+        self._model = model
+        self._log = log
+        self._lock = lock
+
+    def generate_text(self, messages=None, tools=None, tool_choice=None, **kwargs):
+        start = time.perf_counter()
+        raw = self._model.generate_text(messages=messages, tools=tools, tool_choice=tool_choice, **kwargs)
+        entry = {
+            "request": {
+                "messages": _json(messages),
+                "tools": [t["function"]["name"] for t in tools or []],
+                "tool_choice": tool_choice,
+                "bytes": _request_bytes(messages, tools)
+            },
+            "response": {key: _json(raw.get(key)) for key in ("text", "finish_reason", "usage", "tool_calls")},
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        with self._lock:
+            self._log.append(entry)
+        return raw
+
+
+def _redact(inputs: dict) -> dict:
+    inputs = dict(inputs)
+    if isinstance(inputs.get("user_context"), dict):
+        inputs["user_context"] = {**inputs["user_context"], "google_token": {}}
+    return _json(inputs)
+
+
+def record(path: Union[str, Path], entrypoint: str, **inputs) -> dict:
+    """
+    Run `entrypoint` (chat_with_agent or run_tasks_with_agent) for real with
+    `inputs`, and write everything it sent and received to a cassette.
+
+    run_tasks_with_agent's calendar/email prefetch is done first and stored as
+    an input, so replays don't need Google either.
+    """
+    import backend.agent_loop as agent_loop
+    import backend.model_router as model_router
+    from backend.prefetch import prefetch
+
+    run = _entrypoint(entrypoint)
+    if entrypoint == "run_tasks_with_agent" and inputs.get("prefetched") is None:
+        inputs["prefetched"] = prefetch(inputs["user_context"], inputs["tasks"], inputs["user_id"])
+
+    llm, tools = [], []
+    lock = threading.Lock()
+    # Wrap whatever is installed, so a run against the benchmark fakes can be recorded too
+    make_model = model_router.openai
+    execute_call = agent_loop._execute_call
+
+    def recording_call(handlers, call):
+        outcome = execute_call(handlers, call)
+        with lock:
+            tools.append({
+                "tool_name": call["tool_name"],
+                "args": _json(call["args"]),
+                "result": _json(outcome["result"]),
+                "is_error": outcome["is_error"],
+                "duration_ms": outcome["duration_ms"]
+            })
+        return outcome
+
+    with ExitStack() as stack:
+        _patched(stack, lambda *args, **kwargs: _RecordingModel(make_model(*args, **kwargs), llm, lock), recording_call)
+        start = time.perf_counter()
+        response = run(**inputs)
+        wall = time.perf_counter() - start
+
+    cassette = {
+        "version": CASSETTE_VERSION,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "entrypoint": entrypoint,
+        "inputs": _redact(inputs),
+        "llm": llm,
+        "tools": tools,
+        "stats": asdict(_stats(response, len(llm), sum(e["request"]["bytes"] for e in llm), wall)),
+        "text": response.get("text", "")
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(cassette, indent=1, ensure_ascii=False))
+    return cassette
+
+
+# -- replay -----------------------------------------------------------------
+
+@dataclass
+class ReplayResult:
+    cassette: dict
+    stats: RunStats
+    speed: float
+    text: str = ""
+    misses: list[str] = field(default_factory=list)        # tool calls the cassette had no result for
+    divergences: list[str] = field(default_factory=list)   # LLM calls made with a different tool_choice
+
+    def check(
+        self,
+        max_steps: Optional[int] = None,
+        max_tool_calls: Optional[int] = None,
+        max_llm_calls: Optional[int] = None,
+        max_bytes_sent: Optional[int] = None,
+        max_wall_ms: Optional[float] = None,
+        tolerance: float = 0.0
+    ) -> list[str]:
+        """
+        Failed expectations, empty if the replay is within limits. Limits not
+        given default to the recorded run's value plus `tolerance` %; wall time
+        is only checked by default when replaying at speed 1.
+        """
+        recorded = self.cassette["stats"]
+        slack = 1 + tolerance / 100
+
+        def limit(given, key):
+            return given if given is not None else recorded[key] * slack
+
+        limits = {
+            "steps": limit(max_steps, "steps"),
+            "tool_calls": limit(max_tool_calls, "tool_calls"),
+            "llm_calls": limit(max_llm_calls, "llm_calls"),
+            "bytes_sent": limit(max_bytes_sent, "bytes_sent"),
+        }
+        if max_wall_ms is not None or self.speed == 1:
+            limits["wall_ms"] = limit(max_wall_ms, "wall_ms")
+
+        failures = [
+            f"{key} {getattr(self.stats, key)} > {round(value, 1)}"
+            for key, value in limits.items() if getattr(self.stats, key) > value
+        ]
+        failures += [f"tool call not in cassette: {miss}" for miss in self.misses]
+        failures += self.divergences
+        return failures
+
+
+class _ReplaySession:
+    def __init__(self, cassette: dict, speed: float):
+        self.cassette = cassette
+        self.speed = speed
+        self.llm_calls = 0
+        self.bytes_sent = 0
+        self.misses: list[str] = []
+        self.divergences: list[str] = []
+        self._tools = list(cassette["tools"])
+        self._used = [False] * len(self._tools)
+        self._lock = threading.Lock()
+
+    def _sleep(self, duration_ms: float):
+        if self.speed > 0 and duration_ms:
+            time.sleep(duration_ms / 1000 * self.speed)
+
+    def generate_text(self, messages=None, tools=None, tool_choice=None, **kwargs):
+        with self._lock:
+            index = self.llm_calls
+            if index >= len(self.cassette["llm"]):
+                raise CassetteMismatch(f"LLM call {index + 1} but the cassette only has {len(self.cassette['llm'])}")
+            self.llm_calls += 1
+            self.bytes_sent += _request_bytes(messages, tools)
+        entry = self.cassette["llm"][index]
+        if entry["request"]["tool_choice"] != tool_choice:
+            self.divergences.append(
+                f"LLM call {index + 1} used tool_choice={tool_choice!r}, "
+                f"recorded {entry['request']['tool_choice']!r}"
+            )
+        self._sleep(entry["duration_ms"])
+        return {**entry["response"], "raw_response": None}
+
+    def _take_tool(self, call: dict) -> Optional[dict]:
+        """The recorded result for this call: same args first, else the next unused one of the same tool."""
+        key = _call_key(call["tool_name"], call["args"])
+        with self._lock:
+            candidates = [i for i, entry in enumerate(self._tools) if not self._used[i] and entry["tool_name"] == call["tool_name"]]
+            exact = [i for i in candidates if _call_key(self._tools[i]["tool_name"], self._tools[i]["args"]) == key]
+            if not (exact or candidates):
+                return None
+            index = (exact or candidates)[0]
+            self._used[index] = True
+            return self._tools[index]
+
+    def execute_call(self, handlers: dict, call: dict) -> dict:
+        entry = self._take_tool(call)
+        if entry is None:
+            with self._lock:
+                self.misses.append(_call_key(call["tool_name"], call["args"]))
+            return {"result": {"error": "Tool call not in cassette"}, "is_error": True, "duration_ms": 0}
+        self._sleep(entry["duration_ms"])
+        return {"result": entry["result"], "is_error": entry["is_error"], "duration_ms": entry["duration_ms"]}
+
+
+def load(path: Union[str, Path]) -> dict:
+    cassette = json.loads(Path(path).read_text())
+    if cassette.get("version") != CASSETTE_VERSION:
+        raise ValueError(f"{path}: cassette version {cassette.get('version')}, expected {CASSETTE_VERSION}")
+    return cassette
+
+
+def replay(cassette: Union[str, Path, dict], speed: float = 1.0) -> ReplayResult:
+    """Re-run a recorded agent run offline from its cassette."""
+    if not isinstance(cassette, dict):
+        cassette = load(cassette)
+    session = _ReplaySession(cassette, speed)
+    run = _entrypoint(cassette["entrypoint"])
+
+    with ExitStack() as stack:
+        _patched(stack, lambda *args, **kwargs: session, session.execute_call)
+        start = time.perf_counter()
+        response = run(**cassette["inputs"])
+        wall = time.perf_counter() - start
+
+    return ReplayResult(
+        cassette=cassette,
+        stats=_stats(response, session.llm_calls, session.bytes_sent, wall),
+        speed=speed,
+        text=response.get("text", ""),
+        misses=session.misses,
+        divergences=session.divergences
+    )
+
+
+# -- CLI --------------------------------------------------------------------
+
+def _record_command(args) -> tuple[int, list[str]]:
+    if args.message:
+        cassette = record(
+            args.path, "chat_with_agent",
+            user_message=args.message,
+            context_injection=args.context,
+            user_id=args.as_user
+        )
+    else:
+        import backend.database.supabase_db as sb
+        from backend.chat_memory import get_chat_context
+
+        tasks = [{k: v for k, v in task.items() if k != "user_id"} for task in sb.get_tasks(args.user_id)]
+        if args.task_ids:
+            tasks = [task for task in tasks if task["id"] in set(args.task_ids)]
+        cassette = record(
+            args.path, "run_tasks_with_agent",
+            user_id=args.user_id,
+            tasks=tasks,
+            user_context=sb.get_user_context(args.user_id),
+            chat_history=get_chat_context(args.user_id)
+        )
+    return 0, [f"Recorded {args.path}: {cassette['stats']}"]
+
+
+def _check_command(args) -> tuple[int, list[str]]:
+    lines = []
+    failed = False
+    for path in args.paths:
+        result = replay(path, speed=args.speed)
+        recorded = result.cassette["stats"]
+        failures = result.check(
+            max_steps=args.max_steps,
+            max_tool_calls=args.max_tool_calls,
+            max_bytes_sent=args.max_bytes_sent,
+            max_wall_ms=args.max_wall_ms,
+            tolerance=args.tolerance
+        )
+        failed |= bool(failures)
+        lines.append(f"{'FAIL' if failures else 'ok  '} {path}")
+        for key, value in asdict(result.stats).items():
+            lines.append(f"     {key:<11} {recorded[key]:>10} → {value}")
+        lines += [f"     ✗ {failure}" for failure in failures]
+    return (1 if failed else 0), lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Record and replay agent runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="run the agent for real and write a cassette")
+    rec.add_argument("path")
+    target = rec.add_mutually_exclusive_group(required=True)
+    target.add_argument("--message", help="chat_with_agent with this message")
+    target.add_argument("--user-id", help="run_tasks_with_agent with this user's tasks")
+    rec.add_argument("--context", help="context_injection for --message")
+    rec.add_argument("--as-user", help="with --message: user the calendar/email tools act for")
+    rec.add_argument("--task-ids", type=int, nargs="*", help="only these tasks (with --user-id)")
+
+    check = commands.add_parser("check", help="replay cassettes and compare with the recording")
+    check.add_argument("paths", nargs="+")
+    check.add_argument("--speed", type=float, default=1.0, help="scale for recorded call durations, 0 = none")
+    check.add_argument("--tolerance", type=float, default=0.0, help="%% over the recorded values allowed")
+    check.add_argument("--max-steps", type=int)
+    check.add_argument("--max-tool-calls", type=int)
+    check.add_argument("--max-bytes-sent", type=int)
+    check.add_argument("--max-wall-ms", type=float)
+
+    for command in (rec, check):
+        command.add_argument("--verbose", action="store_true", help="keep the agent's own output")
+
+    args = parser.parse_args(argv)
+    handler = _record_command if args.command == "record" else _check_command
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    try:
+        with redirect_stdout(output):
+            code, lines = handler(args)
+            log.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print("\n".join(lines))
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
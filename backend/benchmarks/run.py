@@ -0,0 +1,392 @@
+"""
+Benchmark Runner
+================
+    python -m backend.benchmarks.run [--scenario cron|agent|tools] [options]
+
+Scenarios:
+- cron: seeds N users x M due tasks and calls run_scheduled_tasks, i.e. due
+  task paging, async context loads, prefetch, the agent loop, tool calls,
+  marking tasks ran and the task_logs write-behind
+- agent: run_tasks_with_agent for every user directly (--concurrency threads)
+- tools: every calendar/email/scrape tool, --calls times each
+
+Stages named after an upstream (supabase, supabase_async, calendar, gmail,
+firecrawl, llm) are request times as seen by the fakes, simulated latency
+included; tool:<name>, prefetch, agent_run, user_run and iteration are timed
+around the real code. Each run is stored in results/<scenario>.jsonl;
+--compare REF prints the difference to the last run at REF with the same
+options and, with --fail-on-regression, exits 1 if p50/p95 or throughput got
+more than --threshold % worse.
+"""
+
+import argparse
+import os
+import sys
+
+# Read at import by the pipeline modules; every upstream is faked below
+DUMMY_ENV = {
+    "SUPABASE_URL": "http://supabase.benchmark.local",
+    "SUPABASE_SERVICE_ROLE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark",
+    "OPENROUTER_API_KEY": "benchmark",
+    "FIRECRAWL_API_KEY": "benchmark",
+    "DEFAULT_MODEL": "benchmark-model",
+}
+for _name, _value in DUMMY_ENV.items():
+    os.environ.setdefault(_name, _value)
+
+import asyncio
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from backend import log
+from backend.benchmarks import fakes
+from backend.benchmarks.stats import StageTimer, compare, find_baseline, save_result, summarize
+
+TASK_TYPES = ["TODO", "WEB", "EMAIL"]
+UPSTREAMS = ["calendar", "gmail", "firecrawl", "openrouter"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the cron pipeline against in-process fakes.")
+    parser.add_argument("--scenario", choices=["cron", "agent", "tools"], default="cron")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--tasks", type=int, default=3, help="tasks per user")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4, help="agent scenario: users run at once")
+    parser.add_argument("--calls", type=int, default=20, help="tools scenario: calls per tool")
+    parser.add_argument("--seed", type=int, default=0)
+
+    latency = parser.add_argument_group("fake latency (seconds per request)")
+    latency.add_argument("--db-latency", type=float, default=0.01)
+    latency.add_argument("--google-latency", type=float, default=0.05)
+    latency.add_argument("--firecrawl-latency", type=float, default=0.3)
+    latency.add_argument("--llm-latency", type=float, default=0.5)
+    latency.add_argument("--jitter", type=float, default=0.2, help="± fraction of each latency")
+
+    payload = parser.add_argument_group("fake payload sizes")
+    payload.add_argument("--calendars", type=int, default=3)
+    payload.add_argument("--events", type=int, default=20, help="events per calendar")
+    payload.add_argument("--event-bytes", type=int, default=200, help="event description size")
+    payload.add_argument("--emails", type=int, default=20)
+    payload.add_argument("--email-bytes", type=int, default=2000)
+    payload.add_argument("--page-bytes", type=int, default=20000, help="scraped page size")
+    payload.add_argument("--completion-bytes", type=int, default=400)
+
+    run = parser.add_argument_group("run")
+    run.add_argument("--unthrottled", action="store_true", help="lift the upstream rate limits")
+    run.add_argument("--trace-memory", action="store_true", help="tracemalloc peak (slows the run)")
+    run.add_argument("--no-save", action="store_true", help="don't append to results/")
+    run.add_argument("--compare", metavar="REF", help="git commit-ish to compare against")
+    run.add_argument("--threshold", type=float, default=10.0, help="regression threshold in %%")
+    run.add_argument("--fail-on-regression", action="store_true")
+    run.add_argument("--verbose", action="store_true", help="keep the pipeline's own output")
+    return parser.parse_args(argv)
+
+
+def config_of(args: argparse.Namespace) -> dict:
+    """The options that make two runs comparable."""
+    skip = {"compare", "threshold", "fail_on_regression", "verbose", "no_save", "trace_memory"}
+    return {key: value for key, value in sorted(vars(args).items()) if key not in skip}
+
+
+class Fakes:
+    def __init__(self, args: argparse.Namespace, timer: StageTimer):
+        latency = lambda seconds: fakes.Latency(seconds, args.jitter)
+        self.tables = fakes.FakeTables()
+        self.supabase = fakes.FakeSupabase(self.tables, latency(args.db_latency), timer)
+        self.async_supabase = fakes.FakeAsyncSupabase(self.tables, latency(args.db_latency), timer)
+        self.google = fakes.FakeGoogle(
+            latency(args.google_latency), timer,
+            calendars=args.calendars,
+            events_per_calendar=args.events,
+            payload_bytes=args.event_bytes,
+            emails=args.emails,
+            email_bytes=args.email_bytes
+        )
+        self.firecrawl = fakes.FakeFirecrawl(latency(args.firecrawl_latency), timer, page_bytes=args.page_bytes)
+        self.llm = fakes.FakeLLM(latency(args.llm_latency), timer, completion_bytes=args.completion_bytes)
+
+
+@contextmanager
+def installed(f: Fakes, timer: StageTimer):
+    """Point the pipeline at the fakes and time its stages, for the duration of the block."""
+    import backend.agent_loop as agent_loop
+    import backend.database.supabase_async as supabase_async
+    import backend.fastAPI as fastAPI
+    import backend.model_router as model_router
+    import backend.prefetch as prefetch
+    import backend.tools.calendar.calendar_fetch as calendar_fetch
+    import backend.tools.email.email_fetcher as email_fetcher
+    import backend.tools.knowledge as knowledge
+    from backend import clients
+
+    execute_call = agent_loop._execute_call
+
+    def timed_call(handlers, call):
+        with timer.time(f"tool:{call['tool_name']}"):
+            return execute_call(handlers, call)
+
+    with ExitStack() as stack:
+        patch = lambda target, name, value: stack.enter_context(mock.patch.object(target, name, value))
+        stack.enter_context(clients.override("supabase", f.supabase))
+        stack.enter_context(clients.override("firecrawl", f.firecrawl.app()))
+        patch(supabase_async, "_client", f.async_supabase)
+        patch(calendar_fetch, "build", f.google.build)
+        patch(email_fetcher, "build", f.google.build)
+        # Fresh knowledge indexes per run, outside the repo
+        patch(knowledge, "KNOWLEDGE_DIR", stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-knowledge-")))
+        patch(model_router, "openai", f.llm.model)
+
+        patch(agent_loop, "_execute_call", timed_call)
+        patch(prefetch.AgentSetup, "wait", timer.wrap("prefetch", prefetch.AgentSetup.wait))
+        patch(fastAPI, "run_tasks_with_agent", timer.wrap("agent_run", fastAPI.run_tasks_with_agent))
+        patch(fastAPI, "run_user_tasks", timer.wrap("user_run", fastAPI.run_user_tasks))
+        yield
+
+
+def google_token(user_id: str) -> dict:
+    return {
+        "access_token": f"token-{user_id}",
+        "refresh_token": "",
+        "token_type": "Bearer",
+        "scope": "https://www.googleapis.com/auth/calendar https://www.googleapis.com/auth/gmail.modify",
+        # Far enough out that the token manager never refreshes
+        "expiry_date": str(int((time.time() + 30 * 86400) * 1000)),
+    }
+
+
+def seed_users(f: Fakes, user_ids: list[str], n_tasks: int):
+    """Users with a Google token and n_tasks each, cycling through TODO/WEB/EMAIL."""
+    long_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    rows = f.tables.rows
+    for n, user_id in enumerate(user_ids):
+        rows["users"].append({
+            "id": user_id,
+            "context": {"timezone": "Europe/London", "work_hours": "9-17"},
+            "preferences": ["mornings for deep work", "no meetings after 6pm"],
+            "calendar_url": "",
+            "google_token": google_token(user_id),
+        })
+        for i in range(n_tasks):
+            type_ = TASK_TYPES[(n + i) % len(TASK_TYPES)]
+            rows["tasks"].append({
+                "id": f.tables.next_id(),
+                "user_id": user_id,
+                "type": type_,
+                "title": f"{type_.title()} task {i + 1}",
+                "context": {
+                    "prompt": f"Keep on top of {type_.lower()} item {i + 1}",
+                    "priority": ["high", "medium", "low"][i % 3],
+                    "url": f"https://example.com/{user_id}/board-{i}" if type_ == "WEB" else None,
+                },
+                "period": "1 day",
+                "last_run_ts": long_ago,
+            })
+
+
+def make_all_due(f: Fakes):
+    long_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    with f.tables.lock:
+        for task in f.tables.rows["tasks"]:
+            task["last_run_ts"] = long_ago
+
+
+def bench_cron(args, f: Fakes, timer: StageTimer) -> dict:
+    import backend.fastAPI as fastAPI
+    from backend.database.write_buffer import flush_all
+
+    seed_users(f, [f"user-{n}" for n in range(args.users)], args.tasks)
+    walls = []
+    for _ in range(args.iterations):
+        make_all_due(f)
+        f.google.reset()
+        start = time.perf_counter()
+        with timer.time("iteration"):
+            asyncio.run(fastAPI.run_scheduled_tasks(None))
+            with timer.time("flush"):
+                flush_all()
+        walls.append(time.perf_counter() - start)
+    return {"walls": walls, "tasks_per_iteration": args.users * args.tasks}
+
+
+def bench_agent(args, f: Fakes, timer: StageTimer) -> dict:
+    import backend.database.supabase_db as sb
+    from backend import rate_limit
+    from backend.agent import run_tasks_with_agent
+    from backend.chat_memory import get_chat_context
+
+    user_ids = [f"user-{n}" for n in range(args.users)]
+    seed_users(f, user_ids, args.tasks)
+
+    def run_user(user_id: str):
+        with rate_limit.acting_for(user_id), timer.time("user_run"):
+            tasks = [
+                {key: value for key, value in task.items() if key != "user_id"}
+                for task in sb.get_tasks(user_id)
+            ]
+            context = sb.get_user_context(user_id)
+            with timer.time("agent_run"):
+                run_tasks_with_agent(user_id, tasks, context, get_chat_context(user_id))
+
+    walls = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.iterations):
+            f.google.reset()
+            start = time.perf_counter()
+            with timer.time("iteration"):
+                list(pool.map(run_user, user_ids))
+            walls.append(time.perf_counter() - start)
+    return {"walls": walls, "tasks_per_iteration": args.users * args.tasks}
+
+
+def bench_tools(args, f: Fakes, timer: StageTimer) -> dict:
+    import backend.agent as agent
+    import backend.agent_loop as agent_loop
+    from backend.tools.context import ToolContext
+
+    seed_users(f, ["user-0"], 0)
+    tools = {tool.name: tool for tool in agent.build_tools(ToolContext("user-0"))}
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    calls = [
+        (tools["list_calendars"], {}),
+        (tools["get_all_calendar_events"], {}),
+        (tools["search_calendar_events"], {"query": "session"}),
+        (tools["create_calendar_event"], {
+            "summary": "Benchmark event",
+            "start_datetime": tomorrow.isoformat(),
+            "end_datetime": (tomorrow + timedelta(hours=1)).isoformat(),
+        }),
+        (tools["get_unread_emails"], {"max_results": 10}),
+        (tools["search_emails"], {"search_term": "deadline"}),
+        (tools["scrape_webpage"], {"url": "https://example.com/jobs"}),
+    ]
+    handlers = {tool.name: tool.handler for tool, _ in calls}
+
+    walls = []
+    for _ in range(args.iterations):
+        f.google.reset()
+        start = time.perf_counter()
+        with timer.time("iteration"):
+            for n in range(args.calls):
+                for tool, tool_args in calls:
+                    agent_loop._execute_call(handlers, {
+                        "tool_call_id": f"call_{n}",
+                        "tool_name": tool.name,
+                        "args": tool_args
+                    })
+        walls.append(time.perf_counter() - start)
+    # "tasks" here are tool calls
+    return {"walls": walls, "tasks_per_iteration": args.calls * len(calls)}
+
+
+SCENARIOS = {"cron": bench_cron, "agent": bench_agent, "tools": bench_tools}
+
+
+def max_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def run(args: argparse.Namespace) -> dict:
+    if args.unthrottled:
+        for upstream in UPSTREAMS:
+            os.environ[f"RATE_LIMIT_{upstream.upper()}"] = "1000000/1000000"
+            os.environ[f"RATE_LIMIT_{upstream.upper()}_PER_USER"] = "1000000/1000000"
+    fakes.seed(args.seed)
+
+    timer = StageTimer()
+    f = Fakes(args, timer)
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    try:
+        with redirect_stdout(output):
+            import backend.fastAPI  # noqa: F401  (import cost isn't part of the measurement)
+            from backend import metrics
+            metrics.reset()
+
+            rss_before = max_rss_mb()
+            if args.trace_memory:
+                tracemalloc.start()
+            with installed(f, timer):
+                outcome = SCENARIOS[args.scenario](args, f, timer)
+            traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+            if args.trace_memory:
+                tracemalloc.stop()
+            counters = metrics.snapshot()["counters"]
+            log.flush()  # queued pipeline output goes to the same place
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    walls = outcome["walls"]
+    per_iteration = outcome["tasks_per_iteration"]
+    memory = {"max_rss_mb": max_rss_mb(), "rss_growth_mb": round(max_rss_mb() - rss_before, 1)}
+    if traced_peak is not None:
+        memory["traced_peak_mb"] = round(traced_peak / (1024 * 1024), 1)
+
+    return {
+        "scenario": args.scenario,
+        "config": config_of(args),
+        "throughput": {
+            "tasks_per_iteration": per_iteration,
+            "iterations": len(walls),
+            "tasks_per_s": round(per_iteration * len(walls) / sum(walls), 3) if sum(walls) else 0.0,
+            "users_per_s": round(args.users * len(walls) / sum(walls), 3) if sum(walls) else 0.0,
+        },
+        "stages": summarize(timer.samples()),
+        "llm": f.llm.stats(),
+        "memory": memory,
+        "counters": counters,
+    }
+
+
+def report(record: dict) -> str:
+    throughput = record["throughput"]
+    lines = [
+        f"Scenario {record['scenario']}: {throughput['tasks_per_iteration']} per iteration × "
+        f"{throughput['iterations']} → {throughput['tasks_per_s']} tasks/s, {throughput['users_per_s']} users/s",
+        f"{'stage':<28}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)",
+    ]
+    for stage, stats in record["stages"].items():
+        lines.append(
+            f"{stage:<28}{stats['count']:>7}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+    llm = record["llm"]
+    lines.append(
+        f"LLM: {llm['requests']} requests, {llm['bytes_sent'] / 1024:.1f} KiB sent, "
+        f"{llm['bytes_received'] / 1024:.1f} KiB received"
+    )
+    lines.append("Memory: " + ", ".join(f"{key} {value}" for key, value in record["memory"].items()))
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    record = run(args)
+    print(report(record))
+
+    regressed = False
+    if args.compare:
+        baseline = find_baseline(args.scenario, args.compare, record["config"])
+        if baseline is None:
+            print(f"No stored {args.scenario} run at {args.compare} with these options.")
+        else:
+            lines, regressed = compare(record, baseline, args.threshold)
+            print("\n".join(lines))
+
+    if not args.no_save:
+        print(f"Saved to {save_result(args.scenario, record)}")
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Benchmark Statistics and Results
+================================
+StageTimer collects wall-time samples per stage; summarize() turns them into
+count / mean / p50 / p95 / p99 / max. Runs are appended to
+results/<scenario>.jsonl with the git commit they were measured at, and
+compare() diffs a run against the latest one for another commit with the
+same configuration.
+"""
+
+import functools
+import json
+import math
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class StageTimer:
+    def __init__(self):
+        self._samples: dict[str, list[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def wrap(self, stage: str, fn):
+        """fn, with every call timed under `stage`."""
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.time(stage):
+                return fn(*args, **kwargs)
+        return timed
+
+    def samples(self) -> dict[str, list[float]]:
+        with self._lock:
+            return {stage: list(values) for stage, values in self._samples.items()}
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Linear-interpolated q-th percentile (0-100) of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(samples: dict[str, list[float]]) -> dict[str, dict]:
+    """Per-stage count, total seconds and mean/p50/p95/p99/max in milliseconds."""
+    summary = {}
+    for stage, values in sorted(samples.items()):
+        values = sorted(values)
+        summary[stage] = {
+            "count": len(values),
+            "total_s": round(sum(values), 4),
+            "mean_ms": round(1000 * sum(values) / len(values), 3),
+            "p50_ms": round(1000 * percentile(values, 50), 3),
+            "p95_ms": round(1000 * percentile(values, 95), 3),
+            "p99_ms": round(1000 * percentile(values, 99), 3),
+            "max_ms": round(1000 * values[-1], 3),
+        }
+    return summary
+
+
+# -- results ----------------------------------------------------------------
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", *args],
+            cwd=RESULTS_DIR.parent,
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def git_commit() -> dict:
+    """Commit the benchmark runs against, and whether the tree had local changes."""
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def resolve_commit(ref: str) -> Optional[str]:
+    return _git("rev-parse", "--verify", f"{ref}^{{commit}}")
+
+
+def save_result(scenario: str, record: dict) -> Path:
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{scenario}.jsonl"
+    record = {
+        **git_commit(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        **record
+    }
+    with path.open("a") as f:
+        f.write(json.dumps(record) + "\n")
+    return path
+
+
+def load_results(scenario: str) -> list[dict]:
+    path = RESULTS_DIR / f"{scenario}.jsonl"
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(scenario: str, ref: str, config: dict) -> Optional[dict]:
+    """Latest stored run at `ref` (a commit-ish) with exactly the same config."""
+    commit = resolve_commit(ref) or ref
+    for record in reversed(load_results(scenario)):
+        if record.get("commit") and record["commit"].startswith(commit) and record.get("config") == config:
+            return record
+    return None
+
+
+def compare(current: dict, baseline: dict, threshold: float = 10.0) -> tuple[list[str], bool]:
+    """
+    Lines describing how `current` differs from `baseline`, and whether any
+    stage's p50/p95 or the throughput got worse by more than `threshold` %.
+    """
+    def change(new: float, old: float) -> float:
+        return 100 * (new - old) / old if old else 0.0
+
+    lines = [f"Compared with {baseline['commit'][:10]} ({baseline['recorded_at']}):"]
+    regressed = False
+
+    old_rate, new_rate = baseline["throughput"]["tasks_per_s"], current["throughput"]["tasks_per_s"]
+    delta = change(new_rate, old_rate)
+    flag = " ⚠️" if delta < -threshold else ""
+    regressed |= bool(flag)
+    lines.append(f"  throughput  {old_rate:>10.2f} → {new_rate:>10.2f} tasks/s  ({delta:+.1f}%){flag}")
+
+    for stage, stats in current["stages"].items():
+        old = baseline["stages"].get(stage)
+        if not old:
+            lines.append(f"  {stage:<28} (new stage)")
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            delta = change(stats[key], old[key])
+            worse = key != "p99_ms" and delta > threshold
+            regressed |= worse
+            parts.append(f"{key[:3]} {old[key]:.1f}→{stats[key]:.1f}ms ({delta:+.1f}%){' ⚠️' if worse else ''}")
+        lines.append(f"  {stage:<28} " + "  ".join(parts))
+    return lines, regressed
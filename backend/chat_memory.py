@@ -0,0 +1,188 @@
+"""
+Chat Memory
+===========
+Bounded chat context for the agent: a rolling per-user summary of older
+messages plus the last few turns verbatim.
+
+Every recorded message is stored in compact_chat as before, through the
+write-behind chat buffer. Once a batch is written, the messages that fell out
+of the "recent" window are folded into the summary as a single short line
+each. Past MAX_SUMMARY_CHARS the oldest day's lines are merged into one
+"N messages: ..." digest line (and only a lone digest line is ever dropped),
+so the injected context stays the same size however long the user has been
+chatting. Messages still in the buffer are merged into the recent window
+when it is read.
+
+The summary remembers the timestamp of the newest message folded into it
+(summarized_until, migrations/005_chat_summary_watermark.sql), so what to
+fold is found by timestamp, whatever order batches land in; a retried batch
+landing behind that watermark is folded from the written rows themselves.
+Writes are conditional on the message_count that was read, and a roll that
+loses the race re-reads and tries again.
+"""
+
+import asyncio
+import os
+import re
+from datetime import datetime
+
+import backend.database.supabase_db as sb
+import backend.database.supabase_async as asb
+from backend.database.write_buffer import chat_buffer, log_chat_message
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "5"))
+MAX_SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "2000"))
+SUMMARY_LINE_CHARS = 160
+DIGEST_WORDS = 8
+# Most messages folded per roll; the rest wait for the next flush
+ROLL_BATCH = 200
+ROLL_ATTEMPTS = 3
+
+_LINE = re.compile(r"^- \[([^\]]*)\] (.*)$")
+_DIGEST = re.compile(r"^(\d+) messages: (.*)$")
+
+
+def _summary_line(message: dict) -> str:
+    text = " ".join((message.get("message") or "").split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS] + "…"
+    day = (message.get("timestamp") or "")[:10]
+    return f"- [{day}] {message.get('role') or 'user'}: {text}"
+
+
+def _compact_oldest_day(lines: list[str]) -> bool:
+    """Merge the leading lines of the oldest day into one digest line; False if there's only one."""
+    parsed = [_LINE.match(line) for line in lines]
+    day = parsed[0].group(1) if parsed[0] else None
+    count = 0
+    while count < len(lines) and parsed[count] and parsed[count].group(1) == day:
+        count += 1
+    if count < 2:
+        return False
+
+    total, parts = 0, []
+    for match in parsed[:count]:
+        digest = _DIGEST.match(match.group(2))
+        if digest:
+            total += int(digest.group(1))
+            parts.append(digest.group(2))
+        else:
+            total += 1
+            parts.append(" ".join(match.group(2).split()[:DIGEST_WORDS]))
+    text = "; ".join(parts)
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS].rstrip("…") + "…"
+    lines[:count] = [f"- [{day}] {total} messages: {text}"]
+    return True
+
+
+def fold_into_summary(summary: str, message: dict) -> str:
+    """Append one message to the summary, compacting (then dropping) the oldest lines past the cap."""
+    lines = [line for line in (summary or "").splitlines() if line]
+    lines.append(_summary_line(message))
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > MAX_SUMMARY_CHARS:
+        if not _compact_oldest_day(lines):
+            lines.pop(0)
+    return "\n".join(lines)
+
+
+def record_chat_message(user_id: str, message: str, role: str = "user"):
+    """Queue a chat message; the summary is rolled forward once it is written."""
+    log_chat_message(user_id, {"message": message, "role": role})
+
+
+def _as_message(row: dict) -> dict:
+    """compact_chat row (as queued in the chat buffer) in get_recent_chat_messages' shape."""
+    return {"message": row["context"].get("message"), "role": row["context"].get("role"), "timestamp": row["timestamp"]}
+
+
+def _at(timestamp: str) -> datetime:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def roll_summary(user_id: str, written: list[dict]) -> bool:
+    """
+    Fold the user's messages that have left the recent window into their summary.
+
+    Args:
+        user_id: The user
+        written: The user's messages in the batch just written
+
+    Returns:
+        False if another writer changed the summary since it was read
+    """
+    recent = sb.get_recent_chat_messages(user_id, limit=RECENT_TURNS)
+    if len(recent) < RECENT_TURNS:
+        return True
+    current = sb.get_chat_summary(user_id)
+    until = current.get("summarized_until")
+    evicted = sb.get_chat_messages_between(user_id, after=until, before=recent[-1]["timestamp"], limit=ROLL_BATCH)
+    if until:
+        # Landed late (a retried batch) behind messages already folded, so no query finds them
+        evicted += [message for message in written if _at(message["timestamp"]) <= _at(until)]
+    if not evicted:
+        return True
+
+    evicted.sort(key=lambda message: _at(message["timestamp"]))
+    summary = current.get("summary", "")
+    for message in evicted:
+        summary = fold_into_summary(summary, message)
+    newest = max([message["timestamp"] for message in evicted] + ([until] if until else []), key=_at)
+    count = current.get("message_count") or 0
+    return sb.update_chat_summary(user_id, summary, count + len(evicted), newest, count)
+
+
+def roll_summaries(rows: list[dict]):
+    """Fold the messages pushed out of the recent window by `rows` into each user's summary."""
+    written: dict[str, list[dict]] = {}
+    for row in rows:
+        written.setdefault(row["user_id"], []).append(_as_message(row))
+    for user_id, messages in written.items():
+        for _ in range(ROLL_ATTEMPTS):
+            if roll_summary(user_id, messages):
+                break
+        else:
+            logger.warning("⚠️ Chat summary for user %s kept changing, rolling it on the next flush", user_id)
+
+
+chat_buffer.on_flush = roll_summaries
+
+
+def _with_pending(user_id: str, summary: dict, recent: list[dict]) -> dict:
+    pending = [_as_message(row) for row in chat_buffer.pending(user_id=user_id)]
+    return {
+        "summary": summary.get("summary", ""),
+        "recent": (list(reversed(recent)) + pending)[-RECENT_TURNS:]
+    }
+
+
+def get_chat_context(user_id: str) -> dict:
+    """Summary of older messages plus the last RECENT_TURNS messages, oldest first."""
+    recent = sb.get_recent_chat_messages(user_id, limit=RECENT_TURNS)
+    summary = sb.get_chat_summary(user_id)
+    return _with_pending(user_id, summary, recent)
+
+
+async def aget_chat_context(user_id: str) -> dict:
+    """Async get_chat_context; the two queries run concurrently."""
+    recent, summary = await asyncio.gather(
+        asb.get_recent_chat_messages(user_id, limit=RECENT_TURNS),
+        asb.get_chat_summary(user_id)
+    )
+    return _with_pending(user_id, summary, recent)
+
+
+def format_chat_context(chat_context: dict) -> str:
+    """Render chat context for the agent's system prompt."""
+    parts = []
+    if chat_context.get("summary"):
+        parts.append(f"Earlier conversation (summary):\n{chat_context['summary']}")
+    recent = chat_context.get("recent") or []
+    parts.append(
+        "Recent Chat History:\n"
+        + "\n".join(f"- {m.get('role') or 'user'}: {m.get('message') or ''}" for m in recent)
+    )
+    return "\n\n".join(parts)
@@ -0,0 +1,221 @@
+"""
+Circuit Breakers
+================
+One breaker per upstream (calendar, gmail, firecrawl, openrouter), checked by
+rate_limit.call before every request:
+
+- closed: calls go through; FAILURE_THRESHOLD consecutive failures open it
+- open: calls fail immediately with CircuitOpenError for RECOVERY_SECONDS
+- half-open: after that, HALF_OPEN_CALLS trial calls go through; a success
+  closes the breaker, a failure opens it again. A trial that ends saying
+  nothing about the upstream (our own bug, a rate limit wait) is given back
+  with release(), and trials still out after RECOVERY_SECONDS expire, so a
+  lost trial can't keep the breaker half-open for good
+
+Only upstream trouble counts as a failure (timeouts, connection errors, 5xx).
+Client errors like 404 mean the upstream is answering, so they don't.
+
+Settings per upstream can be overridden with CIRCUIT_<UPSTREAM>_THRESHOLD,
+CIRCUIT_<UPSTREAM>_RECOVERY and CIRCUIT_<UPSTREAM>_HALF_OPEN_CALLS.
+"""
+
+import os
+import threading
+import time
+from typing import Optional
+
+from backend import metrics
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+UPSTREAM_NAMES = {
+    "calendar": "Google Calendar",
+    "gmail": "Gmail",
+    "firecrawl": "Firecrawl",
+    "openrouter": "OpenRouter",
+}
+
+# Which upstream each agent tool depends on
+TOOL_UPSTREAMS = {
+    "scrape_webpage": "firecrawl",
+    "list_calendars": "calendar",
+    "get_calendar_events": "calendar",
+    "get_all_calendar_events": "calendar",
+    "create_calendar_event": "calendar",
+    "update_calendar_event": "calendar",
+    "delete_calendar_event": "calendar",
+    "search_calendar_events": "calendar",
+    "get_unread_emails": "gmail",
+    "get_emails_from_sender": "gmail",
+    "search_emails": "gmail",
+    "send_email": "gmail",
+}
+
+# Exceptions that are our bug rather than the upstream's
+_NOT_UPSTREAM_ERRORS = (ValueError, TypeError, KeyError, AttributeError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, upstream: str, retry_in: float):
+        self.upstream = upstream
+        self.retry_in = retry_in
+        super().__init__(
+            f"{UPSTREAM_NAMES.get(upstream, upstream)} is temporarily unavailable "
+            f"(circuit open, retry in {retry_in:.0f}s)"
+        )
+
+    def to_result(self) -> dict:
+        """Structured tool result telling the agent not to keep trying."""
+        return {
+            "error": "service_unavailable",
+            "service": UPSTREAM_NAMES.get(self.upstream, self.upstream),
+            "retry_after_seconds": round(self.retry_in),
+            "message": f"{self} Don't call tools that depend on it again in this run; "
+                       "work with the data you already have."
+        }
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        recovery_seconds: float = RECOVERY_SECONDS,
+        half_open_calls: int = HALF_OPEN_CALLS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning("🔌 Circuit %s: %s → %s", self.name, self._state, state)
+            metrics.increment("circuit_state_changes", upstream=self.name, state=state)
+        self._state = state
+
+    def _refresh(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.recovery_seconds:
+            self._set_state(HALF_OPEN)
+            self._trials = 0
+        elif self._state == HALF_OPEN and self._trials and now - self._trial_at >= self.recovery_seconds:
+            # Trials that never reported back
+            self._trials = 0
+
+    def _blocked(self, now: float) -> Optional[float]:
+        """Seconds until a call may go through, or None if one may now."""
+        if self._state == OPEN:
+            return max(self._opened_at + self.recovery_seconds - now, 0)
+        if self._state == HALF_OPEN and self._trials >= self.half_open_calls:
+            return max(self._trial_at + self.recovery_seconds - now, 0)
+        return None
+
+    def check(self, trial: bool = True):
+        """
+        Raise CircuitOpenError unless a call may go through right now. The
+        call takes a half-open trial unless `trial` is False; it must end in
+        record_success(), record_failure() or release().
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            retry_in = self._blocked(now)
+            if retry_in is None:
+                if self._state == HALF_OPEN and trial:
+                    self._trials += 1
+                    self._trial_at = now
+                return
+        metrics.increment("circuit_rejections", upstream=self.name)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def peek(self) -> Optional[CircuitOpenError]:
+        """The error check() would raise, without using up a half-open trial."""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            retry_in = self._blocked(now)
+        return None if retry_in is None else CircuitOpenError(self.name, retry_in)
+
+    def release(self):
+        """Give back a half-open trial whose call told us nothing about the upstream."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def status(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in_seconds": round(self._blocked(now) or 0, 1),
+                "failure_threshold": self.failure_threshold,
+                "recovery_seconds": self.recovery_seconds,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if upstream not in _breakers:
+            prefix = f"CIRCUIT_{upstream.upper()}_"
+            _breakers[upstream] = CircuitBreaker(
+                upstream,
+                failure_threshold=int(os.getenv(prefix + "THRESHOLD", FAILURE_THRESHOLD)),
+                recovery_seconds=float(os.getenv(prefix + "RECOVERY", RECOVERY_SECONDS)),
+                half_open_calls=int(os.getenv(prefix + "HALF_OPEN_CALLS", HALF_OPEN_CALLS))
+            )
+        return _breakers[upstream]
+
+
+def is_upstream_failure(error: Exception, status: Optional[int]) -> bool:
+    """Whether an error says the upstream is unhealthy (vs. a bad request on our side)."""
+    if status is not None:
+        return status >= 500
+    return not isinstance(error, _NOT_UPSTREAM_ERRORS)
+
+
+def tool_unavailable(tool_name: str) -> Optional[dict]:
+    """Structured unavailable result if the tool's upstream breaker is open, else None."""
+    upstream = TOOL_UPSTREAMS.get(tool_name)
+    error = get_breaker(upstream).peek() if upstream else None
+    return error.to_result() if error else None
+
+
+def all_status() -> dict:
+    for upstream in UPSTREAM_NAMES:
+        get_breaker(upstream)
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
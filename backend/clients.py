@@ -0,0 +1,129 @@
+"""
+Client Registry
+===============
+Shared clients for external services, created on first use instead of at
+import time, so importing the backend needs no credentials or network and
+workers start fast. The module that owns a client registers its factory:
+
+    clients.register("supabase", _connect)
+    clients.get("supabase").table("users")...
+
+Factories run once (concurrent first callers wait for the same result; a
+failed factory is retried on the next get()). warm_up() creates everything
+in a background thread, e.g. at app startup (WARM_UP_CLIENTS=1), and
+override() swaps a client out for benchmarks and tests.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Optional
+
+from backend import metrics
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_factories: dict[str, Callable[[], Any]] = {}
+_clients: dict[str, Any] = {}
+_creating: dict[str, threading.Lock] = {}
+
+
+def register(name: str, factory: Callable[[], Any]) -> None:
+    """
+    Register how to create a client. Re-registering replaces the factory and
+    drops a client created by the old one.
+
+    Args:
+        name: Registry key, e.g. "supabase"
+        factory: Zero-argument callable returning the client
+    """
+    with _lock:
+        _factories[name] = factory
+        _clients.pop(name, None)
+        _creating.setdefault(name, threading.Lock())
+
+
+def get(name: str) -> Any:
+    """
+    The client registered under `name`, created on first use.
+
+    Raises:
+        KeyError: If nothing is registered under `name`
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        if name not in _factories:
+            raise KeyError(f"No client registered as {name!r}")
+        factory, creating = _factories[name], _creating[name]
+
+    # Per-client lock so a slow Supabase connect doesn't hold up Firecrawl
+    with creating:
+        client = _clients.get(name)
+        if client is None:
+            start = time.perf_counter()
+            client = factory()
+            metrics.histogram("client_init_seconds", time.perf_counter() - start, client=name)
+            logger.info("🔌 %s client ready (%.0f ms)", name, (time.perf_counter() - start) * 1000)
+            _clients[name] = client
+    return client
+
+
+def is_ready(name: str) -> bool:
+    return name in _clients
+
+
+def reset(name: Optional[str] = None) -> None:
+    """Drop one (or every) created client; the next get() creates it again."""
+    with _lock:
+        if name is None:
+            _clients.clear()
+        else:
+            _clients.pop(name, None)
+
+
+@contextmanager
+def override(name: str, client: Any):
+    """Serve `client` for `name` inside the block, e.g. a fake in benchmarks."""
+    with _lock:
+        previous = _clients.get(name)
+        _clients[name] = client
+    try:
+        yield client
+    finally:
+        with _lock:
+            if previous is None:
+                _clients.pop(name, None)
+            else:
+                _clients[name] = previous
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> threading.Thread:
+    """
+    Create clients in a background thread so the first request doesn't pay
+    for imports and connection setup. Failures are logged, not raised; the
+    client is then created (or fails properly) on first use.
+
+    Args:
+        names: Clients to create; defaults to every registered one
+
+    Returns:
+        The started daemon thread
+    """
+    with _lock:
+        pending = [name for name in (names or list(_factories)) if name not in _clients]
+
+    def run():
+        for name in pending:
+            try:
+                get(name)
+            except Exception as e:
+                logger.warning("⚠️ Warm-up of %s client failed: %s", name, e)
+
+    thread = threading.Thread(target=run, name="client-warm-up", daemon=True)
+    thread.start()
+    return thread
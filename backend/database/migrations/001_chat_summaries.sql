@@ -0,0 +1,13 @@
+-- Rolling per-user chat summary, maintained by backend/chat_memory.py.
+-- Agents read this plus the last few compact_chat rows instead of the raw history.
+
+create table if not exists chat_summaries (
+    user_id uuid primary key references users(id) on delete cascade,
+    summary text not null default '',
+    message_count integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- Serves "latest N messages for a user" without scanning the user's whole history
+create index if not exists compact_chat_user_timestamp_idx
+    on compact_chat (user_id, timestamp desc);
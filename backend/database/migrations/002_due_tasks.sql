@@ -0,0 +1,51 @@
+-- Indexed "due tasks" lookup for supabase_db.get_due_tasks.
+--
+-- timestamptz + interval isn't immutable, so it can't back an expression index
+-- or a generated column. Instead next_run_ts is a plain column kept in sync by
+-- a trigger, and (next_run_ts, id) is indexed for keyset pagination.
+
+alter table tasks add column if not exists next_run_ts timestamptz;
+
+create or replace function tasks_set_next_run_ts() returns trigger
+language plpgsql as $$
+begin
+    new.next_run_ts := coalesce(new.last_run_ts, now()) + new.period;
+    return new;
+end;
+$$;
+
+drop trigger if exists tasks_next_run_ts on tasks;
+create trigger tasks_next_run_ts
+    before insert or update of last_run_ts, period on tasks
+    for each row execute function tasks_set_next_run_ts();
+
+update tasks set next_run_ts = coalesce(last_run_ts, now()) + period where next_run_ts is null;
+
+create index if not exists tasks_next_run_ts_id_idx on tasks (next_run_ts, id);
+
+-- One page of due tasks ordered by (next_run_ts, id), starting after the
+-- cursor (p_after_ts, p_after_id). Pass nulls for the first page.
+create or replace function get_due_tasks(
+    p_now timestamptz,
+    p_limit integer,
+    p_after_ts timestamptz default null,
+    p_after_id bigint default null
+)
+returns table (
+    id bigint,
+    user_id uuid,
+    type text,
+    title text,
+    context jsonb,
+    period interval,
+    last_run_ts timestamptz,
+    next_run_ts timestamptz
+)
+language sql stable as $$
+    select t.id, t.user_id, t.type::text, t.title, t.context, t.period, t.last_run_ts, t.next_run_ts
+    from tasks t
+    where t.next_run_ts <= p_now
+      and (p_after_ts is null or (t.next_run_ts, t.id) > (p_after_ts, p_after_id))
+    order by t.next_run_ts, t.id
+    limit p_limit;
+$$;
@@ -0,0 +1,28 @@
+-- Per-user execution lease, used by backend/user_lease.py when
+-- USER_LEASE_BACKEND=supabase so agent runs for one user never overlap across
+-- server processes. A lease that isn't released (crashed worker) simply
+-- expires.
+
+create table if not exists user_leases (
+    user_id uuid primary key references users(id) on delete cascade,
+    holder text not null,
+    expires_at timestamptz not null
+);
+
+-- Take (or extend) the lease if it is free, expired, or already ours.
+-- Returns true when p_holder holds the lease afterwards.
+create or replace function acquire_user_lease(
+    p_user_id uuid,
+    p_holder text,
+    p_ttl_seconds integer
+) returns boolean
+language plpgsql as $$
+begin
+    insert into user_leases (user_id, holder, expires_at)
+    values (p_user_id, p_holder, now() + make_interval(secs => p_ttl_seconds))
+    on conflict (user_id) do update
+        set holder = excluded.holder, expires_at = excluded.expires_at
+        where user_leases.expires_at < now() or user_leases.holder = excluded.holder;
+    return found;
+end;
+$$;
@@ -0,0 +1,35 @@
+-- Per-task run state that isn't part of what the user asked for (so it stays
+-- out of `context`, which the agent is shown). EMAIL tasks keep their
+-- processed-message watermark here (backend/email_watermark.py):
+--   {"email_watermark": {"internal_date": <ms>, "ids": [...]}}
+
+alter table tasks add column if not exists state jsonb not null default '{}'::jsonb;
+
+-- get_due_tasks returns state too; a changed return type needs a drop first.
+drop function if exists get_due_tasks(timestamptz, integer, timestamptz, bigint);
+
+create function get_due_tasks(
+    p_now timestamptz,
+    p_limit integer,
+    p_after_ts timestamptz default null,
+    p_after_id bigint default null
+)
+returns table (
+    id bigint,
+    user_id uuid,
+    type text,
+    title text,
+    context jsonb,
+    state jsonb,
+    period interval,
+    last_run_ts timestamptz,
+    next_run_ts timestamptz
+)
+language sql stable as $$
+    select t.id, t.user_id, t.type::text, t.title, t.context, t.state, t.period, t.last_run_ts, t.next_run_ts
+    from tasks t
+    where t.next_run_ts <= p_now
+      and (p_after_ts is null or (t.next_run_ts, t.id) > (p_after_ts, p_after_id))
+    order by t.next_run_ts, t.id
+    limit p_limit;
+$$;
@@ -0,0 +1,39 @@
+-- Chat summaries remember the newest message folded into them
+-- (backend/chat_memory.py), so messages leaving the recent window are found
+-- by timestamp rather than by offset, and message_count doubles as a version
+-- number so concurrent writers can't overwrite each other's folds.
+
+alter table chat_summaries add column if not exists summarized_until timestamptz;
+
+-- Existing summaries covered everything but the last 5 messages (CHAT_RECENT_TURNS)
+update chat_summaries s
+set summarized_until = (
+    select c.timestamp from compact_chat c
+    where c.user_id = s.user_id
+    order by c.timestamp desc
+    offset 5 limit 1
+)
+where s.summarized_until is null and s.message_count > 0;
+
+-- Write the summary only if its message_count is still p_previous_count (0
+-- when there was none yet). Returns true when it was written.
+create or replace function update_chat_summary(
+    p_user_id uuid,
+    p_summary text,
+    p_message_count integer,
+    p_summarized_until timestamptz,
+    p_previous_count integer
+) returns boolean
+language plpgsql as $$
+begin
+    insert into chat_summaries (user_id, summary, message_count, summarized_until, updated_at)
+    values (p_user_id, p_summary, p_message_count, p_summarized_until, now())
+    on conflict (user_id) do update
+        set summary = excluded.summary,
+            message_count = excluded.message_count,
+            summarized_until = excluded.summarized_until,
+            updated_at = excluded.updated_at
+        where chat_summaries.message_count = p_previous_count;
+    return found;
+end;
+$$;
@@ -0,0 +1,174 @@
+"""
+Async Supabase access layer
+===========================
+Partial async mirror of supabase_db: the read paths the request handlers,
+the cron run and agent setup (backend/prefetch.py) await, with the same
+names and signatures as their supabase_db counterparts. Writes, which
+happen from worker threads or through the write buffer, stay in supabase_db.
+
+    import backend.database.supabase_async as asb
+    context, recent = await asyncio.gather(
+        asb.get_user_context(user_id),
+        asb.get_recent_chat_messages(user_id)
+    )
+
+All calls share one AsyncClient whose PostgREST/auth requests go through a
+single pooled httpx.AsyncClient (HTTP/2, keep-alive), so concurrent queries
+are multiplexed over a few warm connections instead of each blocking a thread.
+The client is created on first use inside the running event loop; call
+close() on shutdown.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from backend.database.supabase_db import TASK_COLUMNS
+from backend.log import get_logger
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+
+_client: Optional["AsyncClient"] = None
+_http: Optional[httpx.AsyncClient] = None
+_client_lock: Optional[asyncio.Lock] = None
+
+
+async def get_client() -> "AsyncClient":
+    """The shared async Supabase client, created on first use."""
+    global _client, _http, _client_lock
+    if _client is not None:
+        return _client
+
+    if _client_lock is None:
+        _client_lock = asyncio.Lock()
+    async with _client_lock:
+        if _client is None:
+            from supabase import AsyncClientOptions, acreate_client
+
+            _http = httpx.AsyncClient(
+                http2=True,
+                timeout=TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=30
+                )
+            )
+            _client = await acreate_client(
+                supabase_url=os.getenv("SUPABASE_URL"),
+                supabase_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
+                options=AsyncClientOptions(httpx_client=_http)
+            )
+            logger.info("Connected to Supabase (async).")
+    return _client
+
+
+async def close():
+    """Close the pooled connections (call on app shutdown)."""
+    global _client, _http, _client_lock
+    if _http is not None:
+        await _http.aclose()
+    _client, _http, _client_lock = None, None, None
+
+
+async def get_user_context(user_id: str) -> dict:
+    """Retrieves the context for a given user."""
+    sb = await get_client()
+    response = await sb.table("users")\
+        .select("context, preferences, calendar_url, google_token")\
+        .eq("id", user_id)\
+        .single()\
+        .execute()
+
+    return {
+        "context": response.data.get("context", {}),
+        "preferences": response.data.get("preferences", []),
+        "calendar_url": response.data.get("calendar_url", ""),
+        "google_token": response.data.get("google_token", {})
+    } if response.data else {}
+
+async def get_tasks(user_id: str) -> list[dict]:
+    """Retrieves all tasks for a given user."""
+    sb = await get_client()
+    response = await sb.table("tasks")\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .execute()
+
+    return response.data if response.data else []
+
+async def get_due_tasks(
+        now: str = None,
+        limit: int = 500,
+        cursor: str = None
+) -> tuple[list[dict], str]:
+    """
+    Retrieves one page of due tasks across all users, oldest due first.
+    See supabase_db.get_due_tasks.
+    """
+    after_ts, after_id = None, None
+    if cursor:
+        after_ts, after_id = cursor.rsplit("|", 1)
+        after_id = int(after_id)
+
+    sb = await get_client()
+    response = await sb.rpc("get_due_tasks", {
+        "p_now": now or datetime.now(timezone.utc).isoformat(),
+        "p_limit": limit,
+        "p_after_ts": after_ts,
+        "p_after_id": after_id
+    }).execute()
+
+    tasks = response.data if response.data else []
+    next_cursor = f"{tasks[-1]['next_run_ts']}|{tasks[-1]['id']}" if len(tasks) == limit else None
+    return tasks, next_cursor
+
+async def get_tasks_by_ids(task_ids: list[int]) -> list[dict]:
+    """Retrieves the given tasks by ID."""
+    if not task_ids:
+        return []
+    sb = await get_client()
+    response = await sb.table("tasks")\
+        .select(TASK_COLUMNS)\
+        .in_("id", task_ids)\
+        .execute()
+
+    return response.data if response.data else []
+
+async def get_recent_chat_messages(
+        user_id: str,
+        limit: int = 5,
+        offset: int = 0
+) -> list[dict]:
+    """Retrieves only the message text and timestamp of the latest chat messages, newest first."""
+    sb = await get_client()
+    response = await sb.table("compact_chat")\
+        .select("message:context->>message, role:context->>role, timestamp")\
+        .eq("user_id", user_id)\
+        .order("timestamp", desc=True)\
+        .range(offset, offset + limit - 1)\
+        .execute()
+    return response.data if response.data else []
+
+async def get_chat_summary(user_id: str) -> dict:
+    """Retrieves the rolling chat summary for a given user."""
+    sb = await get_client()
+    response = await sb.table("chat_summaries")\
+        .select("summary, message_count, summarized_until")\
+        .eq("user_id", user_id)\
+        .limit(1)\
+        .execute()
+    return response.data[0] if response.data else {"summary": "", "message_count": 0, "summarized_until": None}
@@ -1,20 +1,43 @@
 from fastapi import Depends, HTTPException
-from supabase_auth.errors import AuthApiError
-from supabase import create_client
 from dotenv import load_dotenv
 import os
+from datetime import datetime, timezone
+from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from backend import clients
+from backend.log import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 security = HTTPBearer(auto_error=False)
 
-print("Connecting to Supabase...")
-sb = create_client(
-    supabase_url=os.getenv("SUPABASE_URL"),
-    supabase_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-)
-print("Connected to Supabase. (if this prints more than once, you're cooked)")
+
+def _connect():
+    from supabase import create_client
+
+    logger.info("Connecting to Supabase...")
+    return create_client(
+        supabase_url=os.getenv("SUPABASE_URL"),
+        supabase_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    )
+
+
+clients.register("supabase", _connect)
+
+
+def get_client():
+    """The shared Supabase client, connected on first use."""
+    return clients.get("supabase")
+
+
+def __getattr__(name: str):
+    # supabase_db.sb used to be created at import time
+    if name == "sb":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def authenticate_user(
         credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -22,8 +45,10 @@ def authenticate_user(
     if not credentials:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+    from supabase_auth.errors import AuthApiError
+
     try:
-        user = sb.auth.get_user(credentials.credentials)
+        user = get_client().auth.get_user(credentials.credentials)
         return user.user.id
     except AuthApiError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -35,7 +60,7 @@ def add_user(
         calendar_url: str
 ):
     """Adds a new user to the database with the given context."""
-    sb.table("users")\
+    get_client().table("users")\
         .insert({
             "id": user_id,
             "context": context,
@@ -48,7 +73,7 @@ def set_user_token(
         token: dict
 ):
     """Sets the token for a given user."""
-    sb.table("users")\
+    get_client().table("users")\
         .update({"google_token": token})\
         .eq("id", user_id)\
         .execute()
@@ -58,14 +83,14 @@ def set_user_context(
         context: dict
 ):
     """Updates the context for a given user."""
-    sb.table("users")\
+    get_client().table("users")\
         .update({"context": context})\
         .eq("id", user_id)\
         .execute()
 
 def get_user_context(user_id: str) -> dict:
     """Retrieves the context for a given user."""
-    response = sb.table("users")\
+    response = get_client().table("users")\
         .select("context, preferences, calendar_url, google_token")\
         .eq("id", user_id)\
         .single()\
@@ -86,7 +111,7 @@ def add_task(
         period: str = "1 HOUR"
 ):
     """Adds a new task for the user with the given context and period."""
-    response = sb.table("tasks")\
+    response = get_client().table("tasks")\
         .insert({
             "title": title,
             "user_id": user_id,
@@ -100,19 +125,103 @@ def add_task(
     
 def get_tasks(user_id: str) -> list[dict]:
     """Retrieves all tasks for a given user."""
-    response = sb.table("tasks")\
+    response = get_client().table("tasks")\
         .select("*")\
         .eq("user_id", user_id)\
         .execute()
 
     return response.data if response.data else []
 
+def add_tasks(
+        user_id: str,
+        tasks: list[dict]
+) -> list[dict]:
+    """
+    Adds several tasks for the user in one insert. Each task dict has
+    title, context, type_ and optionally period (default "1 HOUR").
+    """
+    if not tasks:
+        return []
+    response = get_client().table("tasks")\
+        .insert([
+            {
+                "title": task["title"],
+                "user_id": user_id,
+                "context": task["context"],
+                "type": task["type_"],
+                "period": task.get("period", "1 HOUR"),
+                "last_run_ts": "now()"
+            } for task in tasks
+        ]).execute()
+
+    return response.data if response.data else []
+
+TASK_COLUMNS = "id, user_id, type, title, context, state, period, last_run_ts"
+
+def get_all_tasks(page_size: int = 1000) -> list[dict]:
+    """Retrieves every task across all users, paged by id."""
+    tasks = []
+    last_id = None
+    while True:
+        query = get_client().table("tasks")\
+            .select(TASK_COLUMNS)\
+            .order("id")\
+            .limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        response = query.execute()
+        page = response.data if response.data else []
+        tasks.extend(page)
+        if len(page) < page_size:
+            return tasks
+        last_id = page[-1]["id"]
+
+def get_due_tasks(
+        now: str = None,
+        limit: int = 500,
+        cursor: str = None
+) -> tuple[list[dict], str]:
+    """
+    Retrieves one page of tasks across all users whose last_run_ts + period is
+    at or before `now` (default: current time), oldest due first.
+
+    Backed by the get_due_tasks RPC (migrations/002_due_tasks.sql, updated in
+    004_task_state.sql). Returns the page and a cursor for the next one, or
+    None when there are no more.
+    """
+    after_ts, after_id = None, None
+    if cursor:
+        after_ts, after_id = cursor.rsplit("|", 1)
+        after_id = int(after_id)
+
+    response = get_client().rpc("get_due_tasks", {
+        "p_now": now or datetime.now(timezone.utc).isoformat(),
+        "p_limit": limit,
+        "p_after_ts": after_ts,
+        "p_after_id": after_id
+    }).execute()
+
+    tasks = response.data if response.data else []
+    next_cursor = f"{tasks[-1]['next_run_ts']}|{tasks[-1]['id']}" if len(tasks) == limit else None
+    return tasks, next_cursor
+
+def get_tasks_by_ids(task_ids: list[int]) -> list[dict]:
+    """Retrieves the given tasks by ID."""
+    if not task_ids:
+        return []
+    response = get_client().table("tasks")\
+        .select(TASK_COLUMNS)\
+        .in_("id", task_ids)\
+        .execute()
+
+    return response.data if response.data else []
+
 def delete_task(
         task_id: int,
         user_id: str
 ):
     """Deletes a task by its ID for the given user."""
-    sb.table("tasks")\
+    get_client().table("tasks")\
         .delete()\
         .eq("id", task_id)\
         .eq("user_id", user_id)\
@@ -124,51 +233,156 @@ def update_task(
         context: dict
 ):
     """Updates a task's context and period by its ID for the given user."""
-    sb.table("tasks")\
+    get_client().table("tasks")\
         .update({"context": context})\
         .eq("id", task_id)\
         .eq("user_id", user_id)\
         .execute()
     
+def set_task_states(
+        states: dict[int, dict]
+):
+    """Replaces the run state (migrations/004_task_state.sql) of each task in {task_id: state}."""
+    for task_id, state in states.items():
+        get_client().table("tasks")\
+            .update({"state": state})\
+            .eq("id", task_id)\
+            .execute()
+
 def add_task_log(
         task_id: int,
         context: dict
 ):
     """Adds a log entry for a given task."""
-    sb.table("task_logs")\
+    get_client().table("task_logs")\
         .insert({
             "task_id": task_id,
             "context": context,
             "timestamp": "now()"
         }).execute()
     
+def add_task_logs(rows: list[dict]):
+    """Inserts several task log rows ({task_id, context, timestamp}) at once."""
+    if rows:
+        get_client().table("task_logs").insert(rows).execute()
+
 def mark_tasks_ran(
         task_ids: list[int]
 ):
     """Updates the last_run_ts for the given task IDs to now."""
-    sb.table("tasks")\
+    get_client().table("tasks")\
         .update({"last_run_ts": "now()"})\
         .in_("id", task_ids)\
         .execute()
 
+def acquire_user_lease(
+        user_id: str,
+        holder: str,
+        ttl_seconds: int
+) -> bool:
+    """Takes the user's execution lease if it is free or expired (migrations/003_user_leases.sql)."""
+    response = get_client().rpc("acquire_user_lease", {
+        "p_user_id": user_id,
+        "p_holder": holder,
+        "p_ttl_seconds": ttl_seconds
+    }).execute()
+    return bool(response.data)
+
+def release_user_lease(
+        user_id: str,
+        holder: str
+):
+    """Releases the user's execution lease if `holder` still holds it."""
+    get_client().table("user_leases")\
+        .delete()\
+        .eq("user_id", user_id)\
+        .eq("holder", holder)\
+        .execute()
+
 def add_chat_message(
         user_id: str,
         context: dict
 ):
     """Adds a chat message for the given user."""
-    sb.table("compact_chat")\
+    get_client().table("compact_chat")\
         .insert({
             "user_id": user_id,
             "context": context,
             "timestamp": "now()"
         }).execute()
     
+def add_chat_messages(rows: list[dict]):
+    """Inserts several chat message rows ({user_id, context, timestamp}) at once."""
+    if rows:
+        get_client().table("compact_chat").insert(rows).execute()
+
+def get_recent_chat_messages(
+        user_id: str,
+        limit: int = 5,
+        offset: int = 0
+) -> list[dict]:
+    """Retrieves only the message text and timestamp of the latest chat messages, newest first."""
+    response = get_client().table("compact_chat")\
+        .select("message:context->>message, role:context->>role, timestamp")\
+        .eq("user_id", user_id)\
+        .order("timestamp", desc=True)\
+        .range(offset, offset + limit - 1)\
+        .execute()
+    return response.data if response.data else []
+
+def get_chat_messages_between(
+        user_id: str,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 200
+) -> list[dict]:
+    """Retrieves the message text, role and timestamp of chat messages strictly between two timestamps, oldest first."""
+    query = get_client().table("compact_chat")\
+        .select("message:context->>message, role:context->>role, timestamp")\
+        .eq("user_id", user_id)
+    if after:
+        query = query.gt("timestamp", after)
+    if before:
+        query = query.lt("timestamp", before)
+    response = query.order("timestamp").limit(limit).execute()
+    return response.data if response.data else []
+
+def get_chat_summary(user_id: str) -> dict:
+    """Retrieves the rolling chat summary for a given user."""
+    response = get_client().table("chat_summaries")\
+        .select("summary, message_count, summarized_until")\
+        .eq("user_id", user_id)\
+        .limit(1)\
+        .execute()
+    return response.data[0] if response.data else {"summary": "", "message_count": 0, "summarized_until": None}
+
+def update_chat_summary(
+        user_id: str,
+        summary: str,
+        message_count: int,
+        summarized_until: str,
+        previous_count: int
+) -> bool:
+    """
+    Stores the rolling chat summary for a given user if its message_count is
+    still `previous_count` (migrations/005_chat_summary_watermark.sql).
+    Returns whether it was written.
+    """
+    response = get_client().rpc("update_chat_summary", {
+        "p_user_id": user_id,
+        "p_summary": summary,
+        "p_message_count": message_count,
+        "p_summarized_until": summarized_until,
+        "p_previous_count": previous_count
+    }).execute()
+    return bool(response.data)
+
 def get_chat_messages(
         user_id: str,
         limit: int = 20
 ) -> list[dict]:
     """Retrieves the latest chat messages for a given user."""
-    response = sb.table("compact_chat")\
+    response = get_client().table("compact_chat")\
         .select("*")\
         .eq("user_id", user_id)\
         .order("timestamp", desc=True)\
@@ -0,0 +1,212 @@
+"""
+Write-Behind Buffers
+====================
+task_logs and compact_chat rows are append-only and nobody waits on them, so
+instead of one insert per event they are queued in memory and written by a
+background thread in bulk inserts:
+
+- a batch is flushed when it reaches FLUSH_ROWS rows or FLUSH_INTERVAL
+  seconds after its first row, whichever comes first
+- failed batches go to a bounded retry queue and are retried with backoff;
+  past MAX_ATTEMPTS (or when the retry queue is full) rows are dropped and
+  counted in metrics
+- backpressure: when MAX_PENDING rows are already waiting, add() blocks for up
+  to BACKPRESSURE_TIMEOUT, then queues the row anyway and writes the oldest
+  batch itself, so a stuck database slows producers down instead of growing
+  memory without bound
+- batches are taken and written under one lock, whichever thread writes
+  them, so inserts never overlap; a batch waiting in the retry queue can
+  still land after newer ones, so readers order rows by their timestamp,
+  not by insert order
+- flush_all() drains everything (called on app shutdown and at exit)
+
+Rows get their timestamp when they are queued, not when they are flushed.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import backend.database.supabase_db as sb
+from backend import metrics
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+FLUSH_ROWS = int(os.getenv("WRITE_BUFFER_FLUSH_ROWS", "100"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "1.0"))
+MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "5000"))
+MAX_RETRY_BATCHES = int(os.getenv("WRITE_BUFFER_MAX_RETRY_BATCHES", "50"))
+MAX_ATTEMPTS = 5
+BACKPRESSURE_TIMEOUT = 0.5
+
+
+class WriteBuffer:
+    """Queues rows for one table and inserts them in the background."""
+
+    def __init__(
+        self,
+        table: str,
+        insert: Callable[[list[dict]], None],
+        on_flush: Optional[Callable[[list[dict]], None]] = None
+    ):
+        self.table = table
+        self._insert = insert
+        self.on_flush = on_flush
+        self._rows: list[dict] = []
+        self._first_at: Optional[float] = None
+        self._retries: deque = deque()  # (rows, attempts, not_before)
+        self._inflight: list[dict] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=f"write-buffer-{self.table}", daemon=True)
+            self._thread.start()
+
+    def add(self, row: dict):
+        """Queue one row; only blocks if the buffer is full."""
+        with self._cond:
+            self._ensure_thread()
+            deadline = time.monotonic() + BACKPRESSURE_TIMEOUT
+            while len(self._rows) >= MAX_PENDING:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            else:
+                if not self._rows:
+                    self._first_at = time.monotonic()
+                self._rows.append(row)
+                if len(self._rows) == 1 or len(self._rows) >= FLUSH_ROWS:
+                    self._cond.notify_all()
+                return
+
+        # Still full: pay for a batch ourselves rather than queue without bound
+        with self._cond:
+            self._rows.append(row)
+        metrics.increment("write_buffer_backpressure", table=self.table)
+        self._flush_next()
+
+    def pending(self, **match) -> list[dict]:
+        """Queued (not yet written) rows whose fields equal `match`, oldest first."""
+        with self._cond:
+            rows = [r for batch, _, _ in self._retries for r in batch] + self._inflight + self._rows
+        return [r for r in rows if all(r.get(k) == v for k, v in match.items())]
+
+    def _take_batch(self) -> list[dict]:
+        batch, self._rows = self._rows[:FLUSH_ROWS], self._rows[FLUSH_ROWS:]
+        self._first_at = time.monotonic() if self._rows else None
+        self._cond.notify_all()
+        return batch
+
+    def _next_wait(self) -> Optional[float]:
+        now = time.monotonic()
+        waits = []
+        if self._rows:
+            if len(self._rows) >= FLUSH_ROWS:
+                return 0
+            waits.append(self._first_at + FLUSH_INTERVAL - now)
+        if self._retries:
+            waits.append(self._retries[0][2] - now)
+        return max(min(waits), 0) if waits else None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                wait = self._next_wait()
+                while wait != 0:
+                    self._cond.wait(timeout=wait)
+                    wait = self._next_wait()
+            self._flush_next()
+
+    def _flush_next(self):
+        """Write the next due batch (a retry, else the oldest queued rows)."""
+        with self._flush_lock:
+            with self._cond:
+                if self._retries and self._retries[0][2] <= time.monotonic():
+                    batch, attempts, _ = self._retries.popleft()
+                else:
+                    batch, attempts = self._take_batch(), 0
+                self._inflight = batch
+            try:
+                self._flush_batch(batch, attempts)
+            finally:
+                with self._cond:
+                    self._inflight = []
+                    self._cond.notify_all()
+
+    def _write(self, rows: list[dict]):
+        self._insert(rows)
+        metrics.increment("write_buffer_rows_written", len(rows), table=self.table)
+        if self.on_flush:
+            try:
+                self.on_flush(rows)
+            except Exception as e:
+                logger.warning("⚠️ %s post-flush hook failed: %s", self.table, e)
+
+    def _flush_batch(self, batch: list[dict], attempts: int) -> bool:
+        if not batch:
+            return True
+        try:
+            self._write(batch)
+            return True
+        except Exception as e:
+            attempts += 1
+            metrics.increment("write_buffer_failures", table=self.table)
+            with self._cond:
+                if attempts >= MAX_ATTEMPTS or len(self._retries) >= MAX_RETRY_BATCHES:
+                    metrics.increment("write_buffer_rows_dropped", len(batch), table=self.table)
+                    logger.error("❌ Dropping %d %s rows after %d attempt(s): %s", len(batch), self.table, attempts, e)
+                else:
+                    backoff = min(2 ** attempts, 30)
+                    self._retries.append((batch, attempts, time.monotonic() + backoff))
+                    logger.warning("⚠️ %s insert failed, retrying %d rows in %ss: %s", self.table, len(batch), backoff, e)
+            return False
+
+    def flush(self):
+        """Write everything queued right now, including pending retries (one attempt each)."""
+        with self._flush_lock:
+            with self._cond:
+                batches = [batch for batch, _, _ in self._retries]
+                self._retries.clear()
+                while self._rows:
+                    batches.append(self._take_batch())
+            for batch in batches:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    metrics.increment("write_buffer_rows_dropped", len(batch), table=self.table)
+                    logger.error("❌ Dropping %d %s rows on flush: %s", len(batch), self.table, e)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+task_log_buffer = WriteBuffer("task_logs", sb.add_task_logs)
+chat_buffer = WriteBuffer("compact_chat", sb.add_chat_messages)
+
+
+def log_task(task_id: int, context: dict):
+    """Buffered add_task_log."""
+    task_log_buffer.add({"task_id": task_id, "context": context, "timestamp": _now()})
+
+
+def log_chat_message(user_id: str, context: dict):
+    """Buffered add_chat_message."""
+    chat_buffer.add({"user_id": user_id, "context": context, "timestamp": _now()})
+
+
+def flush_all():
+    task_log_buffer.flush()
+    chat_buffer.flush()
+
+
+atexit.register(flush_all)
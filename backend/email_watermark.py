@@ -0,0 +1,150 @@
+"""
+Email Watermarks
+================
+Each EMAIL task remembers the newest message it has already been run with,
+in its run state (tasks.state, migrations/004_task_state.sql):
+
+    {"email_watermark": {"internal_date": 1760000000000, "ids": ["18c...", ...]}}
+
+internal_date is Gmail's internalDate (ms) of the newest processed message,
+ids the messages received at that instant (so a message landing in the same
+millisecond isn't lost). The prefetch only asks Gmail for unread mail after
+the oldest watermark of the run's EMAIL tasks, and an EMAIL task with nothing
+new since its watermark (or nothing new that scores as relevant, see
+tools/email/relevance.py) is marked as ran without an agent call. Unread
+mail the user hasn't opened yet is therefore analysed once, not every period.
+Task lists posted to the cron endpoint get their EMAIL tasks' state re-read
+from the database (with_stored_states), so a caller can't reset a watermark
+by leaving it out.
+
+The prefetch (email_fetcher.get_unread_backlog) reports the window of
+internal dates it fetched without a gap. A watermark only moves inside that
+window, so mail that failed to fetch, or was left for a later run because
+more than PREFETCH_MAX_EMAILS arrived, is still new next time.
+"""
+
+from typing import Optional
+
+from backend.tools.email import relevance
+
+STATE_KEY = "email_watermark"
+MAX_IDS = 50
+
+
+def is_email_task(task: dict) -> bool:
+    return str(task.get("type", "")).upper() == "EMAIL"
+
+
+def get_watermark(task: dict) -> Optional[dict]:
+    """The task's watermark, or None if it hasn't processed any email yet."""
+    return (task.get("state") or {}).get(STATE_KEY)
+
+
+def with_stored_states(tasks: list[dict], stored: list[dict]) -> list[dict]:
+    """`tasks` with each EMAIL task's state taken from its stored row (`stored`, matched by id)."""
+    states = {row["id"]: row.get("state") for row in stored}
+    return [
+        {**task, "state": states[task["id"]]} if is_email_task(task) and task.get("id") in states else task
+        for task in tasks
+    ]
+
+
+def since(tasks: Optional[list]) -> Optional[int]:
+    """
+    Unix time (seconds) to pass as Gmail's after: for a run of `tasks`.
+
+    Returns:
+        A second before the oldest EMAIL task watermark, or None (fetch all
+        unread) if any EMAIL task has none yet
+    """
+    dates = []
+    for task in tasks or []:
+        if is_email_task(task):
+            watermark = get_watermark(task)
+            if not watermark:
+                return None
+            dates.append(watermark["internal_date"])
+    # after: has second granularity; is_new() drops what was already seen
+    return min(dates) // 1000 - 1 if dates else None
+
+
+def is_new(message: dict, watermark: Optional[dict]) -> bool:
+    if not watermark:
+        return True
+    date = message.get("internal_date", 0)
+    return date > watermark["internal_date"] or (
+        date == watermark["internal_date"] and message["id"] not in watermark.get("ids", [])
+    )
+
+
+def advance(watermark: Optional[dict], emails: list[dict], window: Optional[dict] = None) -> Optional[dict]:
+    """
+    Watermark after processing `emails`; unchanged if none is newer.
+
+    Args:
+        watermark: The task's current watermark
+        emails: The emails the task was run with
+        window: The fetch window (email_fetcher.get_unread_backlog); if given,
+                the watermark only moves if the window reaches back to it,
+                and never past window["to"]
+    """
+    if window is not None:
+        if window["to"] is None or (watermark and watermark["internal_date"] < window["from"]):
+            return watermark
+        emails = [m for m in emails if m.get("internal_date", 0) <= window["to"]]
+    newest = max((m.get("internal_date", 0) for m in emails if is_new(m, watermark)), default=None)
+    if newest is None:
+        return watermark
+    ids = [m["id"] for m in emails if m.get("internal_date", 0) == newest]
+    if watermark and watermark["internal_date"] == newest:
+        ids = watermark.get("ids", []) + ids
+    return {"internal_date": newest, "ids": ids[-MAX_IDS:]}
+
+
+def split_idle(tasks: list[dict], emails: Optional[list]) -> tuple[list[dict], list[dict], Optional[list]]:
+    """
+    Separate EMAIL tasks with no new relevant mail from the ones worth an
+    agent run. Each task keeps its top relevance.for_task() picks of the
+    mail past its watermark.
+
+    Args:
+        tasks: The run's tasks
+        emails: Prefetched unread emails; None if the fetch didn't happen or
+                failed, in which case every task runs as before
+
+    Returns:
+        (tasks to run, idle EMAIL tasks, the emails picked for the tasks to run,
+        best first)
+    """
+    if emails is None:
+        return tasks, [], None
+
+    active, idle, picked = [], [], {}
+    for task in tasks:
+        if not is_email_task(task):
+            active.append(task)
+            continue
+        fresh = relevance.for_task(task, [m for m in emails if is_new(m, get_watermark(task))])
+        if fresh:
+            active.append(task)
+            for message in fresh:
+                if message["relevance"] > picked.get(message["id"], {}).get("relevance", float("-inf")):
+                    picked[message["id"]] = message
+        else:
+            idle.append(task)
+    return active, idle, sorted(picked.values(), key=lambda m: -m["relevance"])
+
+
+def advanced_states(tasks: list[dict], emails: Optional[list], window: Optional[dict] = None) -> dict[int, dict]:
+    """{task_id: new state} for the EMAIL tasks whose watermark moved after a run over `emails`."""
+    states = {}
+    if not emails:
+        return states
+    for task in tasks:
+        if not is_email_task(task) or task.get("id") is None:
+            continue
+        watermark = get_watermark(task)
+        moved = advance(watermark, emails, window)
+        if moved != watermark:
+            states[task["id"]] = {**(task.get("state") or {}), STATE_KEY: moved}
+    return states
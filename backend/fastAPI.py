@@ -1,21 +1,82 @@
 import asyncio
 import os
 from pydantic import BaseModel
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Callable
 from fastapi import Body, FastAPI, HTTPException, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from collections import defaultdict
+from datetime import datetime, timezone
 from backend.models import Task, TaskResponse, Context, UserToken, UserOnboarding, AgentResponse
-from ai_sdk import generate_object, openai
+from ai_sdk import generate_object
 from dotenv import load_dotenv
 import backend.database.supabase_db as sb
+import backend.database.supabase_async as asb
+from backend.database.write_buffer import flush_all, log_task
 from backend.agent import scrape_webpage_tool, run_tasks_with_agent, chat_with_agent as agent_chat
+from backend.streaming import stream_events
+from backend.tools.context import ToolContext
+from backend.prefetch import astart_agent_setup, start_agent_setup, format_prefetched
+from backend.chat_memory import record_chat_message, format_chat_context
+from backend.scheduler import get_scheduler, start_scheduler, stop_scheduler
+from backend.user_lease import UserBusyError, submit_tasks, user_lease
+from backend import clients, email_watermark, metrics, rate_limit, token_manager
+from backend.http_metrics import MetricsMiddleware
+from backend.circuit_breaker import CircuitOpenError, all_status as circuit_status
+from backend.log import get_logger
+from backend.model_router import MODEL_CALL_RETRIES, Router
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 app = FastAPI()
 
 
+@app.on_event("startup")
+def start_task_scheduler():
+    """Runs due tasks in-process instead of waiting for the cron caller (opt-in)."""
+    if os.getenv("ENABLE_TASK_SCHEDULER", "").lower() in ("1", "true", "yes"):
+        start_scheduler(run_user_tasks)
+
+@app.on_event("shutdown")
+def stop_task_scheduler():
+    stop_scheduler()
+
+@app.on_event("startup")
+def start_token_refresher():
+    """Refreshes users' Google tokens in the background before they expire."""
+    token_manager.start_refresher()
+
+@app.on_event("shutdown")
+def stop_token_refresher():
+    token_manager.stop_refresher()
+
+@app.on_event("startup")
+async def warm_up_clients():
+    """Creates the Supabase, Google and Firecrawl clients in the background (opt-in)."""
+    if os.getenv("WARM_UP_CLIENTS", "").lower() in ("1", "true", "yes"):
+        clients.warm_up()
+
+        async def connect_async():
+            try:
+                await asb.get_client()
+            except Exception as e:
+                logger.warning("⚠️ Warm-up of async Supabase client failed: %s", e)
+
+        # Held on app.state so the task isn't garbage collected mid-connect
+        app.state.async_warm_up = asyncio.create_task(connect_async())
+
+@app.on_event("shutdown")
+async def close_supabase():
+    await asb.close()
+
+@app.on_event("shutdown")
+def flush_write_buffers():
+    flush_all()
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],   # very permissive setting that tells browsers to allow requests from any domain. convenient for development but should be restricted to the actual frontend's domain in a production environment for security.
@@ -24,6 +85,9 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
+# Added last so it is outermost and also times CORS preflights
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 @app.post("/api/task/create")
 def create_task(
     task: Task,
@@ -38,19 +102,47 @@ def create_task(
         period=task.period
     )
 
-    context = sb.get_user_context(user_id)
-    chats = sb.get_chat_messages(user_id)
+    _run_new_tasks(user_id, [added_task])
+
+@app.post("/api/tasks/bulk")
+def create_tasks_bulk(
+    tasks: list[Task],
+    user_id: str = Depends(sb.authenticate_user)
+):
+    """Creates several tasks in one insert and gives them a single first agent run."""
+    added_tasks = sb.add_tasks(user_id, [
+        {
+            "title": task.title,
+            "type_": task.type.value,
+            "context": task.context.model_dump(mode="json"),
+            "period": task.period
+        } for task in tasks
+    ])
+
+    _run_new_tasks(user_id, added_tasks)
+    return {"ids": [added["id"] for added in added_tasks]}
 
-    response = run_tasks_with_agent(user_id, [task.model_dump(mode="json")], context, chats)
-    print(f"Agent response: {response['text']}")
-    sb.mark_tasks_ran([added_task['id']])
+def _run_new_tasks(user_id: str, added_tasks: list[dict]):
+    """First run for freshly created tasks: one agent call covering all of them."""
+    if not added_tasks:
+        return
+
+    # Same path as scheduled runs, so it queues behind (or joins) a run already in progress
+    run_user_tasks(user_id, [
+        {key: value for key, value in added.items() if key != "user_id"} for added in added_tasks
+    ])
+
+    if get_scheduler():
+        now = datetime.now(timezone.utc).isoformat()
+        for added in added_tasks:
+            get_scheduler().add_task({**added, "last_run_ts": now})
 
 @app.get("/api/tasks", response_model=list[TaskResponse])
-def get_tasks(
+async def get_tasks(
     user_id: str = Depends(sb.authenticate_user)
 ):
     """Retrieves all tasks for the authenticated user."""
-    user_tasks = sb.get_tasks(user_id)
+    user_tasks = await asb.get_tasks(user_id)
     return [
         TaskResponse(
             id_=task["id"],
@@ -68,15 +160,17 @@ def add_user_token(
     user_id: str = Depends(sb.authenticate_user)
 ):
     """Adds a token for the authenticated user."""
-    sb.set_user_token(user_id, token.model_dump(mode="json"))
+    token_data = token.model_dump(mode="json")
+    sb.set_user_token(user_id, token_data)
+    token_manager.track(user_id, token_data)
 
 @app.get("/api/users/onboard")
-def get_whether_user_onboarded(
+async def get_whether_user_onboarded(
     user_id: str = Depends(sb.authenticate_user)
 ):
     """Checks if the user is onboarded by retrieving their context."""
     try:
-        sb.get_user_context(user_id)
+        await asb.get_user_context(user_id)
         return True
     except Exception as e:
         return False
@@ -98,26 +192,127 @@ def onboard_user(
         sb.set_user_token(user_id, onboarding_data.google_token)
 
 @app.post("/api/cron/run-tasks")
-def run_scheduled_tasks(tasks = Body(...)):
-    """Endpoint to be called by a cron job to run scheduled tasks."""
-    print("Received tasks:", tasks['tasks'])
+async def run_scheduled_tasks(tasks = Body(None)):
+    """
+    Endpoint to be called by a cron job to run scheduled tasks.
+    If the body has no task list, the due set is read from the database
+    page by page instead (asb.get_due_tasks).
+    """
+    if not tasks or "tasks" not in tasks:
+        cursor = None
+        while True:
+            page, cursor = await asb.get_due_tasks(cursor=cursor)
+            logger.info("Found %d due tasks", len(page))
+            await _run_task_batch(page)
+            if not cursor:
+                return
+    
+    logger.info("Received %d task(s)", len(tasks['tasks']))
+    logger.debug("Received tasks: %s", tasks['tasks'])
+    await _run_task_batch(await _with_stored_states(tasks['tasks']))
+
+
+async def _with_stored_states(tasks: list[dict]) -> list[dict]:
+    """Posted tasks with their EMAIL watermarks read from the database rather than the request body."""
+    ids = [task["id"] for task in tasks if email_watermark.is_email_task(task) and task.get("id") is not None]
+    if not ids:
+        return tasks
+    try:
+        return email_watermark.with_stored_states(tasks, await asb.get_tasks_by_ids(ids))
+    except Exception as e:
+        logger.warning("⚠️ Couldn't re-read the state of %d EMAIL task(s), using the posted one: %s", len(ids), e)
+        return tasks
+
+
+async def _run_task_batch(tasks: list[dict]):
+    """Groups tasks by user and runs each user's tasks through the agent."""
     user_tasks = defaultdict(list)
 
-    for task in tasks['tasks']:
+    for task in tasks:
         user_id = task.pop('user_id')
         user_tasks[user_id].append(task)
 
-    for user_id, tasks in user_tasks.items():
-        print(f"Running tasks for user {user_id}:")
-        context = sb.get_user_context(user_id)
-        chats = sb.get_chat_messages(user_id)
-        
+    # Users run one after another; each one's setup (context, chat history and
+    # Google prefetch) loads while the previous user runs, so no snapshot is
+    # more than one run old and at most two are held at a time
+    async def setup_for(user_id: str, tasks: list[dict]):
+        try:
+            return await astart_agent_setup(user_id, tasks)
+        except Exception as e:
+            logger.warning("⚠️ Setup for user %s failed, loading it at run time: %s", user_id, e)
+            return None
+
+    users = list(user_tasks.items())
+    upcoming = asyncio.create_task(setup_for(*users[0])) if users else None
+    for i, (user_id, tasks) in enumerate(users):
+        setup = await upcoming
+        if i + 1 < len(users):
+            upcoming = asyncio.create_task(setup_for(*users[i + 1]))
+        await run_in_threadpool(run_user_tasks, user_id, tasks, setup)
+
+
+def run_user_tasks(user_id: str, tasks: list[dict], setup=None):
+    """
+    Runs one user's due tasks through the agent and marks them as ran.
+    Holds the user's lease; if a task run for the user is already going, the
+    tasks are folded into its next batch instead of running in parallel.
+    """
+    @rate_limit.acting_for(user_id)
+    def run(batch: list[dict], waited: bool):
+        logger.info("Running tasks for user %s", user_id)
+        # The preloaded calendar is stale if another run held the lease meanwhile
+        same_tasks = {task.get("id") for task in batch} == {task.get("id") for task in tasks}
+        batch_setup = setup if setup and same_tasks and not waited else start_agent_setup(user_id, batch)
+        context, chats, prefetched = batch_setup.wait()
+
+        # EMAIL tasks with nothing relevant past their watermark don't need the agent
+        emails = prefetched.get("emails")
+        batch, idle, prefetched["emails"] = email_watermark.split_idle(batch, emails)
+        if emails:
+            metrics.increment("emails_filtered_out", len(emails) - len(prefetched["emails"]))
+        if idle:
+            idle_ids = [task.get("id") for task in idle]
+            metrics.increment("email_tasks_skipped", len(idle))
+            logger.info("📭 No new relevant emails for %d EMAIL task(s) of user %s, skipping them", len(idle), user_id)
+            # Irrelevant new mail still moves the watermark, so it isn't scored again next run
+            sb.set_task_states(email_watermark.advanced_states(idle, emails, prefetched.get("email_window")))
+            sb.mark_tasks_ran(idle_ids)
+            _log_task_run(idle_ids, {"text": "Skipped: no new relevant emails since the last run"})
+        if not batch:
+            return
+
         # Run all tasks through the agent
-        response = run_tasks_with_agent(user_id, tasks, context, chats)
-        print(f"Agent response: {response['text']}")
-        
-        ids = [task.get("id") for task in tasks]
+        response = run_tasks_with_agent(user_id, batch, context, chats, prefetched=prefetched)
+        logger.debug("Agent response: %s", response['text'])
+
+        ids = [task.get("id") for task in batch]
+        sb.set_task_states(email_watermark.advanced_states(batch, emails, prefetched.get("email_window")))
         sb.mark_tasks_ran(ids)
+        _log_task_run(ids, response)
+
+    if not submit_tasks(user_id, tasks, run):
+        logger.info("🔗 User %s already has a task run in progress, %d task(s) queued onto it", user_id, len(tasks))
+
+
+def _log_task_run(ids: list[int], response: dict):
+    """One task_logs row per task for this agent run (write-behind, off the request path)."""
+    entry = {
+        "text": response.get("text", ""),
+        "tool_calls": [call["tool_name"] for call in response.get("tool_calls", [])],
+        "steps": len(response.get("steps", []))
+    }
+    for task_id in ids:
+        log_task(task_id, entry)
+
+@app.get("/api/health/circuits")
+def get_circuit_breakers():
+    """State of the circuit breaker for each upstream (Calendar, Gmail, Firecrawl, OpenRouter)."""
+    return circuit_status()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request, upstream and pipeline metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 # Configure OpenRouter as default for all OpenAI calls
 os.environ["OPENAI_BASE_URL"] = "https://openrouter.ai/api/v1"
@@ -140,6 +335,56 @@ async def chat_endpoint(
     - Reshuffling: Uses agent to optimize existing calendar
     - General questions: Fetches context and answers
     """
+    return await run_in_threadpool(handle_chat, request.message, user_id)
+
+
+@app.post("/api/agent/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    user_id: str = Depends(sb.authenticate_user)
+):
+    """
+    Streaming variant of /api/agent/chat using Server-Sent Events.
+    Emits `classification`, `tool_call_start`, `tool_call_finish` and `text`
+    events while the agent runs, then a `final` event with the AgentResponse.
+    """
+    return StreamingResponse(
+        stream_events(lambda emit: handle_chat(request.message, user_id, emit)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def handle_chat(
+    message: str,
+    user_id: str,
+    emit: Optional[Callable[[str, Any], None]] = None
+) -> AgentResponse:
+    """Classifies the chat message and runs the agent; shared by both chat endpoints."""
+    # Waits for any scheduled run touching this user's calendar to finish first
+    try:
+        with user_lease(user_id), rate_limit.acting_for(user_id):
+            response = _respond_to_chat(message, user_id, emit)
+    except UserBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Feed the turn into the rolling chat summary; never fail the reply over it
+    try:
+        record_chat_message(user_id, message, role="user")
+        record_chat_message(user_id, response.text, role="assistant")
+    except Exception as e:
+        logger.warning("⚠️ Failed to record chat turn: %s", e)
+
+    return response
+
+
+def _respond_to_chat(
+    message: str,
+    user_id: str,
+    emit: Optional[Callable[[str, Any], None]] = None
+) -> AgentResponse:
     
     # First, classify what the user wants
     classify_prompt = """Classify user requests. IF USER SAYS ANYTHING RESEMBLING A RECURRING TASK: RETURN "create_task".
@@ -159,42 +404,61 @@ For "create_task", you MUST provide complete Task objects with:
 For all others, just return text description, tasks can be null.
 """
 
-    model = openai(os.getenv("DEFAULT_MODEL"))
-    
+    # Load user context and calendar while the classifier runs
+    setup = start_agent_setup(user_id)
+
     try:
-        classification = generate_object(
-            model=model,
-            schema=AgentResponse,
-            prompt=request.message,
-            system=classify_prompt,
+        # Cheap model first; a reply that doesn't parse (or a create_task
+        # without tasks) escalates along the classify route
+        classification = Router("classify").call(
+            lambda model: rate_limit.call(
+                "openrouter",
+                generate_object,
+                model=model,
+                schema=AgentResponse,
+                prompt=message,
+                system=classify_prompt,
+                retries=MODEL_CALL_RETRIES,
+            ),
+            validate=lambda result: (
+                "create_task without tasks"
+                if result.object.type_.value == "create_task" and not result.object.tasks else None
+            )
         )
     except Exception as e:
         # If classification fails, default to no_task and use agent directly
-        print(f"⚠️ Classification failed: {e}, defaulting to no_task")
+        logger.warning("⚠️ Classification failed: %s, defaulting to no_task", e)
         classification = type('obj', (object,), {
             'object': AgentResponse(type_="no_task", text="", tasks=None)
         })
+
+    if emit:
+        emit("classification", classification.object)
     
     # Get user context
-    context = sb.get_user_context(user_id)
-    chats = sb.get_chat_messages(user_id)
+    context, chats, prefetched = setup.wait()
+    tools = ToolContext(user_id, token_data=context.get("google_token"))
     
     # Build context string
     context_str = f"""
 User Context:
 - Preferences: {context.get('preferences', [])}
 
-Recent Chat History:
-{chr(10).join([f"- {msg.get('context', {}).get('message', '')}" for msg in chats[-5:]])}
+{format_chat_context(chats)}
+
+{format_prefetched(prefetched)}
 """
     
     # Handle based on classification
     if classification.object.type_.value == "run_task":
-        print("🗓️ Handling one-off calendar event addition.")
+        logger.info("🗓️ Handling one-off calendar event addition.")
         # One-off task: Add to calendar using agent
         agent_response = agent_chat(
-            user_message=f"Add this to my calendar: {request.message}",
-            context_injection=context_str
+            user_message=f"Add this to my calendar: {message}",
+            context_injection=context_str,
+            on_event=emit,
+            tool_context=tools,
+            route="schedule"
         )
         return AgentResponse(
             type_=classification.object.type_,
@@ -203,11 +467,14 @@ Recent Chat History:
         )
     
     elif classification.object.type_.value == "reshuffle_calendar":
-        print("🔄 Reshuffling calendar as per user request.")
+        logger.info("🔄 Reshuffling calendar as per user request.")
         # Reshuffle calendar using agent
         agent_response = agent_chat(
-            user_message=f"Reshuffle my calendar based on: {request.message}",
-            context_injection=context_str
+            user_message=f"Reshuffle my calendar based on: {message}",
+            context_injection=context_str,
+            on_event=emit,
+            tool_context=tools,
+            route="reshuffle"
         )
         return AgentResponse(
             type_=classification.object.type_,
@@ -216,20 +483,23 @@ Recent Chat History:
         )
     
     elif classification.object.type_.value == "create_task":
-        print(f"📝 Creating recurring task: {classification.object}")
+        logger.info("📝 Creating recurring task: %s", classification.object)
         # Creating a recurring task - just classify and return
         return classification.object
     
     else:
         # General question - use agent with context
         agent_response = agent_chat(
-            user_message=request.message,
-            context_injection=context_str
+            user_message=message,
+            context_injection=context_str,
+            on_event=emit,
+            tool_context=tools,
+            route="summarize"
         )
         
         # Debug logging
-        print(f"🔍 Agent response text: {agent_response.get('text', 'NO TEXT')}")
-        print(f"🔍 Agent response keys: {agent_response.keys()}")
+        logger.debug("🔍 Agent response text: %s", agent_response.get('text', 'NO TEXT'))
+        logger.debug("🔍 Agent response keys: %s", list(agent_response.keys()))
         
         response_text = agent_response.get('text', '')
         if not response_text or response_text.strip() == '':
@@ -0,0 +1,72 @@
+"""
+HTTP Request Metrics
+====================
+ASGI middleware that records, per route template (e.g. /api/agent/chat):
+
+- http_request_duration_seconds: latency histogram {method, route}
+- http_requests_in_flight: gauge {method, route}
+- http_requests_total: counter {method, route, status}
+
+Paths that match no route are labelled route="unmatched" so random URLs
+can't grow the label set. It is a plain ASGI middleware rather than
+BaseHTTPMiddleware, so streamed responses pass straight through; per request
+it costs a cached route lookup, two clock reads and a few locked updates.
+"""
+
+import time
+
+from starlette.routing import Match
+
+from backend import metrics
+
+UNMATCHED = "unmatched"
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+MAX_CACHED_PATHS = 1000
+
+
+class MetricsMiddleware:
+    def __init__(self, app, routes: list):
+        self.app = app
+        # The router's live list, so routes registered after the middleware are seen too
+        self.routes = routes
+        self._templates: dict[tuple[str, str], str] = {}
+
+    def _route(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        template = UNMATCHED
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                template = getattr(route, "path", UNMATCHED)
+                break
+        if template != UNMATCHED and len(self._templates) < MAX_CACHED_PATHS:
+            self._templates[key] = template
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+        route = self._route(scope)
+        status = 500  # if the app raises before responding
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.gauge_add("http_requests_in_flight", 1, method=method, route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.gauge_add("http_requests_in_flight", -1, method=method, route=route)
+            metrics.histogram("http_request_duration_seconds", time.perf_counter() - start, method=method, route=route)
+            metrics.increment("http_requests", method=method, route=route, status=str(status))
@@ -0,0 +1,234 @@
+"""
+Structured Logging
+==================
+Thin layer over the stdlib logging module for every backend module:
+
+    from backend.log import get_logger
+    logger = get_logger(__name__)
+
+    logger.info("⏰ Scheduler running %d task(s) for user %s", len(tasks), user_id)
+    logger.debug("Full reasoning: %s", result.raw_response)
+
+Arguments are only formatted when a record is actually emitted, so a
+disabled debug() call costs a level check. Emitted messages are cut to
+LOG_MAX_CHARS, and records are handed to a background thread through a
+bounded queue, so the request path never blocks on stdout (records are
+dropped and counted in log_records_dropped if the queue is full).
+
+Configuration (env):
+- LOG_LEVEL: DEBUG / INFO / WARNING / ERROR (default INFO)
+- LOG_FORMAT: text or json (one JSON object per line)
+- LOG_MAX_CHARS: longest message kept (default 2000)
+- LOG_SAMPLE: per-category sampling of records below WARNING, e.g.
+  "tools=0.1,agent=0.5". A category is the module path without the
+  "backend." prefix and matches by prefix, so "tools" covers
+  tools.calendar.tools too. Warnings and errors are never sampled out.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+from backend import metrics
+
+ROOT = "backend"
+LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(category)s: %(message)s"
+
+_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """
+    Parse LOG_SAMPLE ("tools=0.1,agent=0.5") into {category: rate}.
+
+    Args:
+        spec: Comma-separated category=rate pairs, rates between 0 and 1
+
+    Returns:
+        Dict of category to rate; malformed entries are ignored
+    """
+    rates = {}
+    for part in spec.split(","):
+        category, _, rate = part.partition("=")
+        try:
+            rates[category.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+def _category(name: str) -> str:
+    if name == ROOT:
+        return ""
+    return name[len(ROOT) + 1:] if name.startswith(ROOT + ".") else name
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps roughly `rate` of each category's records below WARNING."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        # Longest prefix first so "tools.email=1" beats "tools=0.1"
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._cache: dict[str, float] = {}
+
+    def rate(self, category: str) -> float:
+        rate = self._cache.get(category)
+        if rate is None:
+            rate = 1.0
+            for prefix, prefix_rate in self.rates:
+                if category == prefix or category.startswith(prefix + "."):
+                    rate = prefix_rate
+                    break
+            self._cache[category] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.category)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        metrics.increment("log_records_sampled_out", category=record.category)
+        return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Formats the message once, truncated, and never blocks on a full queue."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Runs before the sampling filter and the formatters, which key on it
+        record.category = _category(record.name)
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if len(message) > MAX_CHARS:
+            message = f"{message[:MAX_CHARS]}… [{len(message) - MAX_CHARS} more chars]"
+        if record.exc_info:
+            # Tracebacks hold frames; render them here and ship the text
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log_records_dropped", category=record.category)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, category, msg and any extras."""
+
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"category", "message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "category": record.category,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at emit time (plays well with redirects)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure(
+    level: str = LEVEL,
+    format: str = FORMAT,
+    sample: str | None = None
+) -> None:
+    """
+    (Re)configure the "backend" logger tree. Called on import with the env
+    settings; call again to change level, format or sampling at runtime.
+
+    Args:
+        level: Minimum level name, e.g. "DEBUG"
+        format: "text" or "json"
+        sample: LOG_SAMPLE-style spec; defaults to the LOG_SAMPLE env var
+    """
+    global _listener
+
+    with _lock:
+        root = logging.getLogger(ROOT)
+        root.setLevel(level.upper())
+        root.propagate = False
+
+        if _listener is not None:
+            _listener.stop()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        output = _StdoutHandler()
+        output.setFormatter(JsonFormatter() if format == "json" else logging.Formatter(TEXT_FORMAT))
+
+        handler = _QueueHandler(queue.Queue(QUEUE_SIZE))
+        rates = parse_sample_rates(os.getenv("LOG_SAMPLE", "") if sample is None else sample)
+        if rates:
+            handler.addFilter(SamplingFilter(rates))
+        root.addHandler(handler)
+
+        _listener = logging.handlers.QueueListener(handler.queue, output)
+        _listener.start()
+
+
+def set_level(level: str) -> None:
+    """Change the minimum level without restarting the writer thread."""
+    logging.getLogger(ROOT).setLevel(level.upper())
+
+
+def flush() -> None:
+    """Write out everything queued so far (restarts the writer thread)."""
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger for a backend module, usually get_logger(__name__).
+
+    Args:
+        name: Module path; modules run outside the package get "backend." prepended
+
+    Returns:
+        A logger under the "backend" tree
+    """
+    if name == "__main__" or not (name == ROOT or name.startswith(ROOT + ".")):
+        name = f"{ROOT}.{name}"
+    return logging.getLogger(name)
+
+
+configure()
+atexit.register(lambda: _listener and _listener.stop())
@@ -0,0 +1,183 @@
+"""
+In-process metrics
+==================
+Thread-safe counters, gauges, summaries and histograms keyed by metric name
++ labels.
+
+    metrics.increment("tool_output_truncations", tool="get_unread_emails")
+    metrics.observe("tool_output_bytes_saved", 12345, tool="get_unread_emails")
+    metrics.gauge_add("http_requests_in_flight", 1, route="/api/agent/chat")
+    metrics.histogram("http_request_duration_seconds", 0.42, route="/api/agent/chat")
+
+render_prometheus() exposes everything in the Prometheus text format (served
+at /metrics).
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Seconds; covers fast DB reads up to multi-minute agent runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = defaultdict(float)
+_gauges: dict[tuple, float] = defaultdict(float)
+_summaries: dict[tuple, list[float]] = defaultdict(lambda: [0, 0.0])  # [count, sum]
+_histograms: dict[tuple, list] = {}  # key -> [bucket counts, count, sum]
+_buckets: dict[str, tuple] = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def increment(name: str, value: float = 1, **labels) -> None:
+    """Add `value` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def gauge_add(name: str, delta: float, **labels) -> None:
+    """Move a gauge up or down, e.g. +1 / -1 around in-flight work."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] += delta
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record one observation (count + sum) for a summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries[key]
+        summary[0] += 1
+        summary[1] += value
+
+
+def histogram(name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, **labels) -> None:
+    """
+    Record one observation in a histogram. A metric's buckets are fixed by
+    its first observation.
+    """
+    key = _key(name, labels)
+    with _lock:
+        bounds = _buckets.setdefault(name, tuple(buckets))
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * len(bounds), 0, 0.0]
+        index = bisect_left(bounds, value)
+        if index < len(bounds):
+            entry[0][index] += 1
+        entry[1] += 1
+        entry[2] += value
+
+
+def snapshot() -> dict:
+    """Copy of all metrics, e.g. for debugging or tests."""
+    with _lock:
+        return {
+            "counters": {
+                f"{name}{dict(labels)}": value for (name, labels), value in _counters.items()
+            },
+            "gauges": {
+                f"{name}{dict(labels)}": value for (name, labels), value in _gauges.items()
+            },
+            "summaries": {
+                f"{name}{dict(labels)}": {"count": count, "sum": total}
+                for (name, labels), (count, total) in _summaries.items()
+            },
+            "histograms": {
+                f"{name}{dict(labels)}": {
+                    "buckets": dict(zip(_buckets[name], counts)),
+                    "count": count,
+                    "sum": total
+                }
+                for (name, labels), (counts, count, total) in _histograms.items()
+            }
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _summaries.clear()
+        _histograms.clear()
+        _buckets.clear()
+
+
+# -- Prometheus exposition --------------------------------------------------
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{_metric_name(k)}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = list(_counters.items())
+        gauges = list(_gauges.items())
+        summaries = [(key, tuple(value)) for key, value in _summaries.items()]
+        histograms = [(key, (list(counts), count, total)) for key, (counts, count, total) in _histograms.items()]
+        buckets = dict(_buckets)
+
+    families: dict[str, tuple[str, list[str]]] = {}
+
+    def family(name: str, type_: str) -> list[str]:
+        return families.setdefault(name, (type_, []))[1]
+
+    for (name, labels), value in counters:
+        # Prometheus convention: counters end in _total
+        metric = _metric_name(name if name.endswith("_total") else f"{name}_total")
+        family(metric, "counter").append(f"{metric}{_labels(labels)} {_number(value)}")
+
+    for (name, labels), value in gauges:
+        metric = _metric_name(name)
+        family(metric, "gauge").append(f"{metric}{_labels(labels)} {_number(value)}")
+
+    for (name, labels), (count, total) in summaries:
+        metric = _metric_name(name)
+        lines = family(metric, "summary")
+        lines.append(f"{metric}_count{_labels(labels)} {_number(count)}")
+        lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+
+    for (name, labels), (counts, count, total) in histograms:
+        metric = _metric_name(name)
+        lines = family(metric, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets[name], counts):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_labels(labels, (('le', _number(bound)),))} {cumulative}")
+        lines.append(f"{metric}_bucket{_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{metric}_count{_labels(labels)} {count}")
+        lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+
+    out = []
+    for metric in sorted(families):
+        type_, lines = families[metric]
+        out.append(f"# TYPE {metric} {type_}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
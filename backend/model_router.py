@@ -0,0 +1,169 @@
+"""
+Model Routing
+=============
+Picks the model per kind of LLM call instead of DEFAULT_MODEL for all of
+them, so light calls stop paying big-model latency:
+
+- classify: chat intent classification
+- summarize: chat questions answered from the context already loaded
+- schedule: scheduled task runs and one-off event additions
+- reshuffle: reorganising the whole calendar
+
+Each route has a chain of models, cheapest first, from MODEL_<ROUTE>
+(comma separated, e.g. MODEL_CLASSIFY="openai/gpt-4o-mini,openai/gpt-4o");
+a route that isn't configured uses DEFAULT_MODEL. When a call fails
+validation (output doesn't parse, an unknown tool, an empty reply, a
+provider error) it is retried on the next model in the chain, and the rest
+of that run stays on the stronger model:
+
+    router = Router("classify")
+    result = router.call(
+        lambda model: rate_limit.call("openrouter", generate_object, model=model, ...,
+                                      retries=MODEL_CALL_RETRIES),
+        validate=check,
+    )
+
+Escalation is the retry: attempts pass retries=MODEL_CALL_RETRIES to
+rate_limit.call instead of its default, so a failing model gets at most one
+quick retry before the next one is tried, not a full backoff series.
+
+Every attempt is recorded per route and model: model_call_seconds,
+model_calls{outcome}, model_tokens{kind}, model_escalations and, with
+MODEL_PRICES="openai/gpt-4o=2.5:10,..." (USD per million prompt:completion
+tokens), model_cost_usd.
+"""
+
+import os
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from ai_sdk import openai
+
+from backend import metrics
+from backend.circuit_breaker import CircuitOpenError
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+ROUTES = ("classify", "summarize", "schedule", "reshuffle")
+
+T = TypeVar("T")
+
+# rate_limit.call retries per model attempt; the chain does the rest
+MODEL_CALL_RETRIES = int(os.getenv("MODEL_CALL_RETRIES", "1"))
+
+
+def parse_prices(spec: str) -> dict[str, tuple[float, float]]:
+    """
+    Parse MODEL_PRICES ("model=prompt:completion,...") into {model: (prompt, completion)}.
+
+    Args:
+        spec: Comma-separated model=price pairs, USD per million tokens
+
+    Returns:
+        Dict of model to (prompt, completion) prices; malformed entries are ignored
+    """
+    prices = {}
+    for part in spec.split(","):
+        model, _, price = part.partition("=")
+        prompt, _, completion = price.partition(":")
+        try:
+            prices[model.strip()] = (float(prompt), float(completion or prompt))
+        except ValueError:
+            continue
+    return prices
+
+
+PRICES = parse_prices(os.getenv("MODEL_PRICES", ""))
+
+
+def models_for(route: str) -> list[str]:
+    """The route's model chain, cheapest first."""
+    if route not in ROUTES:
+        raise ValueError(f"Unknown model route {route!r}, expected one of {ROUTES}")
+    chain = [name.strip() for name in os.getenv(f"MODEL_{route.upper()}", "").split(",") if name.strip()]
+    return chain or [os.getenv("DEFAULT_MODEL")]
+
+
+def _usage(result: Any) -> tuple[int, int]:
+    """(prompt, completion) tokens from a generate_text dict or a generate_object result."""
+    usage = result.get("usage") if isinstance(result, dict) else getattr(result, "usage", None)
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+class Router:
+    """One run's place in a route's model chain; an escalation holds for the rest of the run."""
+
+    def __init__(self, route: str):
+        self.route = route
+        self.models = models_for(route)
+        self.level = 0
+        self._instances: dict[str, Any] = {}
+
+    @property
+    def model_name(self) -> str:
+        return self.models[self.level]
+
+    def model(self):
+        """ai_sdk model for the current level, created once per run."""
+        name = self.model_name
+        if name not in self._instances:
+            self._instances[name] = openai(name)
+        return self._instances[name]
+
+    def _record(self, model: str, seconds: float, outcome: str, result: Any = None) -> None:
+        labels = {"route": self.route, "model": model}
+        metrics.histogram("model_call_seconds", seconds, **labels)
+        metrics.increment("model_calls", outcome=outcome, **labels)
+        if result is None:
+            return
+        prompt, completion = _usage(result)
+        metrics.increment("model_tokens", prompt, kind="prompt", **labels)
+        metrics.increment("model_tokens", completion, kind="completion", **labels)
+        price = PRICES.get(model)
+        if price:
+            metrics.increment("model_cost_usd", (prompt * price[0] + completion * price[1]) / 1e6, **labels)
+
+    def call(self, fn: Callable[[Any], T], validate: Optional[Callable[[T], Optional[str]]] = None) -> T:
+        """
+        Run fn(model) on the current model, escalating along the chain while
+        it raises or `validate` objects.
+
+        Args:
+            fn: Makes the LLM call with the ai_sdk model it is given
+            validate: Returns why a result is unusable, or None if it is fine
+
+        Returns:
+            The first valid result, or the last model's result if none was
+
+        Raises:
+            CircuitOpenError: The provider is down; no point trying another model
+            Exception: Whatever the last model in the chain raised
+        """
+        while True:
+            model = self.model_name
+            last = self.level == len(self.models) - 1
+            start = time.perf_counter()
+            try:
+                result = fn(self.model())
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                self._record(model, time.perf_counter() - start, "error")
+                if last:
+                    raise
+                problem = f"{type(e).__name__}: {e}"
+            else:
+                problem = validate(result) if validate else None
+                self._record(model, time.perf_counter() - start, "invalid" if problem else "ok", result)
+                if problem is None or last:
+                    return result
+
+            metrics.increment("model_escalations", route=self.route, model=model)
+            self.level += 1
+            logger.warning("⬆️ %s call on %s failed validation (%s), escalating to %s",
+                           self.route, model, problem, self.model_name)
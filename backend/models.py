@@ -18,6 +18,8 @@ class Context(BaseModel):
     prompt: str = Field(description="Description of the user's task with added detail")
     priority: str = Field(description="Priority of the user's task, high, medium, low")
     url: Optional[str] = Field(None, description="URL of the task to be executed")
+    email_min_score: Optional[float] = Field(None, description="EMAIL tasks: lowest relevance score an email needs to be looked at (default 1; higher is stricter)")
+    email_top_k: Optional[int] = Field(None, description="EMAIL tasks: most emails looked at per run (default 8)")
 
 class Task(BaseModel):
     context: Context = Field(description="Information about what the task will do")
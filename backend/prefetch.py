@@ -0,0 +1,244 @@
+"""
+Agent Context Prefetch
+======================
+Loads the data every agent run needs before the first LLM call, so the model
+doesn't spend its first step calling get_all_calendar_events:
+
+- user context and chat context (Supabase), fetched concurrently
+- the upcoming calendar window across all calendars
+- unread emails, only when an EMAIL task is part of the run, and only those
+  after the EMAIL tasks' watermark (backend/email_watermark.py), each with
+  the deadlines found in it (backend/tools/deadlines.py); fetched emails are
+  also added to the user's knowledge index (backend/tools/knowledge.py)
+
+The calendar and email fetches start as soon as the user's Google token is
+known and overlap with the chat context query (and, in the chat endpoint,
+with intent classification). The result is rendered as a compact text block
+for the system prompt. A fetch that fails is listed as missing there, so
+the model calls the tool instead of taking an empty calendar or inbox as
+the truth.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import backend.database.supabase_db as sb
+import backend.database.supabase_async as asb
+from backend import email_watermark, rate_limit
+from backend.log import get_logger
+from backend.token_manager import ensure_fresh
+from backend.tools.deadlines import annotate_emails, format_deadlines
+from backend.tools.knowledge import index_emails
+from backend.chat_memory import aget_chat_context, get_chat_context
+from backend.tools.calendar.calendar_fetch import get_calendar_service, get_events_all_calendars
+from backend.tools.email.email_fetcher import get_unread_backlog
+
+logger = get_logger(__name__)
+
+PREFETCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "8")),
+    thread_name_prefix="prefetch"
+)
+
+PREFETCH_DAYS = int(os.getenv("PREFETCH_DAYS", "7"))
+PREFETCH_TIMEOUT = float(os.getenv("PREFETCH_TIMEOUT", "15"))
+PREFETCH_MAX_EMAILS = int(os.getenv("PREFETCH_MAX_EMAILS", "20"))
+
+
+def _needs_emails(tasks: Optional[list]) -> bool:
+    return any(email_watermark.is_email_task(task) for task in tasks or [])
+
+
+def fetch_calendar_window(token_data: dict, days: int = PREFETCH_DAYS) -> list[dict]:
+    """Events across all of the user's calendars for the next `days` days."""
+    service = get_calendar_service(token_data)
+    now = datetime.utcnow()
+    events = get_events_all_calendars(service, time_min=now, time_max=now + timedelta(days=days))
+    return sorted(events, key=lambda e: e.get("start") or "")
+
+
+def fetch_new_emails(
+    token_data: dict,
+    max_results: int = PREFETCH_MAX_EMAILS,
+    after: Optional[int] = None,
+    user_id: Optional[str] = None
+) -> tuple[list[dict], dict]:
+    """
+    Unread emails (received after the Unix time `after`) with their
+    extracted deadlines, indexed for `user_id` if given.
+
+    Returns:
+        (emails, fetch window) - see email_fetcher.get_unread_backlog
+    """
+    emails, window = get_unread_backlog(token_data=token_data, after=after, max_results=max_results)
+    emails = annotate_emails(emails)
+    if user_id:
+        index_emails(user_id, emails)
+    return emails, window
+
+
+def _safe(future: Optional[Future], label: str):
+    """Result of a prefetch future, or None if it failed or ran too long."""
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=PREFETCH_TIMEOUT)
+    except Exception as e:
+        logger.warning("⚠️ Prefetch of %s failed, agent will use tools instead: %s", label, e)
+        return None
+
+
+class AgentSetup:
+    """
+    Handle for an in-flight agent setup. Created with start_agent_setup(), the
+    work runs in the background until wait() is called.
+    """
+
+    def __init__(self, user_id: str, tasks: Optional[list] = None):
+        self.user_id = user_id
+        self.tasks = tasks
+        with rate_limit.acting_for(user_id):
+            self._chats = rate_limit.submit(PREFETCH_EXECUTOR, get_chat_context, user_id)
+            # Returns immediately after scheduling the Google fetches, so no
+            # prefetch thread ever blocks on another one
+            self._context = rate_limit.submit(PREFETCH_EXECUTOR, self._load_context)
+
+    @classmethod
+    def loaded(cls, user_id: str, tasks: Optional[list], user_context: dict, chats: dict) -> "AgentSetup":
+        """Setup for a user whose Supabase data is already loaded; only the Google prefetch runs."""
+        setup = cls.__new__(cls)
+        setup.user_id = user_id
+        setup.tasks = tasks
+        setup._chats = _done(chats)
+        with rate_limit.acting_for(user_id):
+            setup._context = _done((user_context, *start_prefetch(user_context, tasks, user_id)))
+        return setup
+
+    def _load_context(self) -> tuple[dict, Optional[Future], Optional[Future]]:
+        user_context = sb.get_user_context(self.user_id)
+        return (user_context, *start_prefetch(user_context, self.tasks, self.user_id))
+
+    def wait(self) -> tuple[dict, dict, dict]:
+        """Block until setup is done; returns (user_context, chat_context, prefetched)."""
+        user_context, calendar, emails = self._context.result()
+        chats = self._chats.result()
+        return user_context, chats, collect_prefetch(calendar, emails)
+
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+async def astart_agent_setup(user_id: str, tasks: Optional[list] = None) -> AgentSetup:
+    """
+    Async start_agent_setup: user context and chat context are read
+    concurrently over the async Supabase client, then the Google prefetch
+    starts in the background as usual.
+    """
+    user_context, chats = await asyncio.gather(
+        asb.get_user_context(user_id),
+        aget_chat_context(user_id)
+    )
+    return AgentSetup.loaded(user_id, tasks, user_context, chats)
+
+
+def start_agent_setup(user_id: str, tasks: Optional[list] = None) -> AgentSetup:
+    """Start loading everything an agent run for this user needs."""
+    return AgentSetup(user_id, tasks)
+
+
+def start_prefetch(
+    user_context: dict,
+    tasks: Optional[list] = None,
+    user_id: Optional[str] = None
+) -> tuple[Optional[Future], Optional[Future]]:
+    """Kick off the calendar (and, for EMAIL tasks, inbox) fetch in the background."""
+    token_data = (user_context or {}).get("google_token")
+    if not token_data:
+        return None, None
+    if user_id:
+        # Refresh an expiring token once here rather than in each fetch
+        token_data = ensure_fresh(user_id, token_data)
+
+    calendar = rate_limit.submit(PREFETCH_EXECUTOR, fetch_calendar_window, token_data)
+    emails = None
+    if _needs_emails(tasks):
+        emails = rate_limit.submit(
+            PREFETCH_EXECUTOR, fetch_new_emails, token_data, after=email_watermark.since(tasks), user_id=user_id
+        )
+    return calendar, emails
+
+
+def collect_prefetch(calendar: Optional[Future], emails: Optional[Future]) -> dict:
+    fetched_emails, email_window = _safe(emails, "emails") or (None, None)
+    prefetched = {
+        "calendar": _safe(calendar, "calendar"),
+        "emails": fetched_emails,
+        "email_window": email_window,
+        "window_days": PREFETCH_DAYS
+    }
+    # Started but failed (or timed out), as opposed to not needed
+    prefetched["missing"] = [
+        label for label, future in (("calendar", calendar), ("emails", emails))
+        if future is not None and prefetched[label] is None
+    ]
+    return prefetched
+
+
+def prefetch(user_context: dict, tasks: Optional[list] = None, user_id: Optional[str] = None) -> dict:
+    """Blocking prefetch for callers that already have the user context."""
+    return collect_prefetch(*start_prefetch(user_context, tasks, user_id))
+
+
+def format_prefetched(prefetched: Optional[dict]) -> str:
+    """Render prefetched data as a compact block for the system prompt."""
+    if not prefetched:
+        return ""
+
+    sections = []
+    missing = prefetched.get("missing") or []
+
+    if "calendar" in missing:
+        sections.append(
+            "Current calendar: could not be loaded (that does not mean it is empty) - call get_all_calendar_events "
+            "before creating, moving or deleting any event."
+        )
+
+    calendar = prefetched.get("calendar")
+    if calendar is not None:
+        lines = [
+            f"- {e['start']} → {e['end']} | {e['summary']} "
+            f"[{e.get('calendar_name', '')}] (id={e['id']}, calendar_id={e.get('calendar_id', 'primary')})"
+            for e in calendar
+        ]
+        sections.append(
+            f"Current calendar, next {prefetched.get('window_days', PREFETCH_DAYS)} days "
+            f"({len(calendar)} events, already fetched - no need to call get_all_calendar_events):\n"
+            + ("\n".join(lines) if lines else "- (no events)")
+        )
+
+    if "emails" in missing:
+        sections.append("New unread emails: could not be loaded - call get_unread_emails.")
+
+    emails = prefetched.get("emails")
+    if emails is not None:
+        lines = [
+            f"- (id={m['id']}) {m['date']} | From: {m['sender']} | {m['subject']} | {m['snippet']}"
+            + (f"\n  deadlines: {format_deadlines(m['deadlines'])}" if m.get("deadlines") else "")
+            for m in emails
+        ]
+        sections.append(
+            f"New unread emails since the last run, most relevant first ({len(emails)}, snippets only - "
+            f"call get_unread_emails only if you need full bodies):\n"
+            + ("\n".join(lines) if lines else "- (no new unread emails)")
+        )
+        pending = (prefetched.get("email_window") or {}).get("pending")
+        if pending:
+            sections.append(f"{pending} newer unread email(s) were left for the next run.")
+
+    return "\n\n".join(sections)
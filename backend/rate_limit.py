@@ -0,0 +1,328 @@
+"""
+Upstream Rate Limiting
+======================
+Every call to Google Calendar, Gmail, Firecrawl and OpenRouter goes through
+`rate_limit.call(upstream, fn, ...)`, which
+
+- takes a token from the upstream's global bucket and, for Google APIs, from
+  the acting user's bucket (Google quotas are per user), waiting if empty
+- retries 429 / 5xx / rate-limit errors, sleeping for Retry-After when the
+  upstream sends one and exponential backoff with full jitter otherwise; a
+  429 also pauses the bucket so other threads back off too. Writes that
+  aren't idempotent (idempotent=False, e.g. creating an event) are only
+  retried on 429 or when the connection failed before the request was sent,
+  since a 5xx may come after the write was committed
+- counts requests (by outcome), their latency, waits, throttles, retries
+  and give-ups in backend.metrics
+- fails fast with CircuitOpenError while the upstream's circuit breaker is
+  open (backend/circuit_breaker.py)
+
+The acting user is a contextvar set with `acting_for(user_id)` around agent
+runs; pools that run work for a user copy the context (`submit`).
+
+Limits are "rate/burst" per second and can be overridden with
+RATE_LIMIT_<UPSTREAM> and RATE_LIMIT_<UPSTREAM>_PER_USER, e.g.
+RATE_LIMIT_GMAIL=100/200.
+"""
+
+import contextvars
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+from backend import metrics
+from backend.circuit_breaker import CircuitOpenError, get_breaker, is_upstream_failure
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+# (requests per second, burst)
+UPSTREAM_LIMITS = {
+    "calendar": (50, 100),
+    "gmail": (100, 200),
+    "firecrawl": (2, 5),
+    "openrouter": (10, 20),
+}
+PER_USER_LIMITS = {
+    "calendar": (10, 20),
+    "gmail": (25, 50),
+}
+
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", "0.5"))
+MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "30"))
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+MAX_USER_BUCKETS = 10000
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_user", default=None)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a token couldn't be had within MAX_WAIT seconds."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float) -> float:
+        """Take `tokens` (possibly going negative) and return how long to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, tokens: float = 1, max_wait: float = MAX_WAIT) -> float:
+        """Block until `tokens` are available; returns seconds waited."""
+        wait = self.reserve(tokens)
+        if wait > max_wait:
+            self.refund(tokens)
+            raise RateLimitExceeded(f"Rate limit wait of {wait:.1f}s exceeds {max_wait}s")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, tokens: float):
+        """Give back a reservation that won't be used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def pause(self, seconds: float):
+        """Hold back every caller of this bucket, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _parse_limit(value: Optional[str], default: tuple) -> tuple:
+    if not value:
+        return default
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst or rate)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_user_buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+_buckets_lock = threading.Lock()
+
+
+def _bucket(upstream: str) -> TokenBucket:
+    with _buckets_lock:
+        if upstream not in _buckets:
+            rate, burst = _parse_limit(
+                os.getenv(f"RATE_LIMIT_{upstream.upper()}"),
+                UPSTREAM_LIMITS.get(upstream, (10, 20))
+            )
+            _buckets[upstream] = TokenBucket(rate, burst)
+        return _buckets[upstream]
+
+
+def _user_bucket(upstream: str, user_id: Optional[str]) -> Optional[TokenBucket]:
+    if not user_id or upstream not in PER_USER_LIMITS:
+        return None
+    key = (upstream, user_id)
+    with _buckets_lock:
+        bucket = _user_buckets.get(key)
+        if bucket is None:
+            rate, burst = _parse_limit(
+                os.getenv(f"RATE_LIMIT_{upstream.upper()}_PER_USER"),
+                PER_USER_LIMITS[upstream]
+            )
+            bucket = _user_buckets[key] = TokenBucket(rate, burst)
+            if len(_user_buckets) > MAX_USER_BUCKETS:
+                _user_buckets.popitem(last=False)
+        else:
+            _user_buckets.move_to_end(key)
+        return bucket
+
+
+@contextmanager
+def acting_for(user_id: str):
+    """Attribute upstream calls in this block (and work submitted with `submit`) to a user."""
+    token = current_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+def submit(executor, fn: Callable, *args, **kwargs):
+    """executor.submit that carries the caller's context (acting user) into the worker."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def throttle(upstream: str, tokens: float = 1):
+    """
+    Take `tokens` from the upstream's bucket and the acting user's bucket.
+    Both are reserved before waiting, so when the wait is too long every
+    bucket gets its tokens back.
+    """
+    buckets = [bucket for bucket in (_bucket(upstream), _user_bucket(upstream, current_user.get())) if bucket]
+    waited = max(bucket.reserve(tokens) for bucket in buckets)
+    if waited > MAX_WAIT:
+        for bucket in buckets:
+            bucket.refund(tokens)
+        raise RateLimitExceeded(f"Rate limit wait of {waited:.1f}s exceeds {MAX_WAIT}s")
+    if waited > 0:
+        time.sleep(waited)
+        metrics.increment("rate_limit_waits", upstream=upstream)
+        metrics.observe("rate_limit_wait_seconds", waited, upstream=upstream)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of an upstream error, across googleapiclient, openai/httpx and firecrawl."""
+    for candidate in (
+        getattr(getattr(error, "resp", None), "status", None),
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+        getattr(error, "status", None),
+    ):
+        if isinstance(candidate, int) or (isinstance(candidate, str) and candidate.isdigit()):
+            return int(candidate)
+    text = str(error).lower()
+    if "rate limit" in text or "too many requests" in text or re.search(r"\b429\b", text):
+        return 429
+    return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the error's Retry-After header, if it carries one."""
+    headers = getattr(error, "resp", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is None:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+
+
+def is_retryable(error: Exception) -> bool:
+    return error_status(error) in RETRYABLE_STATUS
+
+
+def not_sent(error: Exception) -> bool:
+    """The request never reached the upstream (connection refused, DNS failure)."""
+    return isinstance(error, (ConnectionRefusedError, socket.gaierror)) \
+        or type(error).__name__ == "ServerNotFoundError"
+
+
+def is_safe_to_retry(error: Exception, idempotent: bool = True) -> bool:
+    """Whether retrying can't apply a request twice: any retryable error for idempotent calls."""
+    if error_status(error) == 429 or not_sent(error):
+        return True
+    return idempotent and is_retryable(error)
+
+
+def note_throttled(upstream: str, error: Exception) -> float:
+    """Record a throttling error and return how long to wait before retrying."""
+    status = error_status(error)
+    delay = retry_after(error)
+    if status == 429:
+        metrics.increment("upstream_throttled", upstream=upstream)
+        if delay:
+            _bucket(upstream).pause(delay)
+            user_bucket = _user_bucket(upstream, current_user.get())
+            if user_bucket:
+                user_bucket.pause(delay)
+    return delay or 0.0
+
+
+def _count_request(upstream: str, outcome: str, start: float):
+    metrics.increment("upstream_requests", upstream=upstream, outcome=outcome)
+    metrics.histogram("upstream_request_duration_seconds", time.monotonic() - start, upstream=upstream)
+
+
+def call(
+    upstream: str,
+    fn: Callable,
+    *args,
+    tokens: float = 1,
+    retries: int = MAX_RETRIES,
+    idempotent: bool = True,
+    **kwargs
+):
+    """
+    Call fn(*args, **kwargs) under the upstream's rate limits and circuit
+    breaker, retrying throttled calls. Raises CircuitOpenError without calling
+    fn while the breaker is open. Pass idempotent=False for writes that must
+    not be repeated once the upstream may have applied them.
+    """
+    breaker = get_breaker(upstream)
+    attempt = 0
+    while True:
+        # Fail fast while open, but only take a half-open trial once the rate limit let us through
+        breaker.check(trial=False)
+        throttle(upstream, tokens)
+        breaker.check()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            _count_request(upstream, str(error_status(e) or "error"), start)
+            if is_upstream_failure(e, error_status(e)):
+                breaker.record_failure()
+            elif error_status(e) is not None:
+                breaker.record_success()  # it answered, just not with what we wanted
+            else:
+                breaker.release()  # our own bug, says nothing about the upstream
+            retryable = is_safe_to_retry(e, idempotent)
+            if not retryable or attempt >= retries:
+                if retryable:
+                    metrics.increment("upstream_giveups", upstream=upstream)
+                raise
+            delay = max(note_throttled(upstream, e), backoff_delay(attempt))
+            metrics.increment("upstream_retries", upstream=upstream)
+            logger.info("⏳ %s returned %s, retry %d/%d in %.1fs", upstream, error_status(e) or type(e).__name__, attempt + 1, retries, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        _count_request(upstream, "ok", start)
+        return result
+
+
+def reraise_circuit_open(error: Exception):
+    """
+    First line of an `except Exception` that turns upstream errors into a
+    return value: an open circuit still propagates, so the tool layer can
+    tell the agent to stop calling that upstream.
+    """
+    if isinstance(error, CircuitOpenError):
+        raise error
+
+
+def execute(upstream: str, request, **kwargs):
+    """Rate-limited `request.execute()` for googleapiclient requests."""
+    return call(upstream, request.execute, **kwargs)
@@ -0,0 +1,319 @@
+"""
+Due-Task Scheduler
+==================
+In-process replacement for the external cron caller of /api/cron/run-tasks.
+
+Every task's next run time (last_run_ts + period) sits in a min-heap. A single
+thread sleeps until the earliest one is due, pops everything that is due,
+groups it by user and hands each group to the dispatch function on a small
+worker pool. When a run finishes the tasks are pushed back with their next
+due time.
+
+Adds, updates and deletes are O(log n): updates push a fresh heap entry and
+the old one is skipped lazily when it reaches the top. Right before dispatch
+the due rows are re-read by id, so tasks deleted or edited outside this
+process are dropped or picked up with their new period, and tasks that have
+run elsewhere in the meantime are skipped.
+
+After the run the rows are read again: a task is pushed back from its
+persisted last_run_ts, so one whose run failed, found the user's lease busy
+or was queued onto another run that hasn't finished is retried after a short
+backoff (SCHEDULER_RETRY_SECONDS, doubling up to SCHEDULER_MAX_RETRY_SECONDS)
+instead of a whole period later.
+"""
+
+import heapq
+import itertools
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Optional
+
+import backend.database.supabase_db as sb
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+RETRY_SECONDS = float(os.getenv("SCHEDULER_RETRY_SECONDS", "30"))
+MAX_RETRY_SECONDS = float(os.getenv("SCHEDULER_MAX_RETRY_SECONDS", "900"))
+
+DispatchFn = Callable[[str, list[dict]], None]
+
+_UNIT_SECONDS = {
+    "microsecond": 1e-6, "millisecond": 1e-3, "second": 1, "minute": 60,
+    "hour": 3600, "day": 86400, "week": 7 * 86400,
+    "mon": 30 * 86400, "month": 30 * 86400, "year": 365 * 86400,
+    "decade": 3650 * 86400,
+}
+_UNIT_ALIASES = {
+    "us": "microsecond", "ms": "millisecond", "s": "second", "sec": "second", "secs": "second",
+    "m": "minute", "min": "minute", "mins": "minute", "h": "hour", "hr": "hour", "hrs": "hour",
+    "d": "day", "w": "week", "mons": "mon", "y": "year", "yr": "year", "yrs": "year",
+}
+_PART = re.compile(r"([+-]?\d+(?:\.\d+)?)\s*([a-z]+)")
+_CLOCK = re.compile(r"([+-]?)(\d+):(\d{2})(?::(\d{2}(?:\.\d+)?))?")
+
+
+@lru_cache(maxsize=1024)
+def parse_interval(period: str) -> timedelta:
+    """
+    Parse a Postgres interval ('1 hour', '2 days 03:00:00', '@ 1 week',
+    '01:30:00', '1 mon') into a timedelta. Months are 30 days, years 365.
+    """
+    text = (period or "").strip().lower().lstrip("@").strip()
+    if not text:
+        raise ValueError("Empty interval")
+
+    seconds = 0.0
+    clock = _CLOCK.search(text)
+    if clock:
+        sign = -1 if clock.group(1) == "-" else 1
+        seconds += sign * (int(clock.group(2)) * 3600 + int(clock.group(3)) * 60 + float(clock.group(4) or 0))
+        text = text[:clock.start()] + text[clock.end():]
+
+    parts = _PART.findall(text)
+    if not parts and not clock:
+        raise ValueError(f"Unrecognised interval: {period!r}")
+
+    for amount, unit in parts:
+        unit = _UNIT_ALIASES.get(unit, unit)
+        unit = unit if unit in _UNIT_SECONDS else unit.rstrip("s")
+        if unit not in _UNIT_SECONDS:
+            raise ValueError(f"Unrecognised interval unit {unit!r} in {period!r}")
+        seconds += float(amount) * _UNIT_SECONDS[unit]
+
+    if seconds <= 0:
+        raise ValueError(f"Interval must be positive: {period!r}")
+    return timedelta(seconds=seconds)
+
+
+def parse_timestamp(value) -> datetime:
+    """Supabase timestamptz string (or datetime) to an aware UTC datetime."""
+    if isinstance(value, datetime):
+        ts = value
+    elif value:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    else:
+        ts = datetime.now(timezone.utc)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def next_due(task: dict) -> float:
+    """Epoch seconds at which the task should next run."""
+    return (parse_timestamp(task.get("last_run_ts")) + parse_interval(task["period"])).timestamp()
+
+
+def _is_due(task: dict, now: float) -> bool:
+    try:
+        return next_due(task) <= now
+    except ValueError:
+        return False
+
+
+class TaskScheduler:
+    """Min-heap of next-due times, woken only when the earliest task is due."""
+
+    def __init__(self, dispatch: DispatchFn, max_workers: int = 4):
+        self._dispatch = dispatch
+        self._heap: list[tuple[float, int, int]] = []  # (due, seq, task_id)
+        self._entries: dict[int, int] = {}             # task_id -> live seq
+        self._tasks: dict[int, dict] = {}
+        self._running: set[int] = set()
+        self._retries: dict[int, int] = {}             # task_id -> consecutive runs that didn't happen
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = True
+        self._thread: Optional[threading.Thread] = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler")
+
+    # -- task bookkeeping -------------------------------------------------
+
+    def _push(self, task: dict, due: float):
+        seq = next(self._seq)
+        self._entries[task["id"]] = seq
+        self._tasks[task["id"]] = task
+        heapq.heappush(self._heap, (due, seq, task["id"]))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # Too many superseded entries; rebuild from the live ones
+            self._heap = [entry for entry in self._heap if self._entries.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def add_task(self, task: dict):
+        """Schedule a new task (or reschedule an existing one) from its last_run_ts and period."""
+        try:
+            due = next_due(task)
+        except ValueError as e:
+            logger.warning("⚠️ Not scheduling task %s: %s", task.get('id'), e)
+            return
+        with self._cond:
+            if task["id"] in self._running:
+                # Will be re-pushed with fresh data when its current run finishes
+                self._tasks[task["id"]] = task
+                return
+            self._push(task, due)
+            self._cond.notify()
+
+    update_task = add_task
+
+    def remove_task(self, task_id: int):
+        """Forget a task; its heap entry is discarded lazily."""
+        with self._cond:
+            self._entries.pop(task_id, None)
+            self._tasks.pop(task_id, None)
+            self._running.discard(task_id)
+            self._retries.pop(task_id, None)
+
+    def load(self, tasks: list[dict]):
+        """Bulk load, heapified in O(n)."""
+        with self._cond:
+            for task in tasks:
+                try:
+                    due = next_due(task)
+                except ValueError as e:
+                    logger.warning("⚠️ Not scheduling task %s: %s", task.get('id'), e)
+                    continue
+                seq = next(self._seq)
+                self._entries[task["id"]] = seq
+                self._tasks[task["id"]] = task
+                self._heap.append((due, seq, task["id"]))
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -- run loop -----------------------------------------------------------
+
+    def _pop_due(self, now: float) -> list[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, task_id = heapq.heappop(self._heap)
+            if self._entries.get(task_id) != seq:
+                continue  # superseded or removed
+            del self._entries[task_id]
+            self._running.add(task_id)
+            due.append(self._tasks[task_id])
+        return due
+
+    def _next_wait(self) -> Optional[float]:
+        # Drop stale entries so we don't wake up for nothing
+        while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - datetime.now(timezone.utc).timestamp(), 0)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    wait = self._next_wait()
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait)
+                if self._stopped:
+                    return
+                due = self._pop_due(datetime.now(timezone.utc).timestamp())
+
+            by_user: dict[str, list[dict]] = {}
+            for task in due:
+                by_user.setdefault(task["user_id"], []).append(task)
+            for user_id, tasks in by_user.items():
+                self._pool.submit(self._run, user_id, tasks)
+
+    def _reread(self, ids: list[int]) -> Optional[dict[int, dict]]:
+        try:
+            return {task["id"]: task for task in sb.get_tasks_by_ids(ids)}
+        except Exception as e:
+            logger.warning("⚠️ Couldn't re-read tasks %s: %s", ids, e)
+            return None
+
+    def _run(self, user_id: str, tasks: list[dict]):
+        ids = [task["id"] for task in tasks]
+        # Pick up deletes/edits made outside this process
+        current = self._reread(ids)
+        try:
+            if current is None:
+                raise RuntimeError("tasks couldn't be read")
+            now = datetime.now(timezone.utc).timestamp()
+            tasks = [current[i] for i in ids if i in current and _is_due(current[i], now)]
+            if tasks:
+                logger.info("⏰ Scheduler running %d task(s) for user %s", len(tasks), user_id)
+                self._dispatch(user_id, [dict(task) for task in tasks])
+        except Exception as e:
+            logger.error("❌ Scheduled run for user %s failed: %s", user_id, e)
+        finally:
+            # The persisted last_run_ts says whether the run actually happened
+            persisted = self._reread(ids) or current or {}
+            now = datetime.now(timezone.utc).timestamp()
+            with self._cond:
+                for task_id in ids:
+                    self._running.discard(task_id)
+                    deleted = current is not None and task_id not in current
+                    if deleted or task_id not in self._tasks:
+                        self._tasks.pop(task_id, None)
+                        self._retries.pop(task_id, None)
+                        continue
+                    task = {**self._tasks[task_id], **persisted.get(task_id, {})}
+                    try:
+                        due = next_due(task)
+                    except ValueError as e:
+                        self._tasks.pop(task_id, None)
+                        self._retries.pop(task_id, None)
+                        logger.warning("⚠️ Dropping task %s: %s", task_id, e)
+                        continue
+                    if due <= now:
+                        # Failed, lease busy or still queued: retry soon, last_run_ts unchanged
+                        retries = self._retries.get(task_id, 0)
+                        self._retries[task_id] = retries + 1
+                        due = now + min(RETRY_SECONDS * 2 ** retries, MAX_RETRY_SECONDS)
+                        logger.info("🔁 Task %s didn't run, retrying in %.0fs", task_id, due - now)
+                    else:
+                        self._retries.pop(task_id, None)
+                    self._push(task, due)
+                self._cond.notify()
+
+    def start(self):
+        if not self._stopped:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="task-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False)
+
+
+_scheduler: Optional[TaskScheduler] = None
+
+
+def get_scheduler() -> Optional[TaskScheduler]:
+    """The running scheduler, or None if it wasn't started in this process."""
+    return _scheduler
+
+
+def start_scheduler(dispatch: DispatchFn) -> TaskScheduler:
+    """Load every task once and start the scheduler thread."""
+    global _scheduler
+    if _scheduler is None:
+        scheduler = TaskScheduler(dispatch, max_workers=int(os.getenv("SCHEDULER_WORKERS", "4")))
+        scheduler.load(sb.get_all_tasks())
+        scheduler.start()
+        logger.info("⏰ Task scheduler started with %d task(s)", len(scheduler))
+        _scheduler = scheduler
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
@@ -0,0 +1,63 @@
+"""
+Server-Sent Events helpers
+==========================
+Bridges the blocking agent code (which runs in a worker thread) to an async
+SSE response. The worker gets an ``emit(event, data)`` callback; every call is
+forwarded to the event loop and written to the client as soon as it happens.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable
+
+from pydantic import BaseModel
+
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+EmitFn = Callable[[str, Any], None]
+
+_DONE = object()
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a single SSE frame with a JSON payload."""
+    if isinstance(data, BaseModel):
+        data = data.model_dump(mode="json")
+    payload = json.dumps(data, default=str, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def stream_events(run: Callable[[EmitFn], Any]) -> AsyncIterator[str]:
+    """
+    Run ``run(emit)`` in a worker thread and yield its events as SSE frames.
+
+    The return value of ``run`` is sent as the ``final`` event. Any exception is
+    reported as an ``error`` event instead of tearing down the connection.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: Any) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def worker() -> None:
+        try:
+            emit("final", run(emit))
+        except Exception as e:
+            logger.error("❌ Streaming run failed: %s", e)
+            emit("error", {"detail": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    task = loop.run_in_executor(None, worker)
+
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            break
+        event, data = item
+        yield sse_event(event, data)
+
+    await task
@@ -0,0 +1,61 @@
+"""Model steps in the agent loop (backend/agent_loop.py)."""
+
+import pytest
+
+from backend import rate_limit
+from backend.agent_loop import run_agent_loop
+from backend.model_router import MODEL_CALL_RETRIES, Router
+
+
+class Model:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def generate_text(self, messages=None, tools=None, tool_choice=None):
+        self.calls += 1
+        reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("MODEL_SCHEDULE", "cheap,strong")
+    router = Router("schedule")
+    models = {
+        "cheap": Model([{"text": ""}]),
+        "strong": Model([{"text": "✅ Actions: none"}]),
+    }
+    monkeypatch.setattr(router, "model", lambda: models[router.model_name])
+    router.fakes = models
+    return router
+
+
+def test_text_event_is_the_accepted_step_only(router):
+    events = []
+
+    result = run_agent_loop(router, "system", "prompt", tools=[],
+                            on_event=lambda event, data: events.append((event, data)))
+
+    # The cheap model's empty reply was escalated, never streamed
+    assert events == [("text", {"step": 0, "text": "✅ Actions: none"})]
+    assert result.text == "✅ Actions: none"
+    assert router.model_name == "strong"
+
+
+def test_failing_model_escalates_instead_of_retrying(router, monkeypatch):
+    monkeypatch.setattr(rate_limit, "BASE_BACKOFF", 0.01)
+    router.fakes["cheap"] = Model([Unavailable("upstream down")])
+
+    result = run_agent_loop(router, "system", "prompt", tools=[])
+
+    # One quick retry on the cheap model, then the chain takes over
+    assert router.fakes["cheap"].calls == 1 + MODEL_CALL_RETRIES
+    assert result.text == "✅ Actions: none"
+
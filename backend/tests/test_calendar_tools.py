@@ -0,0 +1,83 @@
+"""Calendar write tools report upstream failures (backend/tools/calendar/tools.py)."""
+
+import pytest
+
+from backend import rate_limit
+from backend.circuit_breaker import CircuitOpenError
+from backend.tools.calendar import tools
+
+
+class Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class Events:
+    def insert(self, calendarId=None, body=None):
+        return Request({"id": "evt-1", "summary": body["summary"]})
+
+    def get(self, calendarId=None, eventId=None):
+        return Request({"id": eventId, "summary": "Old"})
+
+    def update(self, calendarId=None, eventId=None, body=None):
+        return Request(body)
+
+    def delete(self, calendarId=None, eventId=None):
+        return Request("")
+
+
+class Calendar:
+    def events(self):
+        return Events()
+
+
+class Context:
+    def __init__(self, service):
+        self.service = service
+
+    def calendar_service(self):
+        return self.service
+
+
+CREATE = dict(summary="Exam", start_datetime="2026-05-01T09:00:00Z", end_datetime="2026-05-01T10:00:00Z")
+
+
+@pytest.fixture
+def throttled(monkeypatch):
+    """Every calendar call gives up waiting for a rate limit token."""
+    def throttle(upstream, tokens=1):
+        raise rate_limit.RateLimitExceeded("Rate limit wait of 45.0s exceeds 30s")
+
+    monkeypatch.setattr(rate_limit, "throttle", throttle)
+
+
+def test_successful_writes():
+    ctx = Context(Calendar())
+    assert tools.create_calendar_event_execute(ctx, **CREATE)["id"] == "evt-1"
+    assert tools.update_calendar_event_execute(ctx, "evt-1", summary="New")["summary"] == "New"
+    assert tools.delete_calendar_event_execute(ctx, "evt-1") == {"success": True, "message": "Event deleted"}
+
+
+def test_failed_delete_is_not_reported_as_success(throttled):
+    result = tools.delete_calendar_event_execute(Context(Calendar()), "evt-1")
+    assert "success" not in result
+    assert "did not confirm event evt-1 was deleted" in result["error"]
+
+
+def test_failed_create_and_update_return_errors(throttled):
+    ctx = Context(Calendar())
+    assert "did not confirm the event was created" in tools.create_calendar_event_execute(ctx, **CREATE)["error"]
+    assert "did not confirm event evt-1 was updated" in tools.update_calendar_event_execute(ctx, "evt-1", summary="New")["error"]
+
+
+def test_open_circuit_passes_through_the_helpers(monkeypatch):
+    def throttle(upstream, tokens=1):
+        raise CircuitOpenError(upstream, 12)
+
+    monkeypatch.setattr(rate_limit, "throttle", throttle)
+    result = tools.delete_calendar_event_execute(Context(Calendar()), "evt-1")
+    assert result["error"] == "service_unavailable"
+    assert result["retry_after_seconds"] == 12
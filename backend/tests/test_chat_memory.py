@@ -0,0 +1,125 @@
+"""Rolling chat summaries (backend/chat_memory.py)."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend import chat_memory
+
+START = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+
+
+def at(minute, day=0):
+    return (START + timedelta(days=day, minutes=minute)).isoformat()
+
+
+def row(n, minute=None, day=0):
+    return {"user_id": "u1", "context": {"message": f"message {n}", "role": "user"}, "timestamp": at(n if minute is None else minute, day)}
+
+
+class ChatTables:
+    """compact_chat and chat_summaries for one process, with update_chat_summary's compare-and-set."""
+
+    def __init__(self):
+        self.messages, self.summary = [], {"summary": "", "message_count": 0, "summarized_until": None}
+        self.before_update = None
+
+    def insert(self, rows):
+        self.messages += [chat_memory._as_message(r) for r in rows]
+
+    def ordered(self):
+        return sorted(self.messages, key=lambda m: chat_memory._at(m["timestamp"]))
+
+    def get_recent_chat_messages(self, user_id, limit=5, offset=0):
+        return list(reversed(self.ordered()))[offset:offset + limit]
+
+    def get_chat_messages_between(self, user_id, after=None, before=None, limit=200):
+        return [
+            dict(m) for m in self.ordered()
+            if (not after or chat_memory._at(m["timestamp"]) > chat_memory._at(after))
+            and (not before or chat_memory._at(m["timestamp"]) < chat_memory._at(before))
+        ][:limit]
+
+    def get_chat_summary(self, user_id):
+        return dict(self.summary)
+
+    def update_chat_summary(self, user_id, summary, message_count, summarized_until, previous_count):
+        if self.before_update:
+            hook, self.before_update = self.before_update, None
+            hook()
+        if self.summary["message_count"] != previous_count:
+            return False
+        self.summary = {"summary": summary, "message_count": message_count, "summarized_until": summarized_until}
+        return True
+
+    def write(self, rows):
+        """What the chat buffer does: insert, then call on_flush."""
+        self.insert(rows)
+        chat_memory.roll_summaries(rows)
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = ChatTables()
+    for name in ("get_recent_chat_messages", "get_chat_messages_between", "get_chat_summary", "update_chat_summary"):
+        monkeypatch.setattr(chat_memory.sb, name, getattr(tables, name))
+    monkeypatch.setattr(chat_memory, "RECENT_TURNS", 3)
+    return tables
+
+
+def summarized(tables):
+    return [line.split(": ", 1)[1] for line in tables.summary["summary"].splitlines()]
+
+
+def test_messages_leaving_the_window_are_folded_once(tables):
+    tables.write([row(n) for n in range(4)])
+    assert summarized(tables) == ["message 0"]
+    tables.write([row(4), row(5)])
+    assert summarized(tables) == ["message 0", "message 1", "message 2"]
+    assert tables.summary["message_count"] == 3
+    assert tables.summary["summarized_until"] == at(2)
+
+
+def test_retried_batch_landing_late_is_folded_once(tables):
+    # Batch [2, 3] failed and is retried after [4..7] was written
+    tables.write([row(0), row(1)])
+    tables.write([row(n) for n in range(4, 8)])
+    assert summarized(tables) == ["message 0", "message 1", "message 4"]
+
+    tables.write([row(2), row(3)])
+    assert sorted(summarized(tables)) == ["message 0", "message 1", "message 2", "message 3", "message 4"]
+    assert tables.summary["message_count"] == 5
+
+    tables.write([row(8)])
+    assert summarized(tables)[-1] == "message 5"
+    assert len(summarized(tables)) == 6
+
+
+def test_concurrent_roll_is_not_overwritten(tables):
+    tables.write([row(n) for n in range(3)])
+
+    def other_flush():
+        # Another worker folds message 0 between our read and our write
+        tables.insert([row(3)])
+        tables.summary = {"summary": chat_memory.fold_into_summary("", chat_memory._as_message(row(0))),
+                          "message_count": 1, "summarized_until": at(0)}
+
+    tables.before_update = other_flush
+    tables.write([row(4)])
+    assert summarized(tables) == ["message 0", "message 1"]
+    assert tables.summary["message_count"] == 2
+
+
+def test_old_days_are_compacted_into_digests(monkeypatch):
+    monkeypatch.setattr(chat_memory, "MAX_SUMMARY_CHARS", 700)
+    summary = ""
+    for day in range(3):
+        for n in range(6):
+            message = chat_memory._as_message(row(n, day=day))
+            message["message"] = f"day {day} question {n} about the physics coursework deadline"
+            summary = chat_memory.fold_into_summary(summary, message)
+
+    lines = summary.splitlines()
+    assert len(summary) <= 700
+    assert lines[0].startswith(f"- [{at(0, day=1)[:10]}] ") and " messages: " in lines[0]
+    assert lines[-1].endswith("day 2 question 5 about the physics coursework deadline")
@@ -0,0 +1,115 @@
+"""Circuit breakers and their use in rate_limit.call (backend/circuit_breaker.py)."""
+
+import time
+
+import pytest
+
+from backend import circuit_breaker, rate_limit
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class NotFound(Exception):
+    status_code = 404
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A fresh breaker for the "test" upstream that opens on the first failure and recovers fast."""
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_seconds=0.3, half_open_calls=1)
+    monkeypatch.setitem(circuit_breaker._breakers, "test", breaker)
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0)
+    return breaker
+
+
+def fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+def half_open(breaker):
+    with pytest.raises(Unavailable):
+        rate_limit.call("test", fail(Unavailable()), retries=0)
+    assert breaker.status()["state"] == OPEN
+    time.sleep(0.35)
+    assert breaker.status()["state"] == HALF_OPEN
+
+
+def test_trial_failure_reopens_and_rejects(breaker):
+    half_open(breaker)
+    with pytest.raises(Unavailable):
+        rate_limit.call("test", fail(Unavailable()), retries=0)
+    assert breaker.status()["state"] == OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        rate_limit.call("test", lambda: "ok")
+    assert raised.value.retry_in > 0
+
+
+def test_trial_success_closes(breaker):
+    half_open(breaker)
+    assert rate_limit.call("test", lambda: "ok") == "ok"
+    assert breaker.status()["state"] == CLOSED
+
+
+def test_client_error_counts_as_an_answer(breaker):
+    half_open(breaker)
+    with pytest.raises(NotFound):
+        rate_limit.call("test", fail(NotFound()))
+    assert breaker.status()["state"] == CLOSED
+
+
+@pytest.mark.parametrize("error", [ValueError("bad output"), TypeError(), KeyError("x"), AttributeError()])
+def test_our_own_bug_during_a_trial_gives_the_trial_back(breaker, error):
+    half_open(breaker)
+    with pytest.raises(type(error)):
+        rate_limit.call("test", fail(error))
+    assert breaker.status()["state"] == HALF_OPEN
+    assert rate_limit.call("test", lambda: "ok") == "ok"
+    assert breaker.status()["state"] == CLOSED
+
+
+def test_interrupted_trial_gives_the_trial_back(breaker):
+    half_open(breaker)
+    with pytest.raises(KeyboardInterrupt):
+        rate_limit.call("test", fail(KeyboardInterrupt()))
+    assert rate_limit.call("test", lambda: "ok") == "ok"
+
+
+def test_rate_limit_wait_does_not_take_a_trial(breaker, monkeypatch):
+    half_open(breaker)
+
+    def too_long(upstream, tokens=1):
+        raise rate_limit.RateLimitExceeded("too long")
+
+    monkeypatch.setattr(rate_limit, "throttle", too_long)
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        rate_limit.call("test", lambda: "ok")
+    monkeypatch.undo()
+    monkeypatch.setitem(circuit_breaker._breakers, "test", breaker)
+    assert rate_limit.call("test", lambda: "ok") == "ok"
+
+
+def test_lost_trial_expires_after_recovery(breaker):
+    half_open(breaker)
+    breaker.check()  # a trial that never reports back
+
+    with pytest.raises(CircuitOpenError) as raised:
+        rate_limit.call("test", lambda: "ok")
+    assert raised.value.retry_in > 0
+    assert breaker.status()["retry_in_seconds"] > 0
+
+    time.sleep(0.35)
+    assert rate_limit.call("test", lambda: "ok") == "ok"
+    assert breaker.status()["state"] == CLOSED
+
+
+def test_peek_does_not_take_a_trial(breaker):
+    half_open(breaker)
+    assert breaker.peek() is None
+    assert breaker.peek() is None
+    breaker.check()
+    assert isinstance(breaker.peek(), CircuitOpenError)
@@ -0,0 +1,51 @@
+"""Deadline extraction (backend/tools/deadlines.py)."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.tools import deadlines
+
+REFERENCE = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+
+
+def dates(text):
+    return [d["datetime"] for d in deadlines.extract(text, REFERENCE)]
+
+
+@pytest.mark.parametrize("text", [
+    "4/5 by users",
+    "Rated 4/5 by users",
+    "24/7 support",
+    "24/7 support by phone, until you're happy",
+    "you may 5 times",
+    "Students may 5 times resubmit before the deadline",
+    "Scored 3/4 on the quiz before the break",
+])
+def test_fractions_and_modal_may_are_not_deadlines(text):
+    assert dates(text) == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Coursework due 4/5", "2026-05-04"),
+    ("Applications close 4/5", "2026-05-04"),
+    ("Submit by 12/11/2026", "2026-11-12"),
+    ("Deadline: 12/11", "2026-11-12"),
+    ("Register by may 5", "2026-05-05"),
+    ("The exam is on May 5", "2026-05-05"),
+    ("Report due 5 May 2026", "2026-05-05"),
+    ("Coursework 2 is due Friday 5pm", "2026-03-06T17:00:00+00:00"),
+])
+def test_real_deadlines_are_still_found(text, expected):
+    assert dates(text) == [expected]
+
+
+def test_weak_words_do_not_lift_numeric_dates():
+    # "by" alone isn't enough for a bare day/month, even right after a date word
+    assert dates("Party on 4/5 by the lake") == []
+    assert dates("Party on 5 April by the lake") == ["2026-04-05"]
+
+
+def test_false_positive_does_not_hide_a_real_deadline():
+    text = "Rated 4/5 by users. Available 24/7. Applications close 20 March 2026."
+    assert dates(text) == ["2026-03-20"]
@@ -0,0 +1,183 @@
+"""Email watermarks over failed, partial and paged prefetches (backend/email_watermark.py)."""
+
+import asyncio
+
+import pytest
+
+from backend import email_watermark, prefetch
+from backend.tools.email import email_fetcher
+
+BASE = 1_760_000_000_000
+
+
+class Request:
+    def __init__(self, fn):
+        self.execute = fn
+
+
+class Gmail:
+    """messages().list/get over `count` unread messages, msg-0 the oldest, one a minute."""
+
+    def __init__(self, count, broken=(), list_fails=False, page_size=10):
+        self.inbox = {
+            f"msg-{i}": {
+                "id": f"msg-{i}",
+                "threadId": f"thread-{i}",
+                "internalDate": str(BASE + i * 60_000),
+                "labelIds": ["INBOX", "UNREAD"],
+                "snippet": "",
+                "payload": {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": f"Email {i}"}], "body": {}},
+            }
+            for i in range(count)
+        }
+        self.broken, self.list_fails, self.page_size = set(broken), list_fails, page_size
+        self.fetched = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId="me", q="", maxResults=100, pageToken=None):
+        def run():
+            if self.list_fails:
+                raise ConnectionError("Gmail unavailable")
+            after = int(q.split("after:")[1]) * 1000 if "after:" in q else None
+            ids = [i for i, m in reversed(self.inbox.items()) if after is None or int(m["internalDate"]) > after]
+            offset = int(pageToken or 0)
+            size = min(maxResults, self.page_size)
+            page = {"messages": [{"id": i} for i in ids[offset:offset + size]]}
+            if offset + size < len(ids):
+                page["nextPageToken"] = str(offset + size)
+            return page
+        return Request(run)
+
+    def get(self, userId="me", id=None, format="full"):
+        def run():
+            if id in self.broken:
+                raise ValueError(f"cannot fetch {id}")
+            self.fetched.append(id)
+            return self.inbox[id]
+        return Request(run)
+
+
+def email_task(watermark=None):
+    state = {email_watermark.STATE_KEY: watermark} if watermark else {}
+    return {"id": 1, "type": "EMAIL", "context": {}, "state": state}
+
+
+def run_once(service, task, max_results=20):
+    """One prefetch + watermark update for `task`, as fastAPI.run_user_tasks does it."""
+    emails, window = email_fetcher.get_unread_backlog(
+        service, after=email_watermark.since([task]), max_results=max_results
+    )
+    states = email_watermark.advanced_states([task], emails, window)
+    if task["id"] in states:
+        task = {**task, "state": states[task["id"]]}
+    return task, emails, window
+
+
+def seen(task):
+    return email_watermark.get_watermark(task)["internal_date"]
+
+
+def test_failed_fetch_leaves_every_task_due(monkeypatch):
+    service = Gmail(5, list_fails=True)
+    monkeypatch.setattr(prefetch, "get_unread_backlog", lambda **kwargs: email_fetcher.get_unread_backlog(service, **kwargs))
+    monkeypatch.setattr(prefetch, "annotate_emails", lambda emails: emails)
+    task = email_task({"internal_date": BASE, "ids": ["msg-0"]})
+
+    future = prefetch.PREFETCH_EXECUTOR.submit(prefetch.fetch_new_emails, {}, after=email_watermark.since([task]))
+    prefetched = prefetch.collect_prefetch(None, future)
+
+    assert prefetched["emails"] is None
+    assert prefetched["missing"] == ["emails"]
+    active, idle, _ = email_watermark.split_idle([task], prefetched["emails"])
+    assert active == [task] and idle == []
+    assert email_watermark.advanced_states([task], prefetched["emails"], prefetched["email_window"]) == {}
+    assert "could not be loaded - call get_unread_emails" in prefetch.format_prefetched(prefetched)
+
+
+def test_mail_fetch_raises_instead_of_returning_an_empty_inbox():
+    with pytest.raises(ConnectionError):
+        email_fetcher.get_unread_emails(service=Gmail(5, list_fails=True))
+
+
+def test_partial_fetch_stops_the_watermark_before_the_failed_message():
+    service = Gmail(6, broken={"msg-3"})
+    watermark = {"internal_date": BASE, "ids": ["msg-0"]}
+
+    task, emails, window = run_once(service, email_task(watermark))
+
+    assert {m["id"] for m in emails if email_watermark.is_new(m, watermark)} == {"msg-1", "msg-2", "msg-4", "msg-5"}
+    assert seen(task) == BASE + 2 * 60_000
+
+    service.broken.clear()
+    watermark = email_watermark.get_watermark(task)
+    task, emails, _ = run_once(service, task)
+    assert [m["id"] for m in emails if email_watermark.is_new(m, watermark)] == ["msg-5", "msg-4", "msg-3"]
+    assert seen(task) == BASE + 5 * 60_000
+
+
+def test_first_message_failing_keeps_the_watermark():
+    service = Gmail(4, broken={"msg-1"})
+    watermark = {"internal_date": BASE, "ids": ["msg-0"]}
+
+    task, _, _ = run_once(service, email_task(watermark))
+
+    assert email_watermark.get_watermark(task) == watermark
+
+
+def test_more_than_max_unread_are_paged_and_none_skipped():
+    service = Gmail(46, page_size=10)
+    task = email_task({"internal_date": BASE, "ids": ["msg-0"]})
+
+    task, emails, window = run_once(service, task)
+    # after: has second granularity, so the already seen msg-0 is listed too
+    assert window["pending"] == 26
+    assert [m["id"] for m in emails] == [f"msg-{i}" for i in range(19, -1, -1)]
+    assert seen(task) == BASE + 19 * 60_000
+
+    processed = {m["id"] for m in emails}
+    while window["pending"]:
+        task, emails, window = run_once(service, task)
+        processed |= {m["id"] for m in emails}
+    assert processed == {f"msg-{i}" for i in range(46)}
+    assert seen(task) == BASE + 45 * 60_000
+
+
+def test_window_that_does_not_reach_back_to_the_watermark_keeps_it():
+    emails = [{"id": "msg-9", "internal_date": BASE + 9 * 60_000}]
+    window = {"from": BASE + 9 * 60_000, "to": BASE + 9 * 60_000, "pending": 0}
+    watermark = {"internal_date": BASE, "ids": ["msg-0"]}
+
+    assert email_watermark.advance(watermark, emails, window) == watermark
+    assert email_watermark.advance(None, emails, window)["internal_date"] == BASE + 9 * 60_000
+
+
+def test_posted_tasks_without_state_use_the_stored_watermark(monkeypatch):
+    from backend import fastAPI
+
+    watermark = {"internal_date": BASE, "ids": ["msg-0"]}
+    stored = [{"id": 1, "user_id": "u1", "type": "EMAIL", "state": {email_watermark.STATE_KEY: watermark}}]
+    posted = [
+        {"id": 1, "user_id": "u1", "type": "EMAIL", "context": {}},
+        {"id": 2, "user_id": "u1", "type": "TODO", "context": {}},
+    ]
+    ran = []
+
+    async def get_tasks_by_ids(ids):
+        assert ids == [1]
+        return stored
+
+    async def run_task_batch(tasks):
+        ran.extend(tasks)
+
+    monkeypatch.setattr(fastAPI.asb, "get_tasks_by_ids", get_tasks_by_ids)
+    monkeypatch.setattr(fastAPI, "_run_task_batch", run_task_batch)
+    asyncio.run(fastAPI.run_scheduled_tasks({"tasks": posted}))
+
+    assert email_watermark.get_watermark(ran[0]) == watermark
+    assert email_watermark.since(ran) == BASE // 1000 - 1
+    assert "state" not in ran[1]
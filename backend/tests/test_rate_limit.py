@@ -0,0 +1,153 @@
+"""Token buckets, throttling and retries (backend/rate_limit.py)."""
+
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from backend import circuit_breaker, rate_limit
+from backend.circuit_breaker import CircuitBreaker
+from backend.rate_limit import RateLimitExceeded, TokenBucket
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class TooMany(Exception):
+    status_code = 429
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Fresh buckets and breaker for the "test" upstream, with sleeping recorded instead of done."""
+    slept = []
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    monkeypatch.setattr(rate_limit, "_user_buckets", OrderedDict())
+    monkeypatch.setitem(rate_limit.UPSTREAM_LIMITS, "test", (1, 2))
+    monkeypatch.setitem(rate_limit.PER_USER_LIMITS, "test", (1, 1))
+    monkeypatch.setitem(circuit_breaker._breakers, "test", CircuitBreaker("test", failure_threshold=100))
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0.0)
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(
+        monotonic=time.monotonic, time=time.time, sleep=slept.append))
+    return slept
+
+
+def test_bucket_reserves_burst_then_waits():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+
+
+def test_refund_returns_a_reservation():
+    bucket = TokenBucket(rate=10, capacity=1)
+    bucket.reserve(1)
+    bucket.refund(1)
+
+    assert bucket.reserve(1) == 0
+
+
+def test_acquire_over_max_wait_refunds():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.reserve(1)
+
+    with pytest.raises(RateLimitExceeded):
+        bucket.acquire(5, max_wait=2)
+    # Only the first reservation is still held
+    assert bucket.reserve(1) == pytest.approx(1, abs=0.05)
+
+
+def test_pause_holds_back_callers_with_tokens():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.pause(3)
+
+    assert bucket.reserve(1) == pytest.approx(3, abs=0.05)
+
+
+def test_throttle_refunds_every_bucket_when_the_wait_is_too_long(sleeps, monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_WAIT", 0.5)
+    with rate_limit.acting_for("u1"):
+        rate_limit.throttle("test")
+        # The user's bucket (burst 1) is empty, the upstream's still has a token
+        with pytest.raises(RateLimitExceeded):
+            rate_limit.throttle("test")
+
+    assert rate_limit._bucket("test").reserve(1) == 0
+    assert sleeps == []
+
+
+def test_throttle_waits_for_the_slowest_bucket(sleeps):
+    with rate_limit.acting_for("u1"):
+        rate_limit.throttle("test")
+        rate_limit.throttle("test")
+
+    assert sleeps == [pytest.approx(1, abs=0.05)]
+
+
+@pytest.mark.parametrize("error, idempotent, safe", [
+    (TooMany(), False, True),                # rejected before it was applied
+    (ConnectionRefusedError(), False, True), # never sent
+    (Unavailable(), True, True),
+    (Unavailable(), False, False),           # may have been applied
+    (BadRequest(), True, False),
+    (ValueError("bad"), True, False),
+])
+def test_is_safe_to_retry(error, idempotent, safe):
+    assert rate_limit.is_safe_to_retry(error, idempotent) is safe
+
+
+def counting(error, succeed_after=None):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if succeed_after is None or len(calls) <= succeed_after:
+            raise error
+        return "ok"
+
+    return fn, calls
+
+
+def test_idempotent_call_retries_until_it_gives_up(sleeps):
+    fn, calls = counting(Unavailable())
+
+    with pytest.raises(Unavailable):
+        rate_limit.call("test", fn, retries=3)
+    assert len(calls) == 4
+
+
+def test_idempotent_call_returns_after_a_retry(sleeps):
+    fn, calls = counting(Unavailable(), succeed_after=1)
+
+    assert rate_limit.call("test", fn, retries=3) == "ok"
+    assert len(calls) == 2
+
+
+def test_write_is_not_repeated_after_a_server_error(sleeps):
+    fn, calls = counting(Unavailable())
+
+    with pytest.raises(Unavailable):
+        rate_limit.call("test", fn, retries=3, idempotent=False)
+    assert len(calls) == 1
+
+
+def test_write_is_retried_after_429(sleeps):
+    fn, calls = counting(TooMany(), succeed_after=2)
+
+    assert rate_limit.call("test", fn, retries=3, idempotent=False) == "ok"
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried(sleeps):
+    fn, calls = counting(BadRequest())
+
+    with pytest.raises(BadRequest):
+        rate_limit.call("test", fn, retries=3)
+    assert len(calls) == 1
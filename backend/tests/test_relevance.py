@@ -0,0 +1,68 @@
+"""Email relevance scoring and per-task thresholds (backend/tools/email/relevance.py)."""
+
+from backend import email_watermark
+from backend.tools.email import relevance
+
+
+def email(id, subject, labels=(), sender="tutor@uni.ac.uk", snippet=""):
+    return {"id": id, "subject": subject, "snippet": snippet, "sender": sender, "labels": list(labels), "internal_date": 0}
+
+
+INBOX = [
+    email("deadline", "Coursework deadline Friday 5pm", labels=["IMPORTANT"]),
+    email("keyword", "Reminder about the module"),
+    email("plain", "Lunch plans"),
+    email("promo", "Big sale this week", labels=["CATEGORY_PROMOTIONS"], sender="newsletter@shop.com"),
+]
+
+
+def ids(emails):
+    return [m["id"] for m in emails]
+
+
+def test_defaults_apply_without_overrides():
+    assert relevance.thresholds({"context": {}}) == (relevance.DEFAULT_MIN_SCORE, relevance.DEFAULT_TOP_K)
+    assert relevance.thresholds(None) == (relevance.DEFAULT_MIN_SCORE, relevance.DEFAULT_TOP_K)
+
+
+def test_task_context_overrides_thresholds():
+    task = {"context": {"email_min_score": "2.5", "email_top_k": "3"}}
+    assert relevance.thresholds(task) == (2.5, 3)
+
+
+def test_zero_overrides_are_not_replaced_by_defaults():
+    assert relevance.thresholds({"context": {"email_min_score": 0, "email_top_k": 0}}) == (0.0, 0)
+
+
+def test_min_score_override_filters_for_the_task():
+    default = relevance.for_task({"context": {}}, INBOX)
+    strict = relevance.for_task({"context": {"email_min_score": 3}}, INBOX)
+    lenient = relevance.for_task({"context": {"email_min_score": -10}}, INBOX)
+
+    assert ids(default) == ["deadline", "keyword"]
+    assert ids(strict) == ["deadline"]
+    assert set(ids(lenient)) == {m["id"] for m in INBOX}
+
+
+def test_top_k_override_keeps_the_best():
+    picked = relevance.for_task({"context": {"email_min_score": -10, "email_top_k": 2}}, INBOX)
+    assert ids(picked) == ["deadline", "keyword"]
+    assert picked[0]["relevance"] >= picked[1]["relevance"]
+
+
+def test_overrides_decide_which_email_tasks_are_idle():
+    strict = {"id": 1, "type": "EMAIL", "context": {"email_min_score": 100}, "state": {}}
+    lenient = {"id": 2, "type": "EMAIL", "context": {"email_min_score": -10, "email_top_k": 1}, "state": {}}
+
+    active, idle, picked = email_watermark.split_idle([strict, lenient], INBOX)
+
+    assert active == [lenient] and idle == [strict]
+    assert ids(picked) == ["deadline"]
+
+
+def test_task_terms_raise_the_score():
+    task = {"title": "Track hackathon invites", "context": {"prompt": "Watch for hackathon emails"}}
+    message = email("hack", "Hackathon this weekend")
+
+    assert "hackathon" in relevance.task_terms(task)
+    assert relevance.score(message, relevance.task_terms(task))[0] > relevance.score(message)[0]
@@ -0,0 +1,137 @@
+"""Due-task heap and retry backoff (backend/scheduler.py)."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend import scheduler as scheduler_module
+from backend.scheduler import TaskScheduler, parse_interval
+
+
+def ago(seconds: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+def now() -> float:
+    return datetime.now(timezone.utc).timestamp()
+
+
+def task(task_id: int, period: str = "1 hour", last_run: float = 7200, user_id: str = "u1") -> dict:
+    return {"id": task_id, "user_id": user_id, "period": period, "last_run_ts": ago(last_run)}
+
+
+@pytest.fixture
+def rows(monkeypatch):
+    """The tasks table as the scheduler re-reads it, by id."""
+    table: dict[int, dict] = {}
+    monkeypatch.setattr(scheduler_module.sb, "get_tasks_by_ids",
+                        lambda ids: [dict(table[i]) for i in ids if i in table])
+    return table
+
+
+def scheduled(scheduler: TaskScheduler) -> dict[int, float]:
+    """Live heap entries: task id -> due time."""
+    return {task_id: due for due, seq, task_id in scheduler._heap if scheduler._entries.get(task_id) == seq}
+
+
+@pytest.mark.parametrize("period, seconds", [
+    ("1 hour", 3600),
+    ("2 days 03:00:00", 2 * 86400 + 3 * 3600),
+    ("@ 1 week", 7 * 86400),
+    ("01:30:00", 5400),
+    ("1 mon", 30 * 86400),
+    ("15 mins", 900),
+])
+def test_parse_interval(period, seconds):
+    assert parse_interval(period).total_seconds() == seconds
+
+
+@pytest.mark.parametrize("period", ["", "soon", "0 hours"])
+def test_parse_interval_rejects(period):
+    with pytest.raises(ValueError):
+        parse_interval(period)
+
+
+def test_pop_due_skips_superseded_and_removed_entries():
+    scheduler = TaskScheduler(dispatch=lambda user_id, tasks: None)
+    scheduler.load([task(1), task(2), task(3, last_run=60)])
+    scheduler.update_task(task(1, period="1 day"))  # not due any more
+    scheduler.remove_task(2)
+
+    assert scheduler._pop_due(now()) == []
+    assert set(scheduled(scheduler)) == {1, 3}
+
+
+def test_due_tasks_pop_once_in_due_order():
+    scheduler = TaskScheduler(dispatch=lambda user_id, tasks: None)
+    scheduler.load([task(1, last_run=4000), task(2, last_run=9000), task(3, last_run=60)])
+
+    assert [t["id"] for t in scheduler._pop_due(now())] == [2, 1]
+    assert scheduler._pop_due(now()) == []
+    assert scheduler._running == {1, 2}
+
+
+def test_run_that_did_not_happen_backs_off_exponentially(rows, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_SECONDS", 10)
+    monkeypatch.setattr(scheduler_module, "MAX_RETRY_SECONDS", 25)
+    dispatched = []
+    scheduler = TaskScheduler(dispatch=lambda user_id, tasks: dispatched.append([t["id"] for t in tasks]))
+    rows[1] = task(1)
+    scheduler.load([rows[1]])
+
+    delays = []
+    for _ in range(3):
+        # The dispatch "ran" but last_run_ts never moved (lease busy, run failed)
+        scheduler._run("u1", scheduler._pop_due(now() + 3600))
+        delays.append(scheduled(scheduler)[1] - now())
+
+    assert dispatched == [[1], [1], [1]]
+    assert [round(delay) for delay in delays] == [10, 20, 25]
+    assert scheduler._retries[1] == 3
+
+
+def test_run_that_happened_resets_backoff(rows):
+    def dispatch(user_id, tasks):
+        rows[1]["last_run_ts"] = ago(0)
+
+    scheduler = TaskScheduler(dispatch=dispatch)
+    scheduler._retries[1] = 4
+    rows[1] = task(1)
+    scheduler.load([rows[1]])
+
+    scheduler._run("u1", scheduler._pop_due(now()))
+
+    assert 1 not in scheduler._retries
+    assert scheduled(scheduler)[1] == pytest.approx(now() + 3600, abs=5)
+
+
+def test_failed_dispatch_is_retried(rows, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_SECONDS", 10)
+
+    def dispatch(user_id, tasks):
+        raise RuntimeError("agent down")
+
+    scheduler = TaskScheduler(dispatch=dispatch)
+    rows[1] = task(1)
+    scheduler.load([rows[1]])
+
+    scheduler._run("u1", scheduler._pop_due(now()))
+
+    assert scheduled(scheduler)[1] == pytest.approx(now() + 10, abs=2)
+    assert scheduler._running == set()
+
+
+def test_deleted_or_already_run_tasks_are_not_dispatched(rows):
+    dispatched = []
+    scheduler = TaskScheduler(dispatch=lambda user_id, tasks: dispatched.append([t["id"] for t in tasks]))
+    rows[1], rows[2] = task(1), task(2)
+    scheduler.load([rows[1], rows[2]])
+    due = scheduler._pop_due(now())
+    del rows[1]                          # deleted elsewhere
+    rows[2]["last_run_ts"] = ago(0)      # ran elsewhere
+
+    scheduler._run("u1", due)
+
+    assert dispatched == []
+    assert set(scheduled(scheduler)) == {2}
+    assert 1 not in scheduler._tasks
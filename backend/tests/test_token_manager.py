@@ -0,0 +1,98 @@
+"""Single-flight Google token refresh (backend/token_manager.py)."""
+
+import threading
+import time
+
+import pytest
+
+from backend import token_manager
+from backend.token_manager import TokenManager
+
+
+def token(access: str, expires_in: float) -> dict:
+    return {
+        "access_token": access,
+        "refresh_token": "refresh",
+        "expiry_date": str(int((time.time() + expires_in) * 1000)),
+    }
+
+
+@pytest.fixture
+def google(monkeypatch):
+    """Fake token endpoint; refreshes are slow enough for callers to pile up."""
+    monkeypatch.setenv("GOOGLE_CLIENT_ID", "client")
+    monkeypatch.setenv("GOOGLE_CLIENT_SECRET", "secret")
+    state = {"refreshes": 0, "writes": [], "fail": False}
+
+    def refresh_token(token_data):
+        state["refreshes"] += 1
+        time.sleep(0.1)
+        if state["fail"]:
+            raise RuntimeError("invalid_grant")
+        return token(f"fresh-{state['refreshes']}", 3600)
+
+    monkeypatch.setattr(token_manager, "refresh_token", refresh_token)
+    monkeypatch.setattr(token_manager.sb, "set_user_token",
+                        lambda user_id, token_data: state["writes"].append((user_id, token_data["access_token"])))
+    return state
+
+
+def concurrently(n, fn):
+    results = [None] * n
+
+    def run(i):
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_refresh(google):
+    manager = TokenManager()
+    expiring = token("old", 10)
+
+    results = concurrently(8, lambda: manager.ensure_fresh("u1", expiring))
+
+    assert google["refreshes"] == 1
+    assert google["writes"] == [("u1", "fresh-1")]
+    assert {result["access_token"] for result in results} == {"fresh-1"}
+
+
+def test_caller_with_a_stale_row_gets_the_refreshed_token(google):
+    manager = TokenManager()
+    expiring = token("old", 10)
+    manager.ensure_fresh("u1", expiring)
+
+    # Read from the database before the refresh was written back
+    assert manager.ensure_fresh("u1", expiring)["access_token"] == "fresh-1"
+    assert google["refreshes"] == 1
+
+
+def test_failed_refresh_falls_back_and_is_retried(google):
+    manager = TokenManager()
+    expiring = token("old", 10)
+    google["fail"] = True
+
+    results = concurrently(4, lambda: manager.ensure_fresh("u1", expiring))
+
+    assert google["refreshes"] == 1
+    assert {result["access_token"] for result in results} == {"old"}
+    assert google["writes"] == []
+
+    google["fail"] = False
+    assert manager.ensure_fresh("u1", expiring)["access_token"] == "fresh-2"
+
+
+def test_fresh_token_is_tracked_not_refreshed(google):
+    manager = TokenManager()
+    valid = token("valid", 3600)
+
+    assert manager.ensure_fresh("u1", valid) is valid
+    assert google["refreshes"] == 0
+    (refresh_at, _, user_id), = manager._heap
+    assert user_id == "u1"
+    assert refresh_at == pytest.approx(time.time() + 3600 - token_manager.REFRESH_MARGIN, abs=2)
@@ -0,0 +1,75 @@
+"""Google services shared across runs and threads (backend/tools/context.py)."""
+
+import threading
+import time
+
+import pytest
+
+from backend import token_manager
+from backend.tools import context
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    built = []
+
+    def build(token):
+        time.sleep(0.01)
+        built.append(token["access_token"])
+        return object()
+
+    monkeypatch.setattr(context, "_services", context.OrderedDict())
+    monkeypatch.setitem(context.SERVICE_BUILDERS, "gmail", build)
+    return built
+
+
+def test_one_build_per_user_across_threads(builds):
+    token = {"access_token": "a-1"}
+    services = []
+
+    def run():
+        services.append(context.shared_service("u1", "gmail", token))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert builds == ["a-1"]
+    assert all(service is services[0] for service in services)
+
+
+def test_new_access_token_rebuilds_and_drops_old_service(builds):
+    first = context.shared_service("u1", "gmail", {"access_token": "a-1"})
+    second = context.shared_service("u1", "gmail", {"access_token": "a-2"})
+
+    assert first is not second
+    assert builds == ["a-1", "a-2"]
+    assert list(context._services) == [("u1", "gmail", "a-2")]
+
+
+def test_cache_evicts_least_recently_used(builds, monkeypatch):
+    monkeypatch.setattr(context, "SERVICE_CACHE_SIZE", 2)
+    token = {"access_token": "a"}
+    context.shared_service("u1", "gmail", token)
+    context.shared_service("u2", "gmail", token)
+    context.shared_service("u1", "gmail", token)
+    context.shared_service("u3", "gmail", token)
+
+    assert [key[0] for key in context._services] == ["u1", "u3"]
+
+
+def test_built_service_gives_each_request_its_own_transport():
+    creds = token_manager.credentials_from_token({
+        "access_token": "a-1",
+        "expiry_date": str(int((time.time() + 3600) * 1000)),
+    })
+    service = token_manager.build_service("gmail", "v1", creds)
+
+    first = service.users().messages().list(userId="me")
+    second = service.users().messages().list(userId="me")
+
+    assert first.http is not second.http
+    assert first.http.http is not second.http.http
+    assert first.http.credentials is creds
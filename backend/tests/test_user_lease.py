@@ -0,0 +1,97 @@
+"""Per-user leases and task run coalescing (backend/user_lease.py)."""
+
+import threading
+import time
+
+from backend import user_lease
+from backend.user_lease import UserBusyError, submit_tasks
+
+
+def task(id):
+    return {"id": id, "type": "TODO"}
+
+
+def submit_during_run(user_id, first, later, fail_first=False):
+    """submit_tasks(first), with `later` submitted from another thread while the first batch runs."""
+    batches, results = [], []
+    started, resume = threading.Event(), threading.Event()
+
+    def run(batch, waited):
+        batches.append(sorted(t["id"] for t in batch))
+        if len(batches) == 1:
+            started.set()
+            resume.wait(5)
+            if fail_first:
+                raise RuntimeError("agent failed")
+
+    def other():
+        started.wait(5)
+        results.append(submit_tasks(user_id, later, run))
+        resume.set()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    results.insert(0, submit_tasks(user_id, first, run))
+    thread.join(5)
+    return batches, results
+
+
+def test_tasks_submitted_during_a_run_are_coalesced():
+    batches, results = submit_during_run("coalesce", [task(1)], [task(2), task(3)])
+    assert batches == [[1], [2, 3]]
+    assert results == [True, False]
+    assert "coalesce" not in user_lease._draining
+
+
+def test_failing_batch_does_not_strand_queued_tasks():
+    batches, results = submit_during_run("failing", [task(1)], [task(2)], fail_first=True)
+    assert batches == [[1], [2]]
+    assert results == [True, False]
+    assert "failing" not in user_lease._pending_tasks
+    assert "failing" not in user_lease._draining
+
+
+def test_runner_is_free_again_after_a_failure():
+    def run(batch, waited):
+        raise RuntimeError("agent failed")
+
+    assert submit_tasks("again", [task(1)], run) is True
+    ran = []
+    assert submit_tasks("again", [task(2)], lambda batch, waited: ran.extend(batch)) is True
+    assert ran == [task(2)]
+
+
+def test_lease_waits_for_the_holder_and_says_so():
+    order = []
+    holding = threading.Event()
+
+    def holder():
+        with user_lease.user_lease("wait") as waited:
+            order.append(("holder", waited))
+            holding.set()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    holding.wait(5)
+    with user_lease.user_lease("wait") as waited:
+        order.append(("second", waited))
+    thread.join()
+    assert order == [("holder", False), ("second", True)]
+
+
+def test_lease_times_out_with_user_busy():
+    with user_lease.user_lease("busy"):
+        thread_error = []
+
+        def second():
+            try:
+                with user_lease.user_lease("busy", timeout=0.05):
+                    pass
+            except UserBusyError as e:
+                thread_error.append(e)
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        thread.join(5)
+    assert len(thread_error) == 1
@@ -0,0 +1,136 @@
+"""Write-behind buffers: batching, retries, backpressure (backend/database/write_buffer.py)."""
+
+import threading
+import time
+
+import pytest
+
+from backend.database import write_buffer
+from backend.database.write_buffer import WriteBuffer
+
+
+class Table:
+    """insert() for a WriteBuffer that records batches and can fail or stall."""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.batches, self.failures, self.delay = [], failures, delay
+        self.active = self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def insert(self, rows):
+        with self.lock:
+            self.active += 1
+            self.overlaps += self.active > 1
+        try:
+            time.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("database unavailable")
+            self.batches.append([row["n"] for row in rows])
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def rows(self):
+        return [n for batch in self.batches for n in batch]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def small_buffers(monkeypatch):
+    monkeypatch.setattr(write_buffer, "FLUSH_ROWS", 3)
+    monkeypatch.setattr(write_buffer, "FLUSH_INTERVAL", 0.05)
+
+
+def test_full_batches_and_the_interval_trigger_writes():
+    table = Table()
+    buffer = WriteBuffer("test", table.insert)
+    for n in range(4):
+        buffer.add({"n": n})
+
+    wait_for(lambda: table.rows() == [0, 1, 2, 3])
+    assert table.batches == [[0, 1, 2], [3]]
+
+
+def test_failed_batch_is_kept_for_retry_and_visible_as_pending():
+    table = Table(failures=1)
+    buffer = WriteBuffer("test", table.insert)
+    for n in range(3):
+        buffer.add({"n": n, "user": "u1"})
+
+    wait_for(lambda: buffer._retries)
+    assert [row["n"] for row in buffer.pending(user="u1")] == [0, 1, 2]
+
+    buffer.flush()
+    assert table.rows() == [0, 1, 2]
+    assert buffer.pending() == []
+
+
+def test_rows_are_dropped_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(write_buffer, "MAX_ATTEMPTS", 1)
+    table = Table(failures=1)
+    buffer = WriteBuffer("test", table.insert)
+    for n in range(3):
+        buffer.add({"n": n})
+
+    wait_for(lambda: table.failures == 0)
+    wait_for(lambda: not buffer.pending())
+    buffer.flush()
+    assert table.rows() == []
+
+
+def test_retried_batch_can_land_after_newer_rows():
+    table = Table(failures=1)
+    buffer = WriteBuffer("test", table.insert)
+    for n in range(3):
+        buffer.add({"n": n})
+    wait_for(lambda: buffer._retries)
+    for n in range(3, 6):
+        buffer.add({"n": n})
+
+    wait_for(lambda: table.rows() == [3, 4, 5])
+    buffer.flush()
+    assert table.rows() == [3, 4, 5, 0, 1, 2]
+
+
+def test_backpressure_makes_the_producer_write_without_overlapping(monkeypatch):
+    monkeypatch.setattr(write_buffer, "MAX_PENDING", 3)
+    monkeypatch.setattr(write_buffer, "BACKPRESSURE_TIMEOUT", 0.01)
+    table = Table(delay=0.05)
+    buffer = WriteBuffer("test", table.insert)
+
+    producers = [
+        threading.Thread(target=lambda p=p: [buffer.add({"n": p * 100 + i}) for i in range(10)])
+        for p in range(3)
+    ]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join(10)
+    buffer.flush()
+
+    assert sorted(table.rows()) == sorted(p * 100 + i for p in range(3) for i in range(10))
+    assert table.overlaps == 0
+    # Without failures each producer's rows still land in the order it queued them
+    for p in range(3):
+        mine = [n for n in table.rows() if n // 100 == p]
+        assert mine == sorted(mine)
+
+
+def test_on_flush_sees_written_rows_and_its_errors_are_contained():
+    table, seen = Table(), []
+
+    def on_flush(rows):
+        seen.extend(row["n"] for row in rows)
+        raise RuntimeError("hook failed")
+
+    buffer = WriteBuffer("test", table.insert, on_flush=on_flush)
+    buffer.add({"n": 1})
+    buffer.flush()
+    assert table.rows() == [1] and seen == [1]
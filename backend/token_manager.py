@@ -0,0 +1,291 @@
+"""
+Google OAuth Token Manager
+==========================
+Keeps users' Google access tokens fresh so agent runs don't hit an expired
+token halfway through and have to redo the work.
+
+- ensure_fresh(user_id, token_data) returns a token that is valid for at
+  least REFRESH_MARGIN seconds, refreshing first if needed
+- refreshes are single-flight per user: concurrent callers wait for the one
+  refresh in progress instead of each spending the refresh token
+- every token seen is tracked and refreshed in the background REFRESH_MARGIN
+  before it expires (start_refresher), until the user has been idle for
+  TRACK_IDLE seconds
+- refreshed tokens are written back with sb.set_user_token
+
+Refreshing needs the OAuth client credentials in GOOGLE_CLIENT_ID and
+GOOGLE_CLIENT_SECRET; without them tokens are used as they are.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+import backend.database.supabase_db as sb
+from backend import clients, metrics
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+REFRESH_TIMEOUT = float(os.getenv("TOKEN_REFRESH_TIMEOUT", "20"))
+TRACK_IDLE = float(os.getenv("TOKEN_TRACK_IDLE", "86400"))
+RETRY_SECONDS = 60
+
+
+def expiry_seconds(token_data: dict) -> Optional[float]:
+    """Token expiry as epoch seconds; expiry_date may be in ms or s, number or string."""
+    value = (token_data or {}).get("expiry_date")
+    if value in (None, ""):
+        return None
+    try:
+        expiry = float(value)
+    except (TypeError, ValueError):
+        return None
+    return expiry / 1000 if expiry > 1e11 else expiry
+
+
+def credentials_from_token(token_data: dict) -> "Credentials":
+    """
+    Google credentials for a stored token, with its expiry and the OAuth
+    client so google-auth can refresh it.
+    """
+    from google.oauth2.credentials import Credentials
+
+    expiry = expiry_seconds(token_data)
+    scope = token_data.get('scope', '')
+    return Credentials(
+        token=token_data.get('access_token'),
+        refresh_token=token_data.get('refresh_token') or None,
+        token_uri=TOKEN_URI,
+        client_id=os.getenv("GOOGLE_CLIENT_ID"),
+        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        scopes=scope.split() if isinstance(scope, str) else scope,
+        # google-auth compares against naive UTC datetimes
+        expiry=datetime.fromtimestamp(expiry, timezone.utc).replace(tzinfo=None) if expiry else None
+    )
+
+
+def _auth_request():
+    from google.auth.transport.requests import Request
+
+    # One requests.Session for every refresh instead of a new one each time
+    return Request()
+
+
+def _discovery_build():
+    from googleapiclient.discovery import build
+
+    return build
+
+
+clients.register("google_auth", _auth_request)
+clients.register("google", _discovery_build)
+
+
+def _request_builder(credentials: "Credentials"):
+    """
+    requestBuilder giving every request its own authorized httplib2 transport.
+    httplib2.Http isn't thread-safe, so a service object whose requests all
+    share one can't be used from several tool threads at once; with a fresh
+    transport per request one service per user serves them all.
+    """
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import HttpRequest
+
+    def build_request(_shared_http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(credentials, http=httplib2.Http()), *args, **kwargs)
+
+    return build_request
+
+
+def build_service(service_name: str, version: str, credentials: "Credentials"):
+    """
+    googleapiclient's build(), with the discovery client loaded on first use.
+    The service is safe to share between threads (see _request_builder).
+    """
+    return clients.get("google")(
+        service_name, version, credentials=credentials,
+        requestBuilder=_request_builder(credentials),
+    )
+
+
+def can_refresh(token_data: dict) -> bool:
+    return bool(
+        (token_data or {}).get("refresh_token")
+        and os.getenv("GOOGLE_CLIENT_ID")
+        and os.getenv("GOOGLE_CLIENT_SECRET")
+    )
+
+
+def needs_refresh(token_data: dict, margin: float = REFRESH_MARGIN) -> bool:
+    expiry = expiry_seconds(token_data)
+    return expiry is not None and expiry - time.time() <= margin
+
+
+def refresh_token(token_data: dict) -> dict:
+    """Exchange the refresh token for a new access token (no caching, no write-back)."""
+    creds = credentials_from_token(token_data)
+    creds.refresh(clients.get("google_auth"))
+    expiry = creds.expiry.replace(tzinfo=timezone.utc).timestamp() if creds.expiry else time.time() + 3600
+    return {
+        **token_data,
+        "access_token": creds.token,
+        "refresh_token": creds.refresh_token or token_data.get("refresh_token"),
+        # Same format the frontend stores: milliseconds, as a string
+        "expiry_date": str(int(expiry * 1000)),
+    }
+
+
+class TokenManager:
+    def __init__(self):
+        self._tokens: dict[str, dict] = {}
+        self._last_used: dict[str, float] = {}
+        self._inflight: dict[str, Future] = {}
+        self._heap: list[tuple[float, int, str]] = []  # (refresh_at, seq, user_id)
+        self._entries: dict[str, int] = {}             # user_id -> live seq
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = True
+
+    def _schedule(self, user_id: str, at: float):
+        seq = next(self._seq)
+        self._entries[user_id] = seq
+        heapq.heappush(self._heap, (at, seq, user_id))
+        self._cond.notify()
+
+    def track(self, user_id: str, token_data: dict, touch: bool = True):
+        """Remember the user's current token and schedule its background refresh."""
+        if not token_data:
+            return
+        expiry = expiry_seconds(token_data)
+        with self._cond:
+            previous = self._tokens.get(user_id)
+            self._tokens[user_id] = token_data
+            if touch or user_id not in self._last_used:
+                self._last_used[user_id] = time.time()
+            already_scheduled = user_id in self._entries and previous and expiry_seconds(previous) == expiry
+            if expiry is not None and can_refresh(token_data) and not already_scheduled:
+                self._schedule(user_id, expiry - REFRESH_MARGIN)
+
+    def ensure_fresh(self, user_id: str, token_data: dict) -> dict:
+        """A token for the user that won't expire within REFRESH_MARGIN, refreshing if needed."""
+        with self._cond:
+            known = self._tokens.get(user_id)
+        # The caller may have read the row before our last refresh was written
+        if known and (expiry_seconds(known) or 0) > (expiry_seconds(token_data) or 0):
+            token_data = known
+
+        if not needs_refresh(token_data) or not can_refresh(token_data):
+            self.track(user_id, token_data)
+            return token_data
+        try:
+            return self.refresh(user_id, token_data)
+        except Exception as e:
+            logger.warning("⚠️ Token refresh for user %s failed, using the stored token: %s", user_id, e)
+            return token_data
+
+    def refresh(self, user_id: str, token_data: dict) -> dict:
+        """Refresh now, single-flight per user, and persist the new token."""
+        with self._cond:
+            future = self._inflight.get(user_id)
+            owner = future is None
+            if owner:
+                future = self._inflight[user_id] = Future()
+        if not owner:
+            metrics.increment("token_refresh_joined")
+            return future.result(timeout=REFRESH_TIMEOUT)
+
+        try:
+            fresh = refresh_token(token_data)
+            sb.set_user_token(user_id, fresh)
+            metrics.increment("token_refreshes")
+            logger.info("🔑 Refreshed Google token for user %s", user_id)
+            # Background refreshes don't count as the user being active
+            self.track(user_id, fresh, touch=False)
+            future.set_result(fresh)
+            return fresh
+        except Exception as e:
+            metrics.increment("token_refresh_failures")
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(user_id, None)
+
+    # -- background refresher ---------------------------------------------
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+                        heapq.heappop(self._heap)
+                    wait = self._heap[0][0] - time.time() if self._heap else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(timeout=wait)
+                if self._stopped:
+                    return
+                _, _, user_id = heapq.heappop(self._heap)
+                del self._entries[user_id]
+                token_data = self._tokens.get(user_id)
+                idle = time.time() - self._last_used.get(user_id, 0) > TRACK_IDLE
+                if idle:
+                    self._tokens.pop(user_id, None)
+                    self._last_used.pop(user_id, None)
+                    continue
+
+            try:
+                self.refresh(user_id, token_data)
+            except Exception as e:
+                logger.warning("⚠️ Background token refresh for user %s failed: %s", user_id, e)
+                expiry = expiry_seconds(token_data) or 0
+                if expiry > time.time():
+                    with self._cond:
+                        if user_id not in self._entries:
+                            self._schedule(user_id, time.time() + RETRY_SECONDS)
+
+    def start(self):
+        if not self._stopped:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+_manager = TokenManager()
+
+
+def ensure_fresh(user_id: str, token_data: dict) -> dict:
+    return _manager.ensure_fresh(user_id, token_data)
+
+
+def track(user_id: str, token_data: dict):
+    _manager.track(user_id, token_data)
+
+
+def start_refresher():
+    _manager.start()
+
+
+def stop_refresher():
+    _manager.stop()
@@ -2,23 +2,8 @@
 Google Calendar Integration
 """
 
-from .tools import (
-    list_calendars_tool,
-    get_calendar_events_tool,
-    get_all_calendar_events_tool,
-    search_calendar_events_tool,
-    create_calendar_event_tool,
-    update_calendar_event_tool,
-    delete_calendar_event_tool
-)
+from .tools import calendar_tools
 
 __all__ = [
-    'list_calendars_tool',
-    'get_calendar_events_tool',
-    'get_all_calendar_events_tool',
-    'search_calendar_events_tool',
-    'create_calendar_event_tool',
-    'update_calendar_event_tool',
-    'delete_calendar_event_tool'
+    'calendar_tools'
 ]
-
@@ -7,10 +7,25 @@ Prerequisites:
 3. Run from: backend/ directory using: python -m tools.calendar_fetch
 """
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from backend.token_manager import build_service as build, credentials_from_token, ensure_fresh
 from datetime import datetime, timedelta
 import json
+import time
+from backend import metrics, rate_limit
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class CalendarFetchError(Exception):
+    """Some calendars couldn't be fetched; `errors` maps calendar id to its error."""
+
+    def __init__(self, errors: dict):
+        self.errors = errors
+        super().__init__("Could not fetch calendar(s) " + ", ".join(
+            f"{calendar_id} ({error})" for calendar_id, error in errors.items()
+        ))
+
 
 def create_credentials_from_token(token_data):
     """
@@ -21,44 +36,32 @@ def create_credentials_from_token(token_data):
                    expiry_date (in milliseconds), scope
     
     Returns:
-        Credentials object ready to use with Google APIs
+        Credentials object ready to use with Google APIs (expiry and OAuth
+        client set, so it can be refreshed)
     """
-    # Convert expiry from milliseconds to seconds if needed
-    expiry_timestamp = token_data.get('expiry_date')
-    if expiry_timestamp:
-        # If it's in milliseconds (13 digits), convert to seconds
-        if len(str(expiry_timestamp)) > 10:
-            expiry_timestamp = int(expiry_timestamp) / 1000
-    
-    # Create credentials object
-    creds = Credentials(
-        token=token_data.get('access_token'),
-        refresh_token=token_data.get('refresh_token') or None,
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=None,  # Not needed for API calls
-        client_secret=None,  # Not needed for API calls
-        scopes=token_data.get('scope', '').split() if isinstance(token_data.get('scope'), str) else token_data.get('scope', [])
-    )
-    
-    return creds
+    return credentials_from_token(token_data)
 
-def get_calendar_service(token_data):
+def get_calendar_service(token_data, user_id=None):
     """
     Get authenticated calendar service from token data
     
     Args:
         token_data: Dict from frontend OAuth or database
+        user_id: Owner of the token; if given, an expiring token is
+                 refreshed (and saved) first
     
     Returns:
         Google Calendar API service object
     """
+    if user_id:
+        token_data = ensure_fresh(user_id, token_data)
     creds = create_credentials_from_token(token_data)
     return build('calendar', 'v3', credentials=creds)
 
 def list_calendars(service):
     """List all calendars"""
     try:
-        calendars = service.calendarList().list().execute()
+        calendars = rate_limit.execute("calendar", service.calendarList().list())
         
         calendar_list = []
         for calendar in calendars.get('items', []):
@@ -70,8 +73,8 @@ def list_calendars(service):
         
         return calendar_list
     except Exception as e:
-        print(f"Error listing calendars: {e}")
-        return []
+        logger.error("Error listing calendars: %s", e)
+        raise
 
 def get_events(service, calendar_id='primary', max_results=10, time_min=None):
     """
@@ -85,18 +88,22 @@ def get_events(service, calendar_id='primary', max_results=10, time_min=None):
     
     Returns:
         List of event dictionaries
+
+    Raises:
+        Exception: The request failed (after retries); an empty list always
+                   means the calendar has no events
     """
     try:
         if time_min is None:
             time_min = datetime.utcnow()
         
-        events_result = service.events().list(
+        events_result = rate_limit.execute("calendar", service.events().list(
             calendarId=calendar_id,
             timeMin=time_min.isoformat() + 'Z',
             maxResults=max_results,
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ))
         
         events = events_result.get('items', [])
         
@@ -116,19 +123,19 @@ def get_events(service, calendar_id='primary', max_results=10, time_min=None):
         
         return formatted_events
     except Exception as e:
-        print(f"Error fetching events: {e}")
-        return []
+        logger.error("Error fetching events: %s", e)
+        raise
 
 def get_events_in_range(service, start_date, end_date, calendar_id='primary'):
     """Get events within a specific date range"""
     try:
-        events_result = service.events().list(
+        events_result = rate_limit.execute("calendar", service.events().list(
             calendarId=calendar_id,
             timeMin=start_date.isoformat() + 'Z',
             timeMax=end_date.isoformat() + 'Z',
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ))
         
         events = events_result.get('items', [])
         
@@ -145,8 +152,118 @@ def get_events_in_range(service, start_date, end_date, calendar_id='primary'):
         
         return formatted_events
     except Exception as e:
-        print(f"Error fetching events in range: {e}")
+        logger.error("Error fetching events in range: %s", e)
+        raise
+
+def get_events_all_calendars(service, time_min=None, time_max=None, max_results_per_calendar=50):
+    """
+    Get events from every calendar the user has, in one batched request
+    
+    Args:
+        service: Calendar service object
+        time_min: Start time (datetime object), defaults to now
+        time_max: Optional end time (datetime object)
+        max_results_per_calendar: Maximum number of events per calendar
+    
+    Returns:
+        List of event dictionaries tagged with calendar_name / calendar_id
+
+    Raises:
+        CalendarFetchError: Some calendar couldn't be fetched, so the events
+                            would be incomplete
+    """
+    calendars = list_calendars(service)
+    logger.info("📋 Found %d calendar(s)", len(calendars))
+    
+    if not calendars:
         return []
+    
+    all_events = []
+    calendar_map = {}  # Map request_id to calendar info
+    throttled = {}  # request_id -> error, retried in a follow-up batch
+    failed = {}  # request_id -> error
+    
+    def callback(request_id, response, exception):
+        """Callback for each batch response"""
+        if exception:
+            if rate_limit.is_retryable(exception):
+                throttled[request_id] = exception
+                return
+            logger.warning("⚠️ Error fetching %s: %s", request_id, exception)
+            failed[request_id] = exception
+            return
+        
+        cal_info = calendar_map[request_id]
+        events_data = response.get('items', [])
+        
+        # Format events
+        for event in events_data:
+            formatted_event = {
+                'id': event['id'],
+                'summary': event.get('summary', 'No title'),
+                'description': event.get('description', ''),
+                'start': event['start'].get('dateTime', event['start'].get('date')),
+                'end': event['end'].get('dateTime', event['end'].get('date')),
+                'location': event.get('location', ''),
+                'attendees': event.get('attendees', []),
+                'htmlLink': event.get('htmlLink', ''),
+                'calendar_name': cal_info['name'],
+                'calendar_id': cal_info['id']
+            }
+            all_events.append(formatted_event)
+    
+    if time_min is None:
+        time_min = datetime.utcnow()
+    
+    for cal in calendars:
+        calendar_map[cal['id']] = {'id': cal['id'], 'name': cal['summary']}
+    
+    def run_batch(request_ids):
+        # Create batch request
+        batch = service.new_batch_http_request(callback=callback)
+        
+        # Add all calendar requests to batch
+        for request_id in request_ids:
+            params = {
+                'calendarId': request_id,
+                'timeMin': time_min.isoformat() + 'Z',
+                'maxResults': max_results_per_calendar,
+                'singleEvents': True,
+                'orderBy': 'startTime'
+            }
+            if time_max is not None:
+                params['timeMax'] = time_max.isoformat() + 'Z'
+            
+            batch.add(service.events().list(**params), request_id=request_id)
+        
+        # Each sub-request counts against the quota
+        rate_limit.execute("calendar", batch, tokens=len(request_ids))
+    
+    # Execute all requests in parallel
+    logger.info("🚀 Fetching events from %d calendars in parallel...", len(calendars))
+    run_batch(list(calendar_map))
+    
+    # Calendars that were throttled get retried with backoff instead of silently dropped
+    for attempt in range(rate_limit.MAX_RETRIES):
+        if not throttled:
+            break
+        retry_ids, errors = list(throttled), list(throttled.values())
+        throttled.clear()
+        delay = max(max(rate_limit.note_throttled("calendar", e) for e in errors), rate_limit.backoff_delay(attempt))
+        metrics.increment("upstream_retries", len(retry_ids), upstream="calendar")
+        logger.info("⏳ Retrying %d throttled calendar(s) in %.1fs", len(retry_ids), delay)
+        time.sleep(delay)
+        run_batch(retry_ids)
+    
+    for request_id, exception in throttled.items():
+        metrics.increment("upstream_giveups", upstream="calendar")
+        logger.warning("⚠️ Error fetching %s: %s", request_id, exception)
+        failed[request_id] = exception
+    
+    if failed:
+        raise CalendarFetchError(failed)
+    
+    return all_events
 
 def create_event(service, event_data, calendar_id='primary'):
     """
@@ -190,10 +307,10 @@ def create_event(service, event_data, calendar_id='primary'):
         if 'reminders' in event_data:
             event['reminders'] = event_data['reminders']
         
-        created_event = service.events().insert(
+        created_event = rate_limit.execute("calendar", service.events().insert(
             calendarId=calendar_id, 
             body=event
-        ).execute()
+        ), idempotent=False)
         
         return {
             'id': created_event['id'],
@@ -201,55 +318,58 @@ def create_event(service, event_data, calendar_id='primary'):
             'summary': created_event.get('summary')
         }
     except Exception as e:
-        print(f"Error creating event: {e}")
+        rate_limit.reraise_circuit_open(e)
+        logger.error("Error creating event: %s", e)
         return None
 
 def update_event(service, event_id, updates, calendar_id='primary'):
     """Update an existing event"""
     try:
         # Get the existing event
-        event = service.events().get(
+        event = rate_limit.execute("calendar", service.events().get(
             calendarId=calendar_id, 
             eventId=event_id
-        ).execute()
+        ))
         
         # Update fields
         for key, value in updates.items():
             event[key] = value
         
-        updated_event = service.events().update(
+        updated_event = rate_limit.execute("calendar", service.events().update(
             calendarId=calendar_id,
             eventId=event_id,
             body=event
-        ).execute()
+        ), idempotent=False)
         
         return updated_event
     except Exception as e:
-        print(f"Error updating event: {e}")
+        rate_limit.reraise_circuit_open(e)
+        logger.error("Error updating event: %s", e)
         return None
 
 def delete_event(service, event_id, calendar_id='primary'):
     """Delete an event"""
     try:
-        service.events().delete(
+        rate_limit.execute("calendar", service.events().delete(
             calendarId=calendar_id, 
             eventId=event_id
-        ).execute()
+        ), idempotent=False)
         return True
     except Exception as e:
-        print(f"Error deleting event: {e}")
+        rate_limit.reraise_circuit_open(e)
+        logger.error("Error deleting event: %s", e)
         return False
 
 def search_events(service, query, calendar_id='primary', max_results=10):
     """Search for events by keyword"""
     try:
-        events_result = service.events().list(
+        events_result = rate_limit.execute("calendar", service.events().list(
             calendarId=calendar_id,
             q=query,
             maxResults=max_results,
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ))
         
         events = events_result.get('items', [])
         
@@ -264,8 +384,8 @@ def search_events(service, query, calendar_id='primary', max_results=10):
         
         return formatted_events
     except Exception as e:
-        print(f"Error searching events: {e}")
-        return []
+        logger.error("Error searching events: %s", e)
+        raise
 
 # # Example usage with your database
 # if __name__ == '__main__':
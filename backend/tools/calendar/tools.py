@@ -1,172 +1,112 @@
-from ai_sdk import tool
+from typing import TYPE_CHECKING
+from ai_sdk import Tool, tool
 from .calendar_fetch import (
-    get_calendar_service, 
     list_calendars, 
     get_events, 
+    get_events_all_calendars,
     create_event, 
     search_events,
     update_event,
     delete_event
 )
-import backend.database.supabase_db as sb
+from backend.tools.output_budget import fit_output, shrink_event
+from backend.circuit_breaker import CircuitOpenError
+from backend.log import get_logger
 from datetime import datetime
 
-# Hardcoded user ID for testing
-USER_ID = "e6ac7c44-b6d3-465c-9d75-3d44611d0e6c"
+if TYPE_CHECKING:
+    from backend.tools.context import ToolContext
 
+logger = get_logger(__name__)
 
-def list_calendars_execute() -> list[dict]:
+
+def list_calendars_execute(ctx: "ToolContext") -> list[dict]:
     """List all calendars for a user"""
-    print(f"🔧 Listing calendars for user: {USER_ID}")
+    logger.info("🔧 Listing calendars for user: %s", ctx.user_id)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return [{"error": "User has not connected Google Calendar"}]
-        
-        service = get_calendar_service(token_data)
         calendars = list_calendars(service)
-        print(f"✅ Found {len(calendars)} calendars")
+        logger.info("✅ Found %d calendars", len(calendars))
         return calendars
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return [{"error": str(e)}]
 
 
 def get_calendar_events_execute(
+    ctx: "ToolContext",
     max_results: int = 10, 
     calendar_id: str = "primary",
     days_ahead: int = 7
 ) -> list[dict]:
     """Get upcoming calendar events for a user"""
-    print(f"🔧 Fetching {max_results} events for user: {USER_ID} (next {days_ahead} days)")
+    logger.info("🔧 Fetching %s events for user: %s (next %s days)", max_results, ctx.user_id, days_ahead)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return [{"error": "User has not connected Google Calendar"}]
-        
-        service = get_calendar_service(token_data)
         events = get_events(service, calendar_id=calendar_id, max_results=max_results)
-        print(f"✅ Found {len(events)} events")
-        return events
+        logger.info("✅ Found %d events", len(events))
+        return fit_output("get_calendar_events", events, shrink_event)
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return [{"error": str(e)}]
 
 
 def get_all_calendar_events_execute(
+    ctx: "ToolContext",
     max_results_per_calendar: int = 50
 ) -> list[dict]:
     """Get upcoming events from ALL user calendars (batched for performance)"""
-    print(f"🔧 Fetching events from ALL calendars for user: {USER_ID}")
+    logger.info("🔧 Fetching events from ALL calendars for user: %s", ctx.user_id)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return [{"error": "User has not connected Google Calendar"}]
+        all_events = get_events_all_calendars(
+            service,
+            max_results_per_calendar=max_results_per_calendar
+        )
         
-        service = get_calendar_service(token_data)
-        
-        # First, get all calendars
-        calendars = list_calendars(service)
-        print(f"📋 Found {len(calendars)} calendar(s)")
-        
-        if not calendars:
-            return []
-        
-        # Use batch API for parallel fetching
-        from googleapiclient.http import BatchHttpRequest
-        
-        all_events = []
-        calendar_map = {}  # Map request_id to calendar info
-        
-        def callback(request_id, response, exception):
-            """Callback for each batch response"""
-            if exception:
-                print(f"  ⚠️  Error fetching {request_id}: {exception}")
-                return
-            
-            cal_info = calendar_map[request_id]
-            events_data = response.get('items', [])
-            
-            # Format events
-            for event in events_data:
-                formatted_event = {
-                    'id': event['id'],
-                    'summary': event.get('summary', 'No title'),
-                    'description': event.get('description', ''),
-                    'start': event['start'].get('dateTime', event['start'].get('date')),
-                    'end': event['end'].get('dateTime', event['end'].get('date')),
-                    'location': event.get('location', ''),
-                    'attendees': event.get('attendees', []),
-                    'htmlLink': event.get('htmlLink', ''),
-                    'calendar_name': cal_info['name'],
-                    'calendar_id': cal_info['id']
-                }
-                all_events.append(formatted_event)
-        
-        # Create batch request
-        batch = service.new_batch_http_request(callback=callback)
-        
-        # Add all calendar requests to batch
-        time_min = datetime.utcnow()
-        for cal in calendars:
-            cal_id = cal['id']
-            cal_name = cal['summary']
-            request_id = cal_id
-            
-            calendar_map[request_id] = {'id': cal_id, 'name': cal_name}
-            
-            batch.add(
-                service.events().list(
-                    calendarId=cal_id,
-                    timeMin=time_min.isoformat() + 'Z',
-                    maxResults=max_results_per_calendar,
-                    singleEvents=True,
-                    orderBy='startTime'
-                ),
-                request_id=request_id
-            )
-        
-        # Execute all requests in parallel
-        print(f"  🚀 Fetching events from {len(calendars)} calendars in parallel...")
-        batch.execute()
-        
-        print(f"✅ Total events across all calendars: {len(all_events)}")
-        return all_events
+        logger.info("✅ Total events across all calendars: %d", len(all_events))
+        return fit_output("get_all_calendar_events", all_events, shrink_event)
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return [{"error": str(e)}]
 
 
 def search_calendar_events_execute(
+    ctx: "ToolContext",
     query: str,
     max_results: int = 10,
     calendar_id: str = "primary"
 ) -> list[dict]:
     """Search calendar events by keyword"""
-    print(f"🔧 Searching calendar for: '{query}'")
+    logger.info("🔧 Searching calendar for: '%s'", query)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return [{"error": "User has not connected Google Calendar"}]
-        
-        service = get_calendar_service(token_data)
         events = search_events(service, query, calendar_id=calendar_id, max_results=max_results)
-        print(f"✅ Found {len(events)} matching events")
-        return events
+        logger.info("✅ Found %d matching events", len(events))
+        return fit_output("search_calendar_events", events, shrink_event)
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return [{"error": str(e)}]
 
 
 def create_calendar_event_execute(
+    ctx: "ToolContext",
     summary: str,
     start_datetime: str,
     end_datetime: str,
@@ -175,16 +115,12 @@ def create_calendar_event_execute(
     calendar_id: str = "primary"
 ) -> dict:
     """Create a new calendar event"""
-    print(f"🔧 Creating event: {summary}")
+    logger.info("🔧 Creating event: %s", summary)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return {"error": "User has not connected Google Calendar"}
         
-        service = get_calendar_service(token_data)
-        
         # Parse datetime strings (supports ISO format)
         start = datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
         end = datetime.fromisoformat(end_datetime.replace('Z', '+00:00'))
@@ -198,14 +134,20 @@ def create_calendar_event_execute(
         }
         
         result = create_event(service, event_data, calendar_id=calendar_id)
-        print(f"✅ Event created successfully")
+        if result is None:
+            return {"error": "Google Calendar did not confirm the event was created. "
+                             "Check the calendar before creating it again."}
+        logger.info("✅ Event created successfully")
         return result
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"error": str(e)}
 
 
 def update_calendar_event_execute(
+    ctx: "ToolContext",
     event_id: str,
     summary: str = None,
     start_datetime: str = None,
@@ -215,16 +157,12 @@ def update_calendar_event_execute(
     calendar_id: str = "primary"
 ) -> dict:
     """Update an existing calendar event"""
-    print(f"🔧 Updating event: {event_id}")
+    logger.info("🔧 Updating event: %s", event_id)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return {"error": "User has not connected Google Calendar"}
         
-        service = get_calendar_service(token_data)
-        
         # Build updates dict
         updates = {}
         if summary is not None:
@@ -239,49 +177,54 @@ def update_calendar_event_execute(
             updates['end'] = datetime.fromisoformat(end_datetime.replace('Z', '+00:00'))
         
         result = update_event(service, event_id, updates, calendar_id=calendar_id)
-        print(f"✅ Event updated successfully")
+        if result is None:
+            return {"error": f"Google Calendar did not confirm event {event_id} was updated. "
+                             "Re-read it before updating it again."}
+        logger.info("✅ Event updated successfully")
         return result
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"error": str(e)}
 
 
 def delete_calendar_event_execute(
+    ctx: "ToolContext",
     event_id: str,
     calendar_id: str = "primary"
 ) -> dict:
     """Delete a calendar event"""
-    print(f"🔧 Deleting event: {event_id}")
+    logger.info("🔧 Deleting event: %s", event_id)
     try:
-        user_context = sb.get_user_context(USER_ID)
-        token_data = user_context.get("google_token")
-        
-        if not token_data:
+        service = ctx.calendar_service()
+        if service is None:
             return {"error": "User has not connected Google Calendar"}
-        
-        service = get_calendar_service(token_data)
-        delete_event(service, event_id, calendar_id=calendar_id)
-        print(f"✅ Event deleted successfully")
+        if not delete_event(service, event_id, calendar_id=calendar_id):
+            return {"error": f"Google Calendar did not confirm event {event_id} was deleted. "
+                             "Re-read the calendar before deleting it again."}
+        logger.info("✅ Event deleted successfully")
         return {"success": True, "message": "Event deleted"}
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"❌ Error: {e}")
+        logger.error("❌ Error: %s", e)
         return {"error": str(e)}
 
 
-# tools
+# tool schemas
 
-list_calendars_tool = tool(
+LIST_CALENDARS = dict(
     name="list_calendars",
     description="List all Google calendars for a user. Returns calendar names, IDs, and access roles.",
     parameters={
         "type": "object",
         "properties": {},
         "required": []
-    },
-    execute=list_calendars_execute
+    }
 )
 
-get_calendar_events_tool = tool(
+GET_CALENDAR_EVENTS = dict(
     name="get_calendar_events",
     description="Get upcoming events from a single specific calendar. Use get_all_calendar_events instead to see ALL calendars at once.",
     parameters={
@@ -304,11 +247,10 @@ get_calendar_events_tool = tool(
             }
         },
         "required": []
-    },
-    execute=get_calendar_events_execute
+    }
 )
 
-get_all_calendar_events_tool = tool(
+GET_ALL_CALENDAR_EVENTS = dict(
     name="get_all_calendar_events",
     description="RECOMMENDED: Get upcoming events from ALL user calendars at once. This is the primary tool you should use to understand the user's full schedule across all their calendars (work, personal, etc).",
     parameters={
@@ -321,11 +263,10 @@ get_all_calendar_events_tool = tool(
             }
         },
         "required": []
-    },
-    execute=get_all_calendar_events_execute
+    }
 )
 
-search_calendar_events_tool = tool(
+SEARCH_CALENDAR_EVENTS = dict(
     name="search_calendar_events",
     description="Search for calendar events by keyword. Searches event titles, descriptions, and locations.",
     parameters={
@@ -347,11 +288,10 @@ search_calendar_events_tool = tool(
             }
         },
         "required": ["query"]
-    },
-    execute=search_calendar_events_execute
+    }
 )
 
-create_calendar_event_tool = tool(
+CREATE_CALENDAR_EVENT = dict(
     name="create_calendar_event",
     description="Create a new event in the user's Google Calendar. Requires title, start time, and end time. Optionally add description, location.",
     parameters={
@@ -386,11 +326,10 @@ create_calendar_event_tool = tool(
             }
         },
         "required": ["summary", "start_datetime", "end_datetime"]
-    },
-    execute=create_calendar_event_execute
+    }
 )
 
-update_calendar_event_tool = tool(
+UPDATE_CALENDAR_EVENT = dict(
     name="update_calendar_event",
     description="Update an existing calendar event. Can modify title, time, description, or location. Only provide fields you want to change.",
     parameters={
@@ -427,11 +366,10 @@ update_calendar_event_tool = tool(
             }
         },
         "required": ["event_id"]
-    },
-    execute=update_calendar_event_execute
+    }
 )
 
-delete_calendar_event_tool = tool(
+DELETE_CALENDAR_EVENT = dict(
     name="delete_calendar_event",
     description="Delete a calendar event permanently. Use with caution - this cannot be undone.",
     parameters={
@@ -448,20 +386,28 @@ delete_calendar_event_tool = tool(
             }
         },
         "required": ["event_id"]
-    },
-    execute=delete_calendar_event_execute
+    }
 )
 
 
-# export all tools
+# bound per run
 
-__all__ = [
-    'list_calendars_tool',
-    'get_calendar_events_tool',
-    'get_all_calendar_events_tool',
-    'search_calendar_events_tool',
-    'create_calendar_event_tool',
-    'update_calendar_event_tool',
-    'delete_calendar_event_tool'
+_TOOLS = [
+    (LIST_CALENDARS, list_calendars_execute),
+    (GET_CALENDAR_EVENTS, get_calendar_events_execute),
+    (GET_ALL_CALENDAR_EVENTS, get_all_calendar_events_execute),
+    (SEARCH_CALENDAR_EVENTS, search_calendar_events_execute),
+    (CREATE_CALENDAR_EVENT, create_calendar_event_execute),
+    (UPDATE_CALENDAR_EVENT, update_calendar_event_execute),
+    (DELETE_CALENDAR_EVENT, delete_calendar_event_execute),
 ]
 
+
+def calendar_tools(ctx: "ToolContext") -> list[Tool]:
+    """The calendar tools, acting for the user in `ctx`."""
+    return [tool(**spec, execute=ctx.bind(execute)) for spec, execute in _TOOLS]
+
+
+# export all tools
+
+__all__ = ['calendar_tools']
@@ -0,0 +1,118 @@
+"""
+Tool Context
+============
+Binds the calendar and email tools to one user for one agent run, so a
+process can serve many users' runs at once:
+
+    ctx = ToolContext(user_id, token_data=user_context.get("google_token"))
+    tools = calendar_tools(ctx) + email_tools(ctx)
+
+The context loads the user's Google token once (or takes the one the caller
+already has) and refreshes it through token_manager. The Calendar / Gmail
+service objects built from it are shared across runs and worker threads: a
+process-wide LRU cache keyed by user, API and access token, so a refreshed
+(or reconnected) token gets a new service. Sharing one service between the
+concurrent tool threads is safe because token_manager.build_service gives
+every request its own httplib2 transport. Bound tools attribute their upstream calls to the user
+(rate_limit.acting_for), whichever thread runs them.
+"""
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import backend.database.supabase_db as sb
+from backend import rate_limit
+from backend.token_manager import ensure_fresh
+from backend.tools.calendar.calendar_fetch import get_calendar_service
+from backend.tools.email.email_fetcher import get_gmail_service
+
+SERVICE_BUILDERS = {
+    "calendar": get_calendar_service,
+    "gmail": get_gmail_service,
+}
+
+# Services kept process-wide, least recently used dropped first
+SERVICE_CACHE_SIZE = int(os.getenv("TOOL_SERVICE_CACHE_SIZE", "64"))
+
+_services: "OrderedDict[tuple, object]" = OrderedDict()
+_services_lock = threading.Lock()
+
+
+def shared_service(user_id: str, api: str, token: dict):
+    """
+    The service for (user_id, api) with this access token, built once and
+    reused by every run and thread until the user's access token changes.
+    """
+    key = (user_id, api, token.get("access_token"))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            # Built under the lock: concurrent first calls share one build,
+            # and building from a static discovery document is local work
+            service = _services[key] = SERVICE_BUILDERS[api](token)
+            # The service for the user's previous token is dead weight now
+            for stale in [k for k in _services if k[:2] == key[:2] and k != key]:
+                del _services[stale]
+            if len(_services) > SERVICE_CACHE_SIZE:
+                _services.popitem(last=False)
+        _services.move_to_end(key)
+        return service
+
+
+class ToolContext:
+    def __init__(self, user_id: str, token_data: Optional[dict] = None):
+        """
+        Args:
+            user_id: User the tools act for
+            token_data: The user's stored Google token if the caller already
+                        loaded it; read from the database on first use otherwise
+        """
+        self.user_id = user_id
+        self._token = token_data
+        self._token_loaded = token_data is not None
+        self._lock = threading.Lock()
+
+    def google_token(self) -> Optional[dict]:
+        """The user's Google token, refreshed if it is about to expire; None if not connected."""
+        with self._lock:
+            if not self._token_loaded:
+                self._token = sb.get_user_context(self.user_id).get("google_token")
+                self._token_loaded = True
+            token = self._token
+        if not token:
+            return None
+
+        fresh = ensure_fresh(self.user_id, token)
+        if fresh is not token:
+            with self._lock:
+                self._token = fresh
+        return fresh
+
+    def service(self, api: str):
+        """
+        Authenticated Google API service for this user ("calendar" or "gmail").
+
+        Returns:
+            The service object, or None if the user hasn't connected Google
+        """
+        token = self.google_token()
+        if not token:
+            return None
+        return shared_service(self.user_id, api, token)
+
+    def calendar_service(self):
+        return self.service("calendar")
+
+    def gmail_service(self):
+        return self.service("gmail")
+
+    def bind(self, execute: Callable) -> Callable:
+        """Tool handler calling execute(ctx, **args) on behalf of this context's user."""
+        @functools.wraps(execute)
+        def handler(**kwargs):
+            with rate_limit.acting_for(self.user_id):
+                return execute(self, **kwargs)
+        return handler
@@ -0,0 +1,338 @@
+"""
+Deadline Extraction
+===================
+Pulls date, time and deadline mentions out of email bodies and scraped
+pages without an LLM pass, so the agent gets a few structured candidates
+instead of reading the whole text to find "due Friday 5pm":
+
+    extract("Coursework 2 is due Friday 5pm", reference=message_date)
+    -> [{"title": "Coursework 2 is due Friday 5pm", "datetime": "2025-11-14T17:00:00+00:00",
+         "all_day": False, "span": [20, 30], "confidence": 0.8}]
+
+Recognised: ISO dates, "12 Nov (2025)", "November 12th", "12/11/2025"
+(day first unless DEADLINE_DATE_ORDER=MDY), today / tonight / tomorrow,
+(this / next) weekdays, "in 3 days", "end of the week", plus a time nearby
+("5pm", "17:00", "noon"). Relative dates resolve against the reference time:
+the email's Date header, or now for a scraped page. Dates already past the
+reference are dropped. A "12/11" without a year, or "may 12" in lower case,
+only counts right after a date word ("due 12/11", "on Fri 12/11", "by may
+12"), so "rated 4/5", "24/7 support" and "you may 5 times" aren't dates.
+
+confidence starts from how specific the date is and goes up with a time
+and with deadline wording on the same line (due, deadline, closes, submit,
+by, ...; only the strong words for numeric and "may" dates); candidates
+under DEADLINE_MIN_CONFIDENCE are dropped. Results are
+cached per (content hash, reference date), so the same email or an
+unchanged page is only scanned once.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from backend import metrics
+
+MIN_CONFIDENCE = float(os.getenv("DEADLINE_MIN_CONFIDENCE", "0.4"))
+MAX_DEADLINES = int(os.getenv("DEADLINE_MAX_RESULTS", "10"))
+DATE_ORDER = os.getenv("DEADLINE_DATE_ORDER", "DMY").upper()
+CACHE_SIZE = int(os.getenv("DEADLINE_CACHE_SIZE", "1024"))
+
+# Only the start of very long pages is scanned
+MAX_SCAN_CHARS = 50000
+TITLE_CHARS = 80
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7}
+
+_MONTH = (
+    r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+)
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+DATE_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<iso>(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2}))"
+    rf"|(?P<dmy_d>\d{{1,2}}){_ORDINAL}(?:\s+of)?\s+(?P<dmy_m>{_MONTH})(?:,?\s+(?P<dmy_y>\d{{4}}))?"
+    rf"|(?P<mdy_m>{_MONTH})\s+(?P<mdy_d>\d{{1,2}}){_ORDINAL}(?:,?\s+(?P<mdy_y>\d{{4}}))?"
+    r"|(?P<num_a>\d{1,2})/(?P<num_b>\d{1,2})(?:/(?P<num_y>\d{4}|\d{2}))?"
+    r"|(?P<rel>today|tonight|tomorrow|tmrw)"
+    r"|(?:(?P<wd_mod>this|next|coming)\s+)?(?P<wd>monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+    r"|in\s+(?P<in_n>\d{1,2}|an?|one|two|three|four|five|six|seven)\s+(?P<in_unit>days?|weeks?)"
+    r"|end\s+of\s+(?:the\s+)?(?P<eo>day|week|month)"
+    r"|(?P<next_week>next\s+week)"
+    r")(?:\b|(?=T\d))",
+    re.I
+)
+
+TIME_PATTERN = re.compile(
+    r"(?:\b|(?<=\dT))(?:"
+    r"(?P<h12>1[0-2]|0?[1-9])(?:[:.](?P<m12>[0-5]\d))?\s*(?P<ampm>[ap])\.?m\b\.?"
+    r"|(?P<h24>[01]?\d|2[0-3]):(?P<m24>[0-5]\d)\b"
+    r"|(?P<named>noon|midday|midnight)"
+    r")",
+    re.I
+)
+NAMED_TIMES = {"noon": time(12), "midday": time(12), "midnight": time(23, 59)}
+# How far from a date a time may sit and still belong to it
+TIME_WINDOW = 25
+
+STRONG_WORDS = re.compile(
+    r"\b(due|deadline|closes?|closing|submit\w*|submission|expires?|expiry|"
+    r"no later than|last day|cut-?off|apply by|register by)\b",
+    re.I
+)
+WEAK_WORDS = re.compile(r"\b(by|before|until|apply|register|rsvp|exam|interview|test|quiz|meeting)\b", re.I)
+# What must come right before a year-less "4/5" or a lower case "may 5" (see _ambiguous)
+DATE_LEAD = re.compile(
+    r"\b(?:on|by|before|until|till|due|from|deadline|date|dated|closes?|closing|ends?|expires?|"
+    r"(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?)[:,]?\s*$",
+    re.I
+)
+LEAD_CHARS = 20
+
+# Base confidence by how specific the date expression is
+SPECIFICITY = {"iso": 0.45, "dmy": 0.4, "mdy": 0.4, "num": 0.3, "rel": 0.35, "wd": 0.35, "in": 0.3, "eo": 0.3, "next_week": 0.2}
+
+_MARKDOWN = [
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), ""),
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"[*_`#>|]+"), " "),
+    (re.compile(r"\s+"), " "),
+]
+
+_cache: "OrderedDict[tuple, list[dict]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _year_for(month: int, day: int, reference: date) -> int:
+    """A date without a year is the next one on or after (about) the reference."""
+    try:
+        candidate = date(reference.year, month, day)
+    except ValueError:
+        return reference.year
+    return reference.year + 1 if candidate < reference - timedelta(days=60) else reference.year
+
+
+def _full_year(year: str) -> int:
+    value = int(year)
+    return value + 2000 if value < 100 else value
+
+
+def _resolve_date(match: re.Match, reference: date) -> tuple[Optional[date], Optional[str]]:
+    """(date, kind) for a DATE_PATTERN match; date is None if it isn't a real date."""
+    g = match.groupdict()
+    try:
+        if g["iso"]:
+            return date(int(g["iso_y"]), int(g["iso_m"]), int(g["iso_d"])), "iso"
+        if g["dmy_d"] or g["mdy_d"]:
+            kind = "dmy" if g["dmy_d"] else "mdy"
+            day = int(g[f"{kind}_d"])
+            month = MONTHS[g[f"{kind}_m"][:3].lower()]
+            year = int(g[f"{kind}_y"]) if g[f"{kind}_y"] else _year_for(month, day, reference)
+            return date(year, month, day), kind
+        if g["num_a"]:
+            a, b = int(g["num_a"]), int(g["num_b"])
+            day, month = (b, a) if DATE_ORDER == "MDY" else (a, b)
+            year = _full_year(g["num_y"]) if g["num_y"] else _year_for(month, day, reference)
+            return date(year, month, day), "num"
+    except ValueError:
+        return None, None
+
+    if g["rel"]:
+        offset = 1 if g["rel"].lower() in ("tomorrow", "tmrw") else 0
+        return reference + timedelta(days=offset), "rel"
+    if g["wd"]:
+        weekday = WEEKDAYS.index(g["wd"].lower())
+        ahead = (weekday - reference.weekday()) % 7
+        # "next Friday" said on a Monday is the Friday of next week
+        if (g["wd_mod"] or "").lower() == "next" and weekday >= reference.weekday():
+            ahead += 7
+        return reference + timedelta(days=ahead), "wd"
+    if g["in_n"]:
+        n = NUMBERS.get(g["in_n"].lower()) or int(g["in_n"])
+        days = n * 7 if g["in_unit"].lower().startswith("week") else n
+        return reference + timedelta(days=days), "in"
+    if g["eo"]:
+        unit = g["eo"].lower()
+        if unit == "day":
+            return reference, "eo"
+        if unit == "week":
+            return reference + timedelta(days=(4 - reference.weekday()) % 7), "eo"
+        next_month = (reference.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return next_month - timedelta(days=1), "eo"
+    if g["next_week"]:
+        return reference + timedelta(days=7 - reference.weekday()), "next_week"
+    return None, None
+
+
+def _ambiguous(match: re.Match) -> bool:
+    """A year-less "4/5" or lower case "may 5": as often a fraction, a score or the verb as a date."""
+    g = match.groupdict()
+    if g["num_a"]:
+        return not g["num_y"]
+    month = g["dmy_m"] or g["mdy_m"]
+    return month is not None and month.rstrip(".") == "may" and not (g["dmy_y"] or g["mdy_y"])
+
+
+def _to_time(match: re.Match) -> time:
+    g = match.groupdict()
+    if g["named"]:
+        return NAMED_TIMES[g["named"].lower()]
+    if g["h12"]:
+        hour = int(g["h12"]) % 12 + (12 if g["ampm"].lower() == "p" else 0)
+        return time(hour, int(g["m12"] or 0))
+    return time(int(g["h24"]), int(g["m24"]))
+
+
+def _find_time(text: str, start: int, end: int) -> tuple[Optional[time], int, int]:
+    """The time closest after (or else before) the date at text[start:end]."""
+    after = TIME_PATTERN.search(text, end, min(len(text), end + TIME_WINDOW))
+    if after:
+        return _to_time(after), start, after.end()
+    before = None
+    for before in TIME_PATTERN.finditer(text, max(0, start - TIME_WINDOW), start):
+        pass
+    if before:
+        return _to_time(before), before.start(), end
+    return None, start, end
+
+
+def _clean(text: str) -> str:
+    for pattern, replacement in _MARKDOWN:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _context(text: str, start: int, end: int) -> tuple[str, str]:
+    """(line containing the span, title excerpt around it)."""
+    line_start = text.rfind("\n", 0, start) + 1
+    line_end = text.find("\n", end)
+    line_end = len(text) if line_end == -1 else line_end
+    line = text[line_start:line_end]
+
+    # Markdown is stripped per side, so a link cut in half can't leak into the title
+    room = (TITLE_CHARS - (end - start)) // 2
+    before, after = _clean(text[line_start:start]), _clean(text[end:line_end])
+    if len(before) > room:
+        before = "…" + before[-room:].split(" ", 1)[-1]
+    if len(after) > room:
+        after = after[:room].rsplit(" ", 1)[0] + "…"
+    title = f"{before}{_clean(text[start:end])}{after}".strip(" -:;,.")
+    return line, title
+
+
+def _scan(text: str, reference: datetime, limit: int) -> list[dict]:
+    today = reference.date()
+    best: dict[str, dict] = {}
+    for match in DATE_PATTERN.finditer(text[:MAX_SCAN_CHARS]):
+        day, kind = _resolve_date(match, today)
+        if day is None or day < today:
+            continue
+        ambiguous = _ambiguous(match)
+        if ambiguous and not DATE_LEAD.search(text, max(0, match.start() - LEAD_CHARS), match.start()):
+            continue
+        at, start, end = _find_time(text, match.start(), match.end())
+        line, title = _context(text, start, end)
+
+        confidence = SPECIFICITY[kind] + (0.1 if at else 0)
+        if STRONG_WORDS.search(line):
+            confidence += 0.35
+        elif WEAK_WORDS.search(line) and kind != "num" and not ambiguous:
+            confidence += 0.15
+        confidence = round(min(confidence, 0.95), 2)
+        if confidence < MIN_CONFIDENCE:
+            continue
+
+        when = datetime.combine(day, at, reference.tzinfo).isoformat() if at else day.isoformat()
+        if when not in best or confidence > best[when]["confidence"]:
+            best[when] = {
+                "title": title,
+                "datetime": when,
+                "all_day": at is None,
+                "span": [start, end],
+                "confidence": confidence,
+            }
+
+    # "due Thursday" and "Thursday by 10am" are one deadline; keep the timed one
+    timed = {d["datetime"][:10] for d in best.values() if not d["all_day"]}
+    candidates = [d for d in best.values() if not (d["all_day"] and d["datetime"] in timed)]
+    kept = sorted(candidates, key=lambda d: -d["confidence"])[:limit]
+    return sorted(kept, key=lambda d: d["datetime"])
+
+
+def extract(text: str, reference: Optional[datetime] = None, limit: int = MAX_DEADLINES) -> list[dict]:
+    """
+    Deadline candidates in `text`, earliest first.
+
+    Args:
+        text: Plain text or markdown (email body, scraped page)
+        reference: When the text was written; relative dates resolve
+                   against it (default: now, UTC)
+        limit: Most candidates returned (the most confident ones)
+
+    Returns:
+        List of {"title", "datetime" (ISO; a date when all_day), "all_day",
+        "span" ([start, end] offsets into text), "confidence" (0-1)}
+    """
+    if not text:
+        return []
+    reference = reference or datetime.now(timezone.utc)
+    key = (hashlib.sha256(text.encode("utf-8", "replace")).hexdigest(), reference.date(), reference.utcoffset(), limit)
+
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is not None:
+        metrics.increment("deadline_cache", result="hit")
+        return [dict(d) for d in cached]
+
+    metrics.increment("deadline_cache", result="miss")
+    found = _scan(text, reference, limit)
+    with _lock:
+        _cache[key] = found
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return [dict(d) for d in found]
+
+
+def email_reference(email: dict) -> Optional[datetime]:
+    """When an email (email_fetcher format) was sent: its Date header, else Gmail's internalDate."""
+    try:
+        if email.get("date"):
+            return parsedate_to_datetime(email["date"])
+    except (TypeError, ValueError):
+        pass
+    if email.get("internal_date"):
+        return datetime.fromtimestamp(email["internal_date"] / 1000, timezone.utc)
+    return None
+
+
+def from_email(email: dict, limit: int = MAX_DEADLINES) -> list[dict]:
+    """Deadline candidates in an email's subject and body (snippet if there's no body)."""
+    text = f"{email.get('subject', '')}\n{email.get('body') or email.get('snippet', '')}"
+    return extract(text, email_reference(email), limit)
+
+
+def annotate_emails(emails: list[dict]) -> list[dict]:
+    """Add a "deadlines" list to each email dict (in place); returns the list."""
+    for email in emails:
+        email["deadlines"] = from_email(email)
+    return emails
+
+
+def format_deadlines(deadlines: list[dict]) -> str:
+    """One compact line per candidate, for prompts."""
+    return "; ".join(
+        f"{d['datetime']} \"{d['title']}\" ({d['confidence']})" for d in deadlines
+    )
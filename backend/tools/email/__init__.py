@@ -2,17 +2,8 @@
 Gmail Integration
 """
 
-from backend.tools.email.tools import (
-    get_unread_emails_tool,
-    get_emails_from_sender_tool,
-    search_emails_tool,
-    send_email_tool
-)
+from backend.tools.email.tools import email_tools
 
 __all__ = [
-    'get_unread_emails_tool',
-    'get_emails_from_sender_tool',
-    'search_emails_tool',
-    'send_email_tool'
+    'email_tools'
 ]
-
@@ -10,14 +10,17 @@ Prerequisites:
 3. Run from: backend/ directory using: python -m tools.email_fetcher
 """
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from backend.token_manager import build_service as build, credentials_from_token, ensure_fresh
 from datetime import datetime
 import base64
 from email.mime.text import MIMEText
 import backend.database.supabase_db as sb
+from backend import rate_limit
+from backend.log import get_logger
 import json
 
+logger = get_logger(__name__)
+
 
 def create_credentials_from_token(token_data):
     """
@@ -28,35 +31,25 @@ def create_credentials_from_token(token_data):
                    expiry_date (in milliseconds), scope
     
     Returns:
-        Credentials object ready to use with Google APIs
+        Credentials object ready to use with Google APIs (expiry and OAuth
+        client set, so it can be refreshed)
     """
-    # Convert expiry from milliseconds to seconds if needed
-    expiry_timestamp = token_data.get('expiry_date')
-    if expiry_timestamp and len(str(expiry_timestamp)) > 10:
-        expiry_timestamp = int(expiry_timestamp) / 1000
-    
-    # Create credentials object
-    creds = Credentials(
-        token=token_data.get('access_token'),
-        refresh_token=token_data.get('refresh_token') or None,
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=None,
-        client_secret=None,
-        scopes=token_data.get('scope', '').split() if isinstance(token_data.get('scope'), str) else token_data.get('scope', [])
-    )
-    
-    return creds
+    return credentials_from_token(token_data)
 
-def get_gmail_service(token_data):
+def get_gmail_service(token_data, user_id=None):
     """
     Get authenticated Gmail service from token data
     
     Args:
         token_data: Dict from frontend OAuth or database
+        user_id: Owner of the token; if given, an expiring token is
+                 refreshed (and saved) first
     
     Returns:
         Gmail API service object
     """
+    if user_id:
+        token_data = ensure_fresh(user_id, token_data)
     creds = create_credentials_from_token(token_data)
     return build('gmail', 'v1', credentials=creds)
 
@@ -95,7 +88,7 @@ def parse_email_body(payload):
                     payload['body']['data']
                 ).decode('utf-8', errors='ignore')
     except Exception as e:
-        print(f"Error parsing body: {e}")
+        logger.warning("Error parsing body: %s", e)
     
     return body
 
@@ -106,6 +99,24 @@ def get_header_value(headers, name):
             return header['value']
     return ''
 
+def email_from_message(message, number=1):
+    """Email dict (EZGmail-like format) from a Gmail API message fetched with format='full'"""
+    headers = message['payload']['headers']
+    return {
+        "email_number": number,
+        "id": message['id'],
+        "thread_id": message['threadId'],
+        "sender": get_header_value(headers, 'From'),
+        "to": get_header_value(headers, 'To'),
+        "subject": get_header_value(headers, 'Subject'),
+        "date": get_header_value(headers, 'Date'),
+        "internal_date": int(message.get('internalDate', 0)),
+        "snippet": message.get('snippet', ''),
+        "body": parse_email_body(message['payload']),
+        "labels": message.get('labelIds', []),
+        "is_unread": "UNREAD" in message.get('labelIds', [])
+    }
+
 def mail_fetch(service=None, token_data=None, start_date=None, max_results=20, query='in:inbox'):
     """
     Fetch emails from Gmail
@@ -113,12 +124,17 @@ def mail_fetch(service=None, token_data=None, start_date=None, max_results=20, q
     Args:
         service: Gmail service object (if None, will create from token_data)
         token_data: User's OAuth token dict (required if service is None)
-        start_date: Filter emails after this date (format: 'yyyy/mm/dd')
+        start_date: Filter emails after this date (format: 'yyyy/mm/dd', or Unix seconds)
         max_results: Maximum number of emails to fetch
         query: Gmail search query (default: 'in:inbox')
     
     Returns:
-        List of email dictionaries matching EZGmail format
+        List of email dictionaries matching EZGmail format; messages that
+        fail to fetch individually are skipped
+
+    Raises:
+        Exception: The search itself failed, so an empty list always means
+                   no matching mail
     """
     if service is None:
         if token_data is None:
@@ -132,72 +148,145 @@ def mail_fetch(service=None, token_data=None, start_date=None, max_results=20, q
         if start_date:
             query = f"{query} after:{start_date}"
         
-        print(f"Searching Gmail with query: '{query}'")
+        logger.info("Searching Gmail with query: '%s'", query)
         
         # Get message IDs
-        results = service.users().messages().list(
+        results = rate_limit.execute("gmail", service.users().messages().list(
             userId='me',
             q=query,
             maxResults=max_results
-        ).execute()
+        ))
         
         messages = results.get('messages', [])
         
         if not messages:
-            print("No emails found bhai")
+            logger.info("No emails found bhai")
             return []
         
-        print(f"Displaying the {len(messages)} most recent emails:\n")
+        logger.info("Displaying the %d most recent emails", len(messages))
         
         # Fetch full message details for each
         for i, msg in enumerate(messages):
             try:
-                message = service.users().messages().get(
+                message = rate_limit.execute("gmail", service.users().messages().get(
                     userId='me',
                     id=msg['id'],
                     format='full'
-                ).execute()
-                
-                headers = message['payload']['headers']
+                ))
                 
-                # Extract email data in format
-                email_data = {
-                    "email_number": i + 1,
-                    "id": message['id'],
-                    "thread_id": message['threadId'],
-                    "sender": get_header_value(headers, 'From'),
-                    "to": get_header_value(headers, 'To'),
-                    "subject": get_header_value(headers, 'Subject'),
-                    "date": get_header_value(headers, 'Date'),
-                    "snippet": message.get('snippet', ''),
-                    "body": parse_email_body(message['payload']),
-                    "labels": message.get('labelIds', []),
-                    "is_unread": "UNREAD" in message.get('labelIds', [])
-                }
-                
-                all_emails_list.append(email_data)
+                all_emails_list.append(email_from_message(message, i + 1))
                 
             except Exception as e:
-                print(f"Error fetching message {msg['id']}: {e}")
+                rate_limit.reraise_circuit_open(e)
+                logger.warning("Error fetching message %s: %s", msg['id'], e)
                 continue
         
         return all_emails_list
         
     except Exception as e:
-        print(f"Error in mail_fetch: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        logger.exception("Error in mail_fetch: %s", e)
+        raise
 
-def get_unread_emails(service=None, token_data=None, max_results=10):
-    """Get only unread emails"""
+def get_unread_emails(service=None, token_data=None, max_results=10, after=None):
+    """Get only unread emails (received after the Unix time `after`, if given)"""
     return mail_fetch(
         service=service,
         token_data=token_data,
+        start_date=str(after) if after is not None else None,
         max_results=max_results,
         query='is:unread'
     )
 
+def list_message_ids(service, query, limit, page_size=500):
+    """
+    IDs of the messages matching `query`, newest first, following
+    nextPageToken until there are no more pages or `limit` IDs are listed
+
+    Returns:
+        (ids, complete) - complete is False if more messages match
+    """
+    ids, page_token = [], None
+    while True:
+        page = rate_limit.execute("gmail", service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(page_size, limit - len(ids)),
+            pageToken=page_token
+        ))
+        ids.extend(msg['id'] for msg in page.get('messages', []))
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return ids, True
+        if len(ids) >= limit:
+            return ids, False
+
+def get_unread_backlog(service=None, token_data=None, after=None, max_results=20, max_listed=500):
+    """
+    Unread emails for an EMAIL task run (backend/email_watermark.py). Unlike
+    mail_fetch, it reports exactly which stretch of the inbox it covers, so
+    a watermark is never moved past mail that wasn't fetched.
+
+    With `after` (Unix seconds), every unread message past it is listed,
+    page by page, and the oldest `max_results` of them are fetched; the rest
+    wait for the next run. Without it, the newest `max_results`.
+
+    Returns:
+        (emails newest first, window) - window is {"from", "to", "pending"}:
+        every unread message with an internalDate (ms) from "from" up to "to"
+        is in `emails`, unless fetching it failed. "to" stops before the
+        first message (oldest first) that failed or wasn't fetched; both are
+        None if there is no such stretch. "pending" counts the listed
+        messages left for a later run.
+
+    Raises:
+        Exception: Listing the inbox failed
+    """
+    if service is None:
+        if token_data is None:
+            raise ValueError("Either service or token_data must be provided")
+        service = get_gmail_service(token_data)
+
+    query = 'is:unread' if after is None else f'is:unread after:{after}'
+    limit = max_listed if after is not None else max_results
+    ids, complete = list_message_ids(service, query, limit)
+    # Oldest first; with a watermark take the oldest so what's fetched runs on from it
+    ids.reverse()
+    selected = ids[:max_results] if after is not None else ids[-max_results:]
+    logger.info("Listed %d unread email(s) with query '%s', fetching %d", len(ids), query, len(selected))
+
+    emails, upto, start, gap = [], None, None, False
+    for msg_id in selected:
+        try:
+            message = rate_limit.execute("gmail", service.users().messages().get(
+                userId='me',
+                id=msg_id,
+                format='full'
+            ))
+            email = email_from_message(message)
+        except Exception as e:
+            rate_limit.reraise_circuit_open(e)
+            logger.warning("Error fetching message %s: %s", msg_id, e)
+            gap = True
+            continue
+        emails.append(email)
+        if not gap:
+            start = email["internal_date"] if start is None else start
+            upto = max(upto or 0, email["internal_date"])
+
+    if upto is None:
+        lower = None
+    elif complete and after is not None:
+        lower = (after + 1) * 1000
+    elif complete and len(selected) == len(ids):
+        lower = 0
+    else:
+        lower = start
+
+    emails.reverse()
+    for number, email in enumerate(emails, 1):
+        email["email_number"] = number
+    return emails, {"from": lower, "to": upto, "pending": len(ids) - len(selected)}
+
 def get_emails_from_sender(service=None, token_data=None, sender_email='', max_results=10):
     """Get emails from specific sender"""
     return mail_fetch(
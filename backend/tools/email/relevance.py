@@ -0,0 +1,163 @@
+"""
+Email Relevance
+===============
+Cheap local scoring of fetched emails, so the model only sees the handful
+that could matter for scheduling instead of every newsletter in the inbox.
+
+A score adds up:
+- Gmail labels: promotions / social / forums count against, IMPORTANT and
+  STARRED for
+- sender: no-reply, newsletter and marketing addresses count against
+- subject and snippet keywords: deadline, due, submit, interview, ...
+  (subject hits weigh more); unsubscribe / sale / webinar count against
+- date and time mentions: "Friday", "12 Nov", "tomorrow", "5pm"
+- the task's own words (title and prompt), for EMAIL task runs
+
+rank() keeps emails scoring at least `min_score`, best first, at most
+`top_k`. An EMAIL task can set its own email_min_score / email_top_k in its
+context; otherwise EMAIL_MIN_SCORE (default 1) and EMAIL_TOP_K (default 8)
+apply.
+"""
+
+import os
+import re
+from typing import Iterable, Optional
+
+DEFAULT_MIN_SCORE = float(os.getenv("EMAIL_MIN_SCORE", "1"))
+DEFAULT_TOP_K = int(os.getenv("EMAIL_TOP_K", "8"))
+
+LABEL_WEIGHTS = {
+    "CATEGORY_PROMOTIONS": -3.0,
+    "CATEGORY_SOCIAL": -2.0,
+    "CATEGORY_FORUMS": -1.5,
+    "CATEGORY_UPDATES": -0.5,
+    "CATEGORY_PERSONAL": 0.5,
+    "IMPORTANT": 1.5,
+    "STARRED": 1.0,
+}
+
+BULK_SENDER = re.compile(r"no-?reply|do-?not-?reply|newsletter|marketing|notifications?@|digest|mailer", re.I)
+
+DEADLINE_WORDS = re.compile(
+    r"\b(deadline|due|submit\w*|submission|assignment|coursework|homework|exam|quiz|"
+    r"interview|application|apply|closes?|closing|extension|reminder|rsvp|"
+    r"register|registration|expires?|by end of|asap|urgent|action required)\b",
+    re.I
+)
+BULK_WORDS = re.compile(r"\b(unsubscribe|sale|\d+% off|webinar|digest|newsletter|promo\w*|deal)\b", re.I)
+
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+DATE_MENTION = re.compile(
+    r"\b(today|tonight|tomorrow|next week|this week|end of (the )?(day|week|month)|"
+    r"(mon|tues|wednes|thurs|fri|satur|sun)day|"
+    rf"\d{{1,2}}(st|nd|rd|th)? {_MONTH}|{_MONTH} \d{{1,2}}(st|nd|rd|th)?|"
+    r"\d{1,2}/\d{1,2}(/\d{2,4})?|\d{1,2}(:\d{2})? ?(am|pm))\b",
+    re.I
+)
+
+# Words too common in task prompts to say anything about an email
+_STOPWORDS = {
+    "about", "after", "also", "check", "email", "emails", "every", "from", "have", "inbox",
+    "into", "keep", "mail", "monitor", "more", "need", "news", "that", "their", "them",
+    "then", "there", "these", "they", "this", "track", "what", "when", "which", "will",
+    "with", "your", "item", "items",
+}
+
+
+def score(email: dict, terms: Iterable[str] = ()) -> tuple[float, list[str]]:
+    """
+    Score one email (as returned by email_fetcher.mail_fetch).
+
+    Args:
+        email: Email dict with sender, subject, snippet and labels
+        terms: Lowercase words that make an email relevant to the task at hand
+
+    Returns:
+        (score, reasons) - reasons are short labels for logs and debugging
+    """
+    total, reasons = 0.0, []
+
+    for label in email.get("labels") or []:
+        weight = LABEL_WEIGHTS.get(label)
+        if weight:
+            total += weight
+            reasons.append(label.lower())
+
+    if BULK_SENDER.search(email.get("sender") or ""):
+        total -= 1.0
+        reasons.append("bulk_sender")
+
+    subject = email.get("subject") or ""
+    text = f"{subject} {email.get('snippet') or ''}"
+    if DEADLINE_WORDS.search(subject):
+        total += 2.0
+        reasons.append("subject_keyword")
+    elif DEADLINE_WORDS.search(text):
+        total += 1.0
+        reasons.append("keyword")
+    if BULK_WORDS.search(text):
+        total -= 1.5
+        reasons.append("bulk_wording")
+    if DATE_MENTION.search(text):
+        total += 1.5
+        reasons.append("date_mention")
+
+    if terms:
+        words = set(re.findall(r"[a-z0-9]+", text.lower()))
+        hits = sum(1 for term in terms if term in words)
+        if hits:
+            total += min(hits * 0.5, 2.0)
+            reasons.append(f"task_terms:{hits}")
+
+    return total, reasons
+
+
+def rank(
+    emails: list[dict],
+    terms: Iterable[str] = (),
+    min_score: float = DEFAULT_MIN_SCORE,
+    top_k: int = DEFAULT_TOP_K
+) -> list[dict]:
+    """
+    The emails worth showing the model, best first.
+
+    Returns:
+        At most `top_k` emails scoring at least `min_score`, each with a
+        "relevance" score added
+    """
+    terms = list(terms)
+    scored = []
+    for position, email in enumerate(emails):
+        value, _ = score(email, terms)
+        if value >= min_score:
+            # Ties keep Gmail's newest-first order
+            scored.append((-value, position, {**email, "relevance": value}))
+    scored.sort(key=lambda item: item[:2])
+    return [email for _, _, email in scored[:top_k]]
+
+
+def task_terms(task: dict) -> list[str]:
+    """Distinctive words from an EMAIL task's title and prompt."""
+    context = task.get("context") or {}
+    text = f"{task.get('title', '')} {context.get('prompt', '')}".lower()
+    return sorted({
+        word for word in re.findall(r"[a-z0-9]+", text)
+        if len(word) >= 4 and word not in _STOPWORDS and not word.isdigit()
+    })
+
+
+def thresholds(task: Optional[dict]) -> tuple[float, int]:
+    """(min_score, top_k) for a task, from its context or the env defaults."""
+    context = (task or {}).get("context") or {}
+    min_score = context.get("email_min_score")
+    top_k = context.get("email_top_k")
+    return (
+        DEFAULT_MIN_SCORE if min_score is None else float(min_score),
+        DEFAULT_TOP_K if top_k is None else int(top_k)
+    )
+
+
+def for_task(task: dict, emails: list[dict]) -> list[dict]:
+    """rank() with the task's own words and thresholds."""
+    min_score, top_k = thresholds(task)
+    return rank(emails, task_terms(task), min_score=min_score, top_k=top_k)
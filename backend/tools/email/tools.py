@@ -1,7 +1,7 @@
-from ai_sdk import tool
+from typing import TYPE_CHECKING
+from ai_sdk import Tool, tool
 from .email_fetcher import (
     create_credentials_from_token,
-    get_gmail_service,
     parse_email_body,
     get_header_value,
     mail_fetch,
@@ -9,11 +9,18 @@ from .email_fetcher import (
     get_emails_from_sender,
     search_emails
 )
-import backend.database.supabase_db as sb
+from backend.tools.deadlines import annotate_emails
+from backend.tools.email import relevance
+from backend.tools.knowledge import index_emails
+from backend.tools.output_budget import fit_output, shrink_email
+from backend.circuit_breaker import CircuitOpenError
+from backend.log import get_logger
 from datetime import datetime
 
-# Hardcoded user ID for testing
-USER_ID = "e6ac7c44-b6d3-465c-9d75-3d44611d0e6c"
+if TYPE_CHECKING:
+    from backend.tools.context import ToolContext
+
+logger = get_logger(__name__)
 
 """
 Email Tools for AI Agent
@@ -22,29 +29,28 @@ Email Tools for AI Agent
 This file follows the 3-layer pattern:
 - Layer 1 (Core): Imported from .emails_fetched.py (e.g., get_unread_emails, search_emails)
 - Layer 2 (Wrapper): execute functions (e.g., get_unread_emails_execute)
-- Layer 3 (Tool): tool definitions (e.g., get_unread_emails_tool)
+- Layer 3 (Tool): tool schemas (e.g., GET_UNREAD_EMAILS), bound to a user
+  per agent run by email_tools(ctx)
 
 The wrapper functions (Layer 2) are responsible for:
-1. Getting the user's ID (hardcoded for this example).
-2. Fetching the user's Google token from the database (Supabase).
-3. Creating the authenticated 'service' object.
-4. Calling the core logic function (Layer 1) with that service.
+1. Getting the authenticated 'service' object from the run's ToolContext
+   (which loads the user's Google token and reuses the service).
+2. Calling the core logic function (Layer 1) with that service.
+3. Adding the deadlines found in each email (backend/tools/deadlines.py),
+   so the model doesn't have to hunt for dates in the bodies, and adding
+   the emails to the user's knowledge index (backend/tools/knowledge.py).
 """
 
 # --- Helper Function ---
 
-def _get_authenticated_service(user_id):
+def _get_authenticated_service(ctx: "ToolContext"):
     """
-    Internal helper to get token from DB and create a service.
+    Internal helper to get the run's Gmail service.
     This encapsulates the common part of all Layer 2 wrappers.
     """
-    user_context = sb.get_user_context(user_id)
-    token_data = user_context.get("google_token")
-
-    if not token_data:
+    service = ctx.gmail_service()
+    if service is None:
         raise ConnectionError("User is not authenticated with Google.")
-        
-    service = get_gmail_service(token_data)
     return service
 
 # =================================================================
@@ -52,41 +58,57 @@ def _get_authenticated_service(user_id):
 # =================================================================
 
 # --- Layer 2: Wrapper Function ---
-def get_unread_emails_execute(max_results: int = 20):
+def get_unread_emails_execute(ctx: "ToolContext", max_results: int = 20, include_all: bool = False):
     """
     AI-callable tool to get unread emails.
-    Handles user authentication automatically.
+    Handles user authentication automatically. Unless include_all is set,
+    only the emails relevance.rank() keeps are returned, best first.
     """
     try:
-        print(f"--- Executing get_unread_emails_execute for user {USER_ID} ---")
+        logger.info("--- Executing get_unread_emails_execute for user %s ---", ctx.user_id)
         # 1. Get user's token from DB and create service
-        service = _get_authenticated_service(USER_ID)
+        service = _get_authenticated_service(ctx)
         
         # 2. Call the core function (Layer 1)
-        emails = get_unread_emails(service=service, max_results=max_results)
-        print(f"Retrieved emails: {[email["subject"] for email in emails]}")
-        return emails
+        emails = annotate_emails(get_unread_emails(service=service, max_results=max_results))
+        logger.debug("Retrieved emails: %s", [email["subject"] for email in emails])
+        index_emails(ctx.user_id, emails)
+        if not include_all:
+            ranked = relevance.rank(emails)
+            logger.info("Kept %d of %d unread emails as relevant", len(ranked), len(emails))
+            emails = ranked
+        return fit_output("get_unread_emails", emails, shrink_email)
 
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"Error in get_unread_emails_execute: {e}")
+        logger.error("Error in get_unread_emails_execute: %s", e)
         return f"An error occurred while fetching unread emails: {e}"
 
 # --- Layer 3: Tool Definition ---
-get_unread_emails_tool = tool(
+GET_UNREAD_EMAILS = dict(
     name="get_unread_emails",
-    description="Fetches a list of the user's most recent unread emails from their Gmail inbox.",
+    description=(
+        "Fetches the user's most recent unread emails from their Gmail inbox, "
+        "keeping only those likely to matter for scheduling (deadlines, dates, "
+        "important senders), most relevant first."
+    ),
     parameters={
         "type": "object",
         "properties": {
             "max_results": {
                 "type": "integer",
-                "description": "The maximum number of unread emails to return.",
+                "description": "The maximum number of unread emails to look at.",
                 "default": 20
+            },
+            "include_all": {
+                "type": "boolean",
+                "description": "Return every unread email, including newsletters and notifications.",
+                "default": False
             }
         },
         "required": []
-    },
-    execute=get_unread_emails_execute
+    }
 )
 
 # =================================================================
@@ -94,14 +116,14 @@ get_unread_emails_tool = tool(
 # =================================================================
 
 # --- Layer 2: Wrapper Function ---
-def get_emails_from_sender_execute(sender_email: str, max_results: int = 20):
+def get_emails_from_sender_execute(ctx: "ToolContext", sender_email: str, max_results: int = 20):
     """
     AI-callable tool to get emails from a specific sender.
     Handles user authentication automatically.
     """
     try:
         # 1. Get user's token from DB and create service
-        service = _get_authenticated_service(USER_ID)
+        service = _get_authenticated_service(ctx)
         
         # 2. Call the core function (Layer 1)
         emails = get_emails_from_sender(
@@ -109,14 +131,17 @@ def get_emails_from_sender_execute(sender_email: str, max_results: int = 20):
             sender_email=sender_email, 
             max_results=max_results
         )
-        return emails
+        index_emails(ctx.user_id, annotate_emails(emails))
+        return fit_output("get_emails_from_sender", emails, shrink_email)
         
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"Error in get_emails_from_sender_execute: {e}")
+        logger.error("Error in get_emails_from_sender_execute: %s", e)
         return f"An error occurred while fetching emails from {sender_email}: {e}"
 
 # --- Layer 3: Tool Definition ---
-get_emails_from_sender_tool = tool(
+GET_EMAILS_FROM_SENDER = dict(
     name="get_emails_from_sender",
     description="Fetches a list of recent emails from a specific sender's email address.",
     parameters={
@@ -133,8 +158,7 @@ get_emails_from_sender_tool = tool(
             }
         },
         "required": ["sender_email"]
-    },
-    execute=get_emails_from_sender_execute
+    }
 )
 
 # =================================================================
@@ -142,14 +166,14 @@ get_emails_from_sender_tool = tool(
 # =================================================================
 
 # --- Layer 2: Wrapper Function ---
-def search_emails_execute(search_term: str, max_results: int = 20):
+def search_emails_execute(ctx: "ToolContext", search_term: str, max_results: int = 20):
     """
     AI-callable tool to search emails by a keyword.
     Handles user authentication automatically.
     """
     try:
         # 1. Get user's token from DB and create service
-        service = _get_authenticated_service(USER_ID)
+        service = _get_authenticated_service(ctx)
         
         # 2. Call the core function (Layer 1)
         emails = search_emails(
@@ -157,14 +181,17 @@ def search_emails_execute(search_term: str, max_results: int = 20):
             search_term=search_term, 
             max_results=max_results
         )
-        return emails
+        index_emails(ctx.user_id, annotate_emails(emails))
+        return fit_output("search_emails", emails, shrink_email)
         
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"Error in search_emails_execute: {e}")
+        logger.error("Error in search_emails_execute: %s", e)
         return f"An error occurred while searching for emails with term '{search_term}': {e}"
 
 # --- Layer 3: Tool Definition ---
-search_emails_tool = tool(
+SEARCH_EMAILS = dict(
     name="search_emails",
     description="Searches the user's emails (subject and body) for a specific keyword or search term.",
     parameters={
@@ -181,8 +208,7 @@ search_emails_tool = tool(
             }
         },
         "required": ["search_term"]
-    },
-    execute=search_emails_execute
+    }
 )
 
 
@@ -194,13 +220,13 @@ search_emails_tool = tool(
 # would add them following the same pattern.
 
 # --- Layer 2: Wrapper Function (Example for send_email) ---
-def send_email_execute(to: str, subject: str, body: str):
+def send_email_execute(ctx: "ToolContext", to: str, subject: str, body: str):
     """
     AI-callable tool to send an email.
     Handles user authentication automatically.
     """
     try:
-        service = _get_authenticated_service(USER_ID)
+        service = _get_authenticated_service(ctx)
         
         # You would import this from emails_fetched.py
         # from .emails_fetched import send_email 
@@ -209,15 +235,17 @@ def send_email_execute(to: str, subject: str, body: str):
         # result = send_email(service=service, to=to, subject=subject, body=body)
         # return result
         
-        print(f"--- STUBBED: Sending email to {to} ---")
+        logger.info("--- STUBBED: Sending email to %s ---", to)
         return f"Successfully sent email to {to} with subject: {subject}"
 
+    except CircuitOpenError as e:
+        return e.to_result()
     except Exception as e:
-        print(f"Error in send_email_execute: {e}")
+        logger.error("Error in send_email_execute: %s", e)
         return f"An error occurred while sending the email: {e}"
 
 # --- Layer 3: Tool Definition (Example for send_email) ---
-send_email_tool = tool(
+SEND_EMAIL = dict(
     name="send_email",
     description="Sends a new email from the user's Gmail account.",
     parameters={
@@ -237,16 +265,33 @@ send_email_tool = tool(
             }
         },
         "required": ["to", "subject", "body"]
-    },
-    execute=send_email_execute
+    }
 )
 
 
-# export all tools
+# =================================================================
+# Binding
+# =================================================================
 
-__all__ = [
-    'get_unread_emails_tool',
-    'get_emails_from_sender_tool',
-    'search_emails_tool',
-    'send_email_tool'
+_TOOLS = [
+    (GET_UNREAD_EMAILS, get_unread_emails_execute),
+    (GET_EMAILS_FROM_SENDER, get_emails_from_sender_execute),
+    (SEARCH_EMAILS, search_emails_execute),
 ]
+
+
+def email_tools(ctx: "ToolContext", include_send: bool = False) -> list[Tool]:
+    """
+    The email tools, acting for the user in `ctx`.
+
+    Args:
+        ctx: The run's ToolContext
+        include_send: Also offer the (stubbed) send_email tool
+    """
+    tools = _TOOLS + [(SEND_EMAIL, send_email_execute)] if include_send else _TOOLS
+    return [tool(**spec, execute=ctx.bind(execute)) for spec, execute in tools]
+
+
+# export all tools
+
+__all__ = ['email_tools']
@@ -1,11 +1,23 @@
 import os
 from typing import Optional
 from pydantic import BaseModel, Field
-from firecrawl import FirecrawlApp
 from dotenv import load_dotenv
+from backend import clients, rate_limit
+from backend.log import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
+
+def _create_app(api_key: Optional[str] = None):
+    from firecrawl import FirecrawlApp
+
+    return FirecrawlApp(api_key=api_key or os.getenv("FIRECRAWL_API_KEY"))
+
+
+clients.register("firecrawl", _create_app)
+
 
 class ScrapeInput(BaseModel):
     """Input schema for scraping a webpage"""
@@ -31,8 +43,8 @@ def scrape_url(url: str, only_main_content: bool = True, api_key: Optional[str]
         return "Error: FIRECRAWL_API_KEY not set. Please set the environment variable."
     
     try:
-        # Initialize Firecrawl
-        app = FirecrawlApp(api_key=key)
+        # Shared client unless a different key was passed in
+        app = _create_app(key) if api_key else clients.get("firecrawl")
         
         # Scrape the URL
         params = {
@@ -40,9 +52,9 @@ def scrape_url(url: str, only_main_content: bool = True, api_key: Optional[str]
             "onlyMainContent": only_main_content,
         }
         
-        result = app.scrape(url, only_main_content=only_main_content, formats=["markdown"])
-        # print(f"Scrape result for {url}: {result}")
-        print(f"{url} scraped successfully.")
+        result = rate_limit.call("firecrawl", app.scrape, url, only_main_content=only_main_content, formats=["markdown"])
+        logger.debug("Scrape result for %s: %s", url, result)
+        logger.info("%s scraped successfully.", url)
         
         # Extract content
         if isinstance(result, dict):
@@ -55,4 +67,5 @@ def scrape_url(url: str, only_main_content: bool = True, api_key: Optional[str]
         return str(result)
         
     except Exception as e:
+        rate_limit.reraise_circuit_open(e)
         return f"Error scraping {url}: {str(e)}"
@@ -0,0 +1,306 @@
+"""
+Knowledge Index
+===============
+A local full-text index per user over the emails and pages the backend has
+already fetched, so questions like "when is my ML coursework due?" are
+answered from disk in milliseconds instead of another Gmail search or
+scrape.
+
+- One SQLite database per user under KNOWLEDGE_DIR (default .knowledge/),
+  with an FTS5 table (porter stemming) over title and body
+- Filled incrementally as a side effect of fetching: prefetched emails,
+  the email tools' results and scrape_webpage pages. An email is indexed
+  once; a page is re-indexed only when its content changes
+- At most KNOWLEDGE_MAX_DOCS documents per user; the least recently
+  indexed go first
+- search() ranks with BM25 (title weighted over body) and returns short
+  snippets plus the deadlines found in each document
+
+Indexing never fails the caller: errors are logged and the fetch result is
+used as before. The search_knowledge tool is bound per run like the
+calendar and email tools (knowledge_tools(ctx)).
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import TYPE_CHECKING, Optional
+
+from ai_sdk import Tool, tool
+
+from backend import metrics
+from backend.log import get_logger
+from backend.tools.deadlines import extract as extract_deadlines, from_email
+
+if TYPE_CHECKING:
+    from backend.tools.context import ToolContext
+
+logger = get_logger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(PROJECT_ROOT, ".knowledge"))
+MAX_DOCS = int(os.getenv("KNOWLEDGE_MAX_DOCS", "5000"))
+# Bodies are indexed up to this many characters
+MAX_BODY_CHARS = 20000
+
+SCHEMA = """
+create table if not exists documents (
+    rowid integer primary key,
+    doc_id text unique not null,
+    kind text not null,
+    title text,
+    source text,
+    date text,
+    content_hash text,
+    deadlines text,
+    body text,
+    indexed_at real not null
+);
+create virtual table if not exists documents_fts using fts5(
+    title, body, content='documents', content_rowid='rowid', tokenize='porter unicode61'
+);
+create trigger if not exists documents_ai after insert on documents begin
+    insert into documents_fts(rowid, title, body) values (new.rowid, new.title, new.body);
+end;
+create trigger if not exists documents_ad after delete on documents begin
+    insert into documents_fts(documents_fts, rowid, title, body) values ('delete', old.rowid, old.title, old.body);
+end;
+create trigger if not exists documents_au after update on documents begin
+    insert into documents_fts(documents_fts, rowid, title, body) values ('delete', old.rowid, old.title, old.body);
+    insert into documents_fts(rowid, title, body) values (new.rowid, new.title, new.body);
+end;
+"""
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "do", "does", "for", "from", "has", "have",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "was", "what",
+    "when", "where", "which", "who", "will", "with", "you", "your",
+}
+
+_ready: set[str] = set()
+_ready_lock = threading.Lock()
+
+
+def _path(user_id: str) -> str:
+    return os.path.join(KNOWLEDGE_DIR, re.sub(r"[^A-Za-z0-9_-]", "_", user_id) + ".sqlite3")
+
+
+def _connect(user_id: str) -> sqlite3.Connection:
+    """Connection to the user's index, creating the database on first use."""
+    path = _path(user_id)
+    if path not in _ready:
+        with _ready_lock:
+            if path not in _ready:
+                os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
+                with closing(sqlite3.connect(path)) as db:
+                    db.execute("pragma journal_mode=wal")
+                    db.executescript(SCHEMA)
+                _ready.add(path)
+    return sqlite3.connect(path, timeout=5)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()
+
+
+def _upsert(user_id: str, documents: list[dict]) -> int:
+    """Insert or refresh documents (dicts with the `documents` columns); returns how many changed."""
+    if not documents:
+        return 0
+    now = time.time()
+    changed = 0
+    with closing(_connect(user_id)) as db, db:
+        for doc in documents:
+            row = db.execute("select content_hash from documents where doc_id = ?", (doc["doc_id"],)).fetchone()
+            if row and row[0] == doc["content_hash"]:
+                continue
+            values = (doc["kind"], doc["title"], doc["source"], doc["date"], doc["content_hash"],
+                      json.dumps(doc["deadlines"]), doc["body"][:MAX_BODY_CHARS], now, doc["doc_id"])
+            if row:
+                db.execute(
+                    "update documents set kind = ?, title = ?, source = ?, date = ?, content_hash = ?, "
+                    "deadlines = ?, body = ?, indexed_at = ? where doc_id = ?",
+                    values
+                )
+            else:
+                db.execute(
+                    "insert into documents (kind, title, source, date, content_hash, deadlines, body, indexed_at, doc_id) "
+                    "values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    values
+                )
+            changed += 1
+
+        if changed:
+            db.execute(
+                "delete from documents where rowid in ("
+                "select rowid from documents order by indexed_at desc limit -1 offset ?)",
+                (MAX_DOCS,)
+            )
+    metrics.increment("knowledge_documents_indexed", changed)
+    return changed
+
+
+def index_emails(user_id: str, emails: list[dict]) -> int:
+    """Add fetched emails (email_fetcher format) to the user's index."""
+    try:
+        return _upsert(user_id, [
+            {
+                "doc_id": f"email:{email['id']}",
+                "kind": "email",
+                "title": email.get("subject", ""),
+                "source": email.get("sender", ""),
+                "date": email.get("date", ""),
+                # Gmail messages don't change; the id is enough
+                "content_hash": email["id"],
+                "deadlines": email["deadlines"] if "deadlines" in email else from_email(email),
+                "body": f"From: {email.get('sender', '')}\n{email.get('body') or email.get('snippet', '')}",
+            }
+            for email in emails if email.get("id")
+        ])
+    except Exception as e:
+        logger.warning("⚠️ Indexing %d email(s) for user %s failed: %s", len(emails), user_id, e)
+        return 0
+
+
+def index_page(user_id: str, url: str, content: str, deadlines: Optional[list] = None) -> int:
+    """Add (or refresh) a scraped page in the user's index."""
+    try:
+        title = next((line.lstrip("# ").strip() for line in content.splitlines() if line.strip()), url)
+        return _upsert(user_id, [{
+            "doc_id": f"web:{url}",
+            "kind": "web",
+            "title": title[:200],
+            "source": url,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "content_hash": _content_hash(content),
+            "deadlines": extract_deadlines(content) if deadlines is None else deadlines,
+            "body": content,
+        }])
+    except Exception as e:
+        logger.warning("⚠️ Indexing %s for user %s failed: %s", url, user_id, e)
+        return 0
+
+
+def match_query(query: str) -> str:
+    """FTS5 query for free text: every meaningful word, any of them may match (BM25 ranks)."""
+    words = [w for w in re.findall(r"\w+", query.lower()) if w not in _STOPWORDS]
+    return " OR ".join(f'"{w}"' for w in dict.fromkeys(words))
+
+
+def search(user_id: str, query: str, max_results: int = 5, kind: Optional[str] = None) -> list[dict]:
+    """
+    Search the user's index.
+
+    Args:
+        user_id: Whose index to search
+        query: Free text, e.g. "ML coursework due"
+        max_results: Most documents returned
+        kind: Only "email" or "web" documents
+
+    Returns:
+        Best matches first: {"id", "kind", "title", "source", "date",
+        "snippet", "deadlines", "score"}
+    """
+    expression = match_query(query)
+    if not expression or not os.path.exists(_path(user_id)):
+        return []
+
+    start = time.perf_counter()
+    sql = (
+        "select d.doc_id, d.kind, d.title, d.source, d.date, d.deadlines, "
+        "snippet(documents_fts, 1, '', '', '…', 24), bm25(documents_fts, 4.0, 1.0) as rank "
+        "from documents_fts join documents d on d.rowid = documents_fts.rowid "
+        "where documents_fts match ?"
+    )
+    params = [expression]
+    if kind:
+        sql += " and d.kind = ?"
+        params.append(kind)
+    sql += " order by rank limit ?"
+    params.append(max_results)
+
+    with closing(_connect(user_id)) as db:
+        rows = db.execute(sql, params).fetchall()
+    metrics.histogram("knowledge_search_seconds", time.perf_counter() - start)
+
+    return [
+        {
+            "id": doc_id.split(":", 1)[1],
+            "kind": doc_kind,
+            "title": title,
+            "source": source,
+            "date": date,
+            "snippet": snippet,
+            "deadlines": json.loads(deadlines or "[]"),
+            "score": round(-rank, 2),
+        }
+        for doc_id, doc_kind, title, source, date, deadlines, snippet, rank in rows
+    ]
+
+
+def clear(user_id: str) -> None:
+    """Delete the user's index."""
+    path = _path(user_id)
+    with _ready_lock:
+        _ready.discard(path)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+# =================================================================
+# Tool: Search Knowledge
+# =================================================================
+
+def search_knowledge_execute(ctx: "ToolContext", query: str, max_results: int = 5, kind: Optional[str] = None):
+    """AI-callable search over the emails and pages already fetched for the user."""
+    logger.info("🔎 Searching knowledge for user %s: %s", ctx.user_id, query)
+    try:
+        results = search(ctx.user_id, query, max_results=max_results, kind=kind)
+        return results or f"Nothing indexed matches '{query}'. Try search_emails or scrape_webpage."
+    except Exception as e:
+        logger.error("Error in search_knowledge_execute: %s", e)
+        return f"An error occurred while searching the knowledge index: {e}"
+
+
+SEARCH_KNOWLEDGE = dict(
+    name="search_knowledge",
+    description=(
+        "Searches the emails and web pages already fetched for the user (local index, instant). "
+        "Returns ranked snippets with any deadlines found. Try this first for questions about "
+        "past emails or pages; fall back to search_emails or scrape_webpage if nothing matches."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Keywords to search for (e.g., 'ML coursework deadline')."
+            },
+            "max_results": {
+                "type": "integer",
+                "description": "The maximum number of results to return.",
+                "default": 5
+            },
+            "kind": {
+                "type": "string",
+                "enum": ["email", "web"],
+                "description": "Only search emails or only web pages."
+            }
+        },
+        "required": ["query"]
+    }
+)
+
+
+def knowledge_tools(ctx: "ToolContext") -> list[Tool]:
+    """The knowledge tools, searching the index of the user in `ctx`."""
+    return [tool(**SEARCH_KNOWLEDGE, execute=ctx.bind(search_knowledge_execute))]
+
+
+__all__ = ['knowledge_tools']
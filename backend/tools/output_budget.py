@@ -0,0 +1,236 @@
+"""
+Tool Output Budgets
+===================
+Keeps tool results that go back to the model under a per-tool size budget.
+
+When a result is over budget it is shrunk in stages:
+1. the tool's shrink function trims each item (bodies -> snippets, drop
+   low-value fields like attendee lists)
+2. only as many items as fit are returned; the rest are parked under a
+   continuation handle the model can pass to `get_more_results`
+
+Continuations belong to the user the tool ran for (rate_limit.acting_for,
+set by ToolContext.bind) and get_more_results only finds the handles of the
+user its ToolContext acts for (more_results_tools(ctx)).
+
+Budgets are JSON bytes. Defaults can be overridden with
+TOOL_OUTPUT_BUDGET (all tools) or TOOL_OUTPUT_BUDGET_<TOOL_NAME>.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional
+
+from ai_sdk import Tool, tool
+
+from backend import metrics, rate_limit
+from backend.log import get_logger
+
+if TYPE_CHECKING:
+    from backend.tools.context import ToolContext
+
+logger = get_logger(__name__)
+
+DEFAULT_BUDGET = int(os.getenv("TOOL_OUTPUT_BUDGET", "16000"))
+
+TOOL_OUTPUT_BUDGETS = {
+    "get_unread_emails": 24000,
+    "get_emails_from_sender": 16000,
+    "search_emails": 16000,
+    "get_all_calendar_events": 24000,
+    "get_calendar_events": 12000,
+    "search_calendar_events": 12000,
+}
+
+CONTINUATION_TTL = int(os.getenv("TOOL_CONTINUATION_TTL", "900"))
+MAX_CONTINUATIONS = 256
+
+# Room left in the budget for the truncation envelope (handle, note, counts)
+ENVELOPE_BYTES = 512
+
+_continuations: "OrderedDict[tuple[Optional[str], str], dict]" = OrderedDict()  # (user_id, handle) -> entry
+_lock = threading.Lock()
+
+
+def get_budget(tool_name: str) -> int:
+    override = os.getenv(f"TOOL_OUTPUT_BUDGET_{tool_name.upper()}")
+    if override:
+        return int(override)
+    return TOOL_OUTPUT_BUDGETS.get(tool_name, DEFAULT_BUDGET)
+
+
+def json_size(value) -> int:
+    return len(json.dumps(value, default=str, ensure_ascii=False).encode("utf-8"))
+
+
+def _truncate(text: str, limit: int) -> str:
+    if not text or len(text) <= limit:
+        return text
+    return text[:limit] + "…"
+
+
+def shrink_email(email: dict) -> dict:
+    """Body becomes a snippet; routing fields the model doesn't need are dropped."""
+    return {
+        "id": email.get("id"),
+        "sender": email.get("sender"),
+        "subject": email.get("subject"),
+        "date": email.get("date"),
+        "body": _truncate(email.get("body", "") or email.get("snippet", ""), 500),
+        "is_unread": email.get("is_unread"),
+        "deadlines": email.get("deadlines", []),
+    }
+
+
+def shrink_event(event: dict) -> dict:
+    """Attendee lists become a count; descriptions get cut short."""
+    shrunk = {k: v for k, v in event.items() if k not in ("attendees", "htmlLink")}
+    if "attendees" in event:
+        shrunk["attendee_count"] = len(event.get("attendees") or [])
+    if "description" in shrunk:
+        shrunk["description"] = _truncate(shrunk["description"], 200)
+    return shrunk
+
+
+def _store(tool_name: str, items: list, shrink: Optional[Callable]) -> str:
+    handle = uuid.uuid4().hex[:12]
+    owner = rate_limit.current_user.get()
+    now = time.time()
+    with _lock:
+        # Drop expired handles, then the oldest ones if we're over capacity
+        for key in [k for k, v in _continuations.items() if v["expires"] < now]:
+            del _continuations[key]
+        while len(_continuations) >= MAX_CONTINUATIONS:
+            _continuations.popitem(last=False)
+        _continuations[(owner, handle)] = {
+            "tool": tool_name,
+            "items": items,
+            "shrink": shrink,
+            "expires": now + CONTINUATION_TTL
+        }
+    return handle
+
+
+def _take_page(items: list, shrink: Optional[Callable], budget: int, offset: int = 0) -> dict:
+    """Largest prefix of items[offset:] (shrunk) that fits the budget, at least one item."""
+    page, size = [], 0
+    for item in items[offset:]:
+        small = shrink(item) if shrink else item
+        item_size = json_size(small)
+        if page and size + item_size > budget:
+            break
+        page.append(small)
+        size += item_size
+    return {"items": page, "next_offset": offset + len(page)}
+
+
+def fit_output(tool_name: str, items: list, shrink: Optional[Callable] = None):
+    """
+    Return `items` unchanged if within the tool's budget, otherwise a bounded
+    page with a continuation handle for the rest.
+    """
+    if not isinstance(items, list):
+        return items
+
+    budget = get_budget(tool_name)
+    original = json_size(items)
+    if original <= budget:
+        return items
+
+    page = _take_page(items, shrink, budget - ENVELOPE_BYTES)
+    remaining = len(items) - page["next_offset"]
+
+    result = {
+        "items": page["items"],
+        "truncated": True,
+        "returned": len(page["items"]),
+        "total": len(items),
+    }
+    if remaining or shrink:
+        result["continuation"] = _store(tool_name, items, shrink)
+        result["next_offset"] = page["next_offset"]
+        result["note"] = (
+            "Output was shortened to fit the size budget. Call get_more_results with "
+            "this continuation (and next_offset) for more items, or with item_id for "
+            "one item in full."
+        )
+
+    returned = json_size(result)
+    metrics.increment("tool_output_truncations", tool=tool_name)
+    metrics.observe("tool_output_bytes_original", original, tool=tool_name)
+    metrics.observe("tool_output_bytes_returned", returned, tool=tool_name)
+    logger.info("✂️ %s output %d → %d bytes (%d/%d items)", tool_name, original, returned, len(page['items']), len(items))
+    return result
+
+
+def get_more_results_execute(
+    ctx: Optional["ToolContext"],
+    continuation: str,
+    offset: int = 0,
+    item_id: str = None
+):
+    """Next page of a truncated tool output, or one item from it in full; only ctx's user's handles are found."""
+    with _lock:
+        entry = _continuations.get((ctx.user_id if ctx else None, continuation))
+    if not entry or entry["expires"] < time.time():
+        return {"error": "Unknown or expired continuation handle, call the original tool again"}
+
+    budget = get_budget(entry["tool"])
+
+    if item_id is not None:
+        item = next((i for i in entry["items"] if str(i.get("id")) == str(item_id)), None)
+        if item is None:
+            return {"error": f"No item with id {item_id}"}
+        if json_size(item) > budget and "body" in item:
+            # Keep the full item but cap the body so one email can't blow the budget
+            item = {**item, "body": _truncate(item["body"], budget // 2)}
+        return item
+
+    page = _take_page(entry["items"], entry["shrink"], budget - ENVELOPE_BYTES, offset)
+    more = page["next_offset"] < len(entry["items"])
+    return {
+        "items": page["items"],
+        "next_offset": page["next_offset"] if more else None,
+        "total": len(entry["items"]),
+    }
+
+
+GET_MORE_RESULTS = dict(
+    name="get_more_results",
+    description="Fetch more of a tool result that was shortened to fit the size budget. Pass the continuation handle and next_offset for the next page, or item_id to get one item (e.g. a full email body).",
+    parameters={
+        "type": "object",
+        "properties": {
+            "continuation": {
+                "type": "string",
+                "description": "Continuation handle from the truncated tool result"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Index to continue from (next_offset from the previous result)",
+                "default": 0
+            },
+            "item_id": {
+                "type": "string",
+                "description": "ID of a single item to return in full"
+            }
+        },
+        "required": ["continuation"]
+    }
+)
+
+
+def more_results_tools(ctx: "ToolContext") -> list[Tool]:
+    """get_more_results, paging through the continuations of the user in `ctx`."""
+    return [tool(**GET_MORE_RESULTS, execute=ctx.bind(get_more_results_execute))]
+
+
+# For runs without a user: only sees continuations made outside any user's run
+get_more_results_tool = tool(
+    **GET_MORE_RESULTS,
+    execute=lambda **kwargs: get_more_results_execute(None, **kwargs)
+)
@@ -0,0 +1,151 @@
+"""
+Per-User Execution Lease
+========================
+Only one agent run may work on a user's calendar at a time. Chat turns,
+task creation and scheduled runs all take the user's lease first:
+
+    with user_lease(user_id):
+        ...run the agent...
+
+A second caller for the same user waits (queues) behind the holder. Scheduled
+task runs are coalesced instead: if a task run for the user is already active
+or queued, new due tasks are handed to it and the caller returns right away
+(see submit_tasks).
+
+The in-process lease covers a single server. With USER_LEASE_BACKEND=supabase
+the lease is also taken in the user_leases table (migrations/003_user_leases.sql)
+with a TTL, so separate processes don't overlap either; a crashed holder's
+lease just expires.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable
+
+import backend.database.supabase_db as sb
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+LEASE_BACKEND = os.getenv("USER_LEASE_BACKEND", "local")
+LEASE_TTL = int(os.getenv("USER_LEASE_TTL", "900"))
+LEASE_WAIT = float(os.getenv("USER_LEASE_WAIT", "60"))
+LEASE_POLL = 1.0
+
+# Identifies this process as a lease holder in the user_leases table
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class UserBusyError(Exception):
+    """Raised when the user's lease couldn't be acquired in time."""
+
+
+_cond = threading.Condition()
+_held: set[str] = set()
+_pending_tasks: dict[str, dict] = {}   # user_id -> {task_id: task}
+_draining: set[str] = set()            # users with an active task runner
+
+
+def _acquire_remote(user_id: str, deadline: float) -> bool:
+    while True:
+        try:
+            if sb.acquire_user_lease(user_id, HOLDER, LEASE_TTL):
+                return True
+        except Exception as e:
+            # Don't block all agent work on the lease table being unavailable
+            logger.warning("⚠️ Lease table unavailable, using in-process lease only: %s", e)
+            return True
+        if time.monotonic() + LEASE_POLL > deadline:
+            return False
+        time.sleep(LEASE_POLL)
+
+
+def _release_remote(user_id: str):
+    try:
+        sb.release_user_lease(user_id, HOLDER)
+    except Exception as e:
+        logger.warning("⚠️ Failed to release lease for user %s, it will expire: %s", user_id, e)
+
+
+@contextmanager
+def user_lease(user_id: str, timeout: float = LEASE_WAIT):
+    """
+    Hold the user's execution lease for the duration of the block.
+
+    Yields True if the caller had to wait for another run first (so anything
+    loaded beforehand, like the calendar, may be stale). Raises UserBusyError
+    after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    waited = False
+    with _cond:
+        while user_id in _held:
+            waited = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise UserBusyError(f"Another run for user {user_id} is still in progress")
+            _cond.wait(timeout=remaining)
+        _held.add(user_id)
+
+    try:
+        if LEASE_BACKEND == "supabase":
+            started = time.monotonic()
+            if not _acquire_remote(user_id, deadline):
+                raise UserBusyError(f"User {user_id} is leased by another server")
+            waited = waited or time.monotonic() - started > LEASE_POLL / 2
+    except BaseException:
+        with _cond:
+            _held.discard(user_id)
+            _cond.notify_all()
+        raise
+
+    try:
+        yield waited
+    finally:
+        if LEASE_BACKEND == "supabase":
+            _release_remote(user_id)
+        with _cond:
+            _held.discard(user_id)
+            _cond.notify_all()
+
+
+def submit_tasks(user_id: str, tasks: list[dict], run: Callable[[list[dict], bool], None]) -> bool:
+    """
+    Run a user's due tasks under their lease, coalescing with any task run
+    already active for them.
+
+    `run(tasks, waited)` is called with the lease held, once per batch; tasks
+    submitted while it runs are batched into one follow-up run. A batch that
+    raises is logged and left due, and draining goes on, since callers that
+    handed tasks to this runner have already returned. Returns False if the
+    tasks were handed to an already active runner.
+    """
+    with _cond:
+        _pending_tasks.setdefault(user_id, {}).update({task["id"]: task for task in tasks})
+        if user_id in _draining:
+            return False
+        _draining.add(user_id)
+
+    try:
+        while True:
+            with _cond:
+                batch = list(_pending_tasks.pop(user_id, {}).values())
+                if not batch:
+                    _draining.discard(user_id)
+                    return True
+            try:
+                with user_lease(user_id) as waited:
+                    run(batch, waited)
+            except UserBusyError as e:
+                # Leave them due; the next tick picks them up
+                logger.info("⏳ Skipping %d task(s): %s", len(batch), e)
+            except Exception as e:
+                logger.exception("❌ Task run of %d task(s) for user %s failed: %s", len(batch), user_id, e)
+    except BaseException:
+        with _cond:
+            _draining.discard(user_id)
+        raise
@@ -176,6 +176,70 @@ export async function chatWithAgent(message: string): Promise<AgentResponse> {
   }
 }
 
+export type AgentStreamEvent =
+  | { event: 'classification'; data: AgentResponse }
+  | { event: 'tool_call_start'; data: { tool: string; args: Record<string, any> } }
+  | { event: 'tool_call_finish'; data: { tool: string; duration_ms: number; is_error: boolean; error?: string } }
+  // One per model step with that step's full text (not token deltas)
+  | { event: 'text'; data: { step: number; text: string } }
+  | { event: 'final'; data: AgentResponse }
+  | { event: 'error'; data: { detail: string } }
+
+export async function streamChatWithAgent(
+  message: string,
+  onEvent: (event: AgentStreamEvent) => void
+): Promise<AgentResponse> {
+  const headers = await getAuthHeaders()
+
+  const response = await fetch(`${API_BASE_URL}/api/agent/chat/stream`, {
+    method: 'POST',
+    headers: { ...headers, 'Accept': 'text/event-stream' },
+    body: JSON.stringify({ message } as ChatRequest)
+  })
+
+  if (!response.ok || !response.body) {
+    const errorText = await response.text()
+    throw new Error(`Failed to chat with agent: ${response.statusText} - ${errorText}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let final: AgentResponse | null = null
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // SSE frames are separated by a blank line
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+
+      let event = 'message'
+      let data = ''
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      if (!data) continue
+
+      const parsed = { event, data: JSON.parse(data) } as AgentStreamEvent
+      onEvent(parsed)
+      if (parsed.event === 'final') final = parsed.data
+      if (parsed.event === 'error') throw new Error(parsed.data.detail)
+    }
+  }
+
+  if (!final) {
+    throw new Error('Agent stream ended without a final response')
+  }
+  return final
+}
+
 export interface TaskCreateRequest {
   title: string
   type: 'EMAIL' | 'WEB' | 'TODO'
@@ -217,6 +281,32 @@ export async function createTask(task: TaskCreateRequest): Promise<boolean> {
   }
 }
 
+export async function createTasks(tasks: TaskCreateRequest[]): Promise<number[]> {
+  try {
+    console.log('🌐 [API] createTasks called with', tasks.length, 'tasks')
+
+    const headers = await getAuthHeaders()
+    const response = await fetch(`${API_BASE_URL}/api/tasks/bulk`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(tasks)
+    })
+
+    if (!response.ok) {
+      const errorText = await response.text()
+      console.error('❌ [API] Bulk task creation error response:', errorText)
+      throw new Error(`Failed to create tasks: ${response.statusText} - ${errorText}`)
+    }
+
+    const data = await response.json()
+    console.log('✅ [API] Tasks created successfully:', data.ids)
+    return data.ids
+  } catch (error) {
+    console.error('❌ [API] Error in createTasks:', error)
+    throw error
+  }
+}
+
 export interface TaskResponse {
   id_: number
   type: 'EMAIL' | 'WEB' | 'TODO'